@@ -4,17 +4,43 @@ A comprehensive platform connecting clients with local home cooks and profession
 """
 
 import os
+import time
+import re
+import uuid
+import secrets
+from decimal import Decimal, ROUND_HALF_UP
+from collections import Counter, OrderedDict, namedtuple
+import smtplib
+import hmac
+import importlib.util
+import csv
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+import click
+from flask import Flask, Response, stream_with_context, abort, g, render_template, request, redirect, url_for, flash, jsonify, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
+from flask_mail import Mail, Message as MailMessage
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, TextAreaField, SelectField, IntegerField, DecimalField, DateField, TimeField, PasswordField, BooleanField, SubmitField
+from wtforms import StringField, TextAreaField, SelectField, SelectMultipleField, IntegerField, DecimalField, DateField, TimeField, PasswordField, BooleanField, HiddenField, SubmitField
 from wtforms.validators import DataRequired, Email, Length, NumberRange, Optional, ValidationError
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import PasswordHasher, PasswordHasherBusy
+from replicas import ReplicaPool, RoutingSession
+from storage import LocalStorage, StorageError, create_storage
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.datastructures import CallbackDict
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from PIL import Image
+import requests
 import stripe
 import json
 from functools import wraps
@@ -26,11 +52,91 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///chef_marketplace.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Comma-separated read replica URLs; read-only pages query them when set
+app.config['DATABASE_REPLICA_URLS'] = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+app.config['REPLICA_HEALTH_CHECK_SECONDS'] = int(os.environ.get('REPLICA_HEALTH_CHECK_SECONDS', 5))
+app.config['REPLICA_RETRY_SECONDS'] = int(os.environ.get('REPLICA_RETRY_SECONDS', 30))  # Skip a failed replica this long
+app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.environ['REPLICA_MAX_LAG_SECONDS']) if os.environ.get('REPLICA_MAX_LAG_SECONDS') else None  # PostgreSQL only
+app.config['REPLICA_STICKY_SECONDS'] = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))  # Keep a client on the primary after it writes
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
+# Where uploaded photos live: file://<folder> or s3://bucket/prefix (see storage.py)
+app.config['STORAGE_URL'] = os.environ.get('STORAGE_URL') or f"file://{app.config['UPLOAD_FOLDER']}"
+app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL', 'https://s3.amazonaws.com')  # Or MinIO/R2
+app.config['S3_REGION'] = os.environ.get('S3_REGION', 'us-east-1')
+app.config['S3_ACCESS_KEY_ID'] = os.environ.get('S3_ACCESS_KEY_ID')
+app.config['S3_SECRET_ACCESS_KEY'] = os.environ.get('S3_SECRET_ACCESS_KEY')
+app.config['STORAGE_PUBLIC_URL'] = os.environ.get('STORAGE_PUBLIC_URL')  # CDN or public bucket URL for photo links
+# Browsers upload photos straight to storage; defaults on for S3, where it bypasses the app servers
+app.config['DIRECT_UPLOADS'] = os.environ.get('DIRECT_UPLOADS', str(app.config['STORAGE_URL'].startswith('s3://'))).lower() in ['true', 'on', '1']
+app.config['DIRECT_UPLOAD_EXPIRES_SECONDS'] = 900  # Lifetime of a signed browser upload
+# cookie:// keeps the session in the signed cookie; database:// or redis://... keeps it server-side
+app.config['SESSION_STORAGE_URL'] = os.environ.get('SESSION_STORAGE_URL', 'cookie://')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MESSAGES_PER_PAGE'] = 20
+app.config['DASHBOARD_PAGE_SIZE'] = 12  # Bookings per dashboard list page
+app.config['PLATFORM_FEE_PERCENTAGE'] = Decimal(os.environ.get('PLATFORM_FEE_PERCENTAGE') or 15)
+app.config['SERVICE_FEE_PERCENTAGE'] = Decimal(os.environ.get('SERVICE_FEE_PERCENTAGE') or 10)
+app.config['QUOTE_CACHE_SIZE'] = 10000
+app.config['MENU_CATALOG_CACHE_SIZE'] = 2000  # Chefs whose assembled menus are kept per worker
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT') or 587)
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER') or 'noreply@chefmarketplace.com'
+app.config['MAIL_SUPPRESS_SEND'] = not app.config['MAIL_SERVER']  # No SMTP configured: log instead of sending
+app.config['MAIL_MAX_EMAILS'] = 50  # Messages per SMTP connection before reconnecting
+app.config['EMAIL_BATCH_SIZE'] = 50
+app.config['EMAIL_MAX_ATTEMPTS'] = 6
+app.config['EMAIL_RETRY_BASE_SECONDS'] = 60
+app.config['EVENT_BUS_URL'] = os.environ.get('EVENT_BUS_URL', 'memory://')
+app.config['EVENT_STREAM_HEARTBEAT_SECONDS'] = 15
+app.config['EVENT_STREAM_MAX_SECONDS'] = int(os.environ.get('EVENT_STREAM_MAX_SECONDS', 300))
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+app.config['RATELIMIT_STORAGE_URL'] = os.environ.get('RATELIMIT_STORAGE_URL') or os.environ.get('REDIS_URL') or 'memory://'
+app.config['RATELIMITS'] = {
+    'global': os.environ.get('RATELIMIT_DEFAULT', '600/minute'),  # Per IP, every route
+    'login_ip': '20/minute',
+    'login_account': '5/minute',  # Per email address, from any IP
+    'register_ip': '5/minute',
+    'booking_user': '10/minute',
+    'message_user': '30/minute',
+    'payment_user': '10/minute',
+    'review_user': '10/minute',
+    'upload_user': '30/minute',
+}
+app.config['PASSWORD_HASH_ALGORITHM'] = os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt')  # pbkdf2, scrypt, bcrypt
+app.config['PASSWORD_HASH_COST'] = int(os.environ.get('PASSWORD_HASH_COST') or
+                                       {'pbkdf2': 600000, 'scrypt': 32768, 'bcrypt': 12}[app.config['PASSWORD_HASH_ALGORITHM']])
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS') or min(2, os.cpu_count() or 1))  # 0 hashes on the request thread
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))  # Per worker process
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Bearer token for /metrics scrapers
+app.config['MIGRATE_TOKEN'] = os.environ.get('MIGRATE_TOKEN')  # Bearer token for /migrate-db from deploy scripts
+app.config['READINESS_CACHE_SECONDS'] = float(os.environ.get('READINESS_CACHE_SECONDS', 5))  # Reuse the /readyz database check
+app.config['READINESS_TIMEOUT_SECONDS'] = float(os.environ.get('READINESS_TIMEOUT_SECONDS', 2))  # Not ready if SELECT 1 takes longer
+app.config['DEBUG_DB_CACHE_SECONDS'] = int(os.environ.get('DEBUG_DB_CACHE_SECONDS', 60))  # Reuse the /admin/debug-db report
+app.config['TRUSTED_PROXY_COUNT'] = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))  # Proxies setting X-Forwarded-For
+
+# Client IPs (for rate limits) come from X-Forwarded-For only when behind known proxies
+if app.config['TRUSTED_PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'], x_proto=app.config['TRUSTED_PROXY_COUNT'])
 
 # Initialize extensions
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+RoutingSession.replicas = ReplicaPool(
+    app.config['DATABASE_REPLICA_URLS'],
+    engine_options=app.config.get('SQLALCHEMY_ENGINE_OPTIONS'),
+    health_check_seconds=app.config['REPLICA_HEALTH_CHECK_SECONDS'],
+    retry_seconds=app.config['REPLICA_RETRY_SECONDS'],
+    max_lag_seconds=app.config['REPLICA_MAX_LAG_SECONDS']
+)
+password_hasher = PasswordHasher(
+    algorithm=app.config['PASSWORD_HASH_ALGORITHM'],
+    cost=app.config['PASSWORD_HASH_COST'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING']
+)
+mail = Mail(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -38,11 +144,35 @@ login_manager.login_message = 'Please log in to access this page.'
 
 # Configure Stripe
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_your_stripe_key')
+stripe.api_base = os.environ.get('STRIPE_API_BASE', stripe.api_base)  # Point at mock_stripe.py locally
+stripe.max_network_retries = 2  # Safe: every POST carries an idempotency key
+app.config['STRIPE_PUBLISHABLE_KEY'] = os.environ.get('STRIPE_PUBLISHABLE_KEY')
+app.config['STRIPE_WEBHOOK_SECRET'] = os.environ.get('STRIPE_WEBHOOK_SECRET')
+app.config['STRIPE_TIMEOUT_SECONDS'] = int(os.environ.get('STRIPE_TIMEOUT_SECONDS') or 10)
+
+def create_stripe_http_client(timeout, pool_size=10):
+    """Stripe client sharing one pooled keep-alive session, with a hard timeout"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return stripe.http_client.RequestsClient(timeout=timeout, session=session)
+
+stripe.default_http_client = create_stripe_http_client(app.config['STRIPE_TIMEOUT_SECONDS'])
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profiles'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'menus'), exist_ok=True)
+# Upload storage; photos are stored under "<folder>/<filename>" keys
+UPLOAD_FOLDERS = ('profiles', 'menus')
+upload_storage = create_storage(
+    app.config['STORAGE_URL'],
+    endpoint_url=app.config['S3_ENDPOINT_URL'],
+    region=app.config['S3_REGION'],
+    access_key=app.config['S3_ACCESS_KEY_ID'],
+    secret_key=app.config['S3_SECRET_ACCESS_KEY'],
+    public_url=app.config['STORAGE_PUBLIC_URL']
+)
+if isinstance(upload_storage, LocalStorage):
+    for folder in UPLOAD_FOLDERS:
+        os.makedirs(os.path.join(upload_storage.root, folder), exist_ok=True)
 
 # User loader for Flask-Login
 @login_manager.user_loader
@@ -50,10 +180,23 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 # Database Models
+# List-valued columns (specialties, service areas, dietary tags...) hold JSON
+# arrays of strings: JSONB on PostgreSQL, where GIN indexes serve containment
+# filters, and JSON1 text on SQLite. Validators accept a list, a JSON array or
+# comma-separated text, so form input and old callers are stored the same way.
+JSONList = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+def json_list_contains(column, value):
+    """Filter for rows whose JSON list column has value as an element"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.type_coerce(column, JSONB).contains([value])  # @>, served by the GIN index
+    elements = db.func.json_each(column).table_valued('value')
+    return db.exists().select_from(elements).where(elements.c.value == value)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))  # scrypt hashes are ~160 characters
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     phone = db.Column(db.String(20))
@@ -61,6 +204,7 @@ class User(UserMixin, db.Model):
     is_verified = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
+    unread_messages = db.Column(db.Integer, default=0, nullable=False)  # Denormalized, kept in step by send/mark-read
     
     # Relationships
     chef_profile = db.relationship('ChefProfile', backref='user', uselist=False, cascade='all, delete-orphan')
@@ -70,10 +214,10 @@ class User(UserMixin, db.Model):
     reviews_received = db.relationship('Review', foreign_keys='Review.chef_id', backref='chef_reviewed')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
     
     def is_chef(self):
         return self.role == 'chef'
@@ -85,11 +229,11 @@ class ChefProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     bio = db.Column(db.Text)
-    specialties = db.Column(db.Text)  # JSON string of specialties
-    cuisine_types = db.Column(db.Text)  # JSON string of cuisine types (Persian, Indian, Chinese, Italian, etc.)
+    specialties = db.Column(JSONList, default=list)
+    cuisine_types = db.Column(JSONList, default=list)  # CUISINE_CHOICES values (persian, indian, chinese, ...)
     experience_years = db.Column(db.Integer)
-    certifications = db.Column(db.Text)  # JSON string of certifications
-    service_areas = db.Column(db.Text)  # JSON string of service areas
+    certifications = db.Column(JSONList, default=list)
+    service_areas = db.Column(JSONList, default=list)
     base_price_per_person = db.Column(db.Numeric(10, 2))
     teaching_price_per_person = db.Column(db.Numeric(10, 2))  # Additional price for teaching
     min_guests = db.Column(db.Integer, default=2)
@@ -102,15 +246,30 @@ class ChefProfile(db.Model):
     teaching_experience = db.Column(db.Text)  # Description of teaching experience
     rating = db.Column(db.Numeric(3, 2), default=0)
     total_reviews = db.Column(db.Integer, default=0)
+    ranking_score = db.Column(db.Float, default=0, nullable=False)  # "Best match" order; see update_ranking_scores()
     response_time_hours = db.Column(db.Integer, default=24)
+    pricing_version = db.Column(db.Integer, default=1, nullable=False)  # Bumped on any price change; keys the quote cache
+    menu_version = db.Column(db.Integer, default=1, nullable=False)  # Bumped on any menu edit; keys the menu catalog cache
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     menus = db.relationship('Menu', backref='chef', cascade='all, delete-orphan')
     availability = db.relationship('ChefAvailability', backref='chef', cascade='all, delete-orphan')
+    
+    @db.validates('specialties', 'certifications')
+    def _validate_list(self, key, value):
+        return string_list(value)
+    
+    @db.validates('cuisine_types', 'service_areas')
+    def _validate_lowercase_list(self, key, value):
+        return string_list(value, lower=True)  # Browse filters match whole lowercase elements
 
 class Menu(db.Model):
+    __table_args__ = (
+        db.Index('ix_menu_chef_id', 'chef_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     chef_id = db.Column(db.Integer, db.ForeignKey('chef_profile.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -118,16 +277,40 @@ class Menu(db.Model):
     price_per_person = db.Column(db.Numeric(10, 2))
     course_count = db.Column(db.Integer, default=3)
     prep_time_hours = db.Column(db.Integer, default=2)
-    dietary_tags = db.Column(db.Text)  # JSON string of dietary tags
-    ingredients = db.Column(db.Text)  # JSON string of ingredients
+    dietary_tags = db.Column(JSONList, default=list)  # DIETARY_CHOICES values, plus any older free-form tags
+    dietary_mask = db.Column(db.Integer, default=0, nullable=False)  # Bits of dietary_tags; set by the validator
+    ingredients = db.Column(JSONList, default=list)  # Indexed by term in MenuIngredient
     is_featured = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    menu_items = db.relationship('MenuItem', backref='menu', cascade='all, delete-orphan')
+    menu_items = db.relationship('MenuItem', backref='menu', cascade='all, delete-orphan', order_by='MenuItem.order')
     menu_photos = db.relationship('MenuPhoto', backref='menu', cascade='all, delete-orphan')
+    
+    @db.validates('dietary_tags')
+    def _validate_dietary_tags(self, key, value):
+        tags = normalize_dietary_tags(value)
+        self.dietary_mask = dietary_mask(tags)
+        return tags
+    
+    @db.validates('ingredients')
+    def _validate_list(self, key, value):
+        return string_list(value)
+
+class MenuIngredient(db.Model):
+    """Inverted index from ingredient terms to menus; maintained on flush, see ingredient_terms()"""
+    __table_args__ = (
+        db.Index('ix_menu_ingredient_menu_id', 'menu_id'),
+    )
+    
+    term = db.Column(db.String(50), primary_key=True)
+    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id', ondelete='CASCADE'), primary_key=True)
 
 class MenuItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_menu_item_menu_id_order', 'menu_id', 'order'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
     course_type = db.Column(db.String(50), nullable=False)  # appetizer, main, dessert, etc.
@@ -136,6 +319,10 @@ class MenuItem(db.Model):
     order = db.Column(db.Integer, default=0)
 
 class MenuPhoto(db.Model):
+    __table_args__ = (
+        db.Index('ix_menu_photo_menu_id', 'menu_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
     photo_url = db.Column(db.String(200), nullable=False)
@@ -153,10 +340,17 @@ class ChefAvailability(db.Model):
     current_bookings = db.Column(db.Integer, default=0)
 
 class Booking(db.Model):
+    __table_args__ = (
+        db.Index('ix_booking_chef_id_event_date', 'chef_id', 'event_date'),  # Slot recounts and chef schedules
+        db.Index('ix_booking_chef_id_status_event_date', 'chef_id', 'status', 'event_date'),  # Chef dashboard lists and counts
+        db.Index('ix_booking_client_id_status_event_date', 'client_id', 'status', 'event_date'),  # Client dashboard lists and counts
+        db.Index('uq_booking_client_id_idempotency_key', 'client_id', 'idempotency_key', unique=True),  # One booking per form submission
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     chef_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
+    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'))  # None: the chef's base price and menu
     event_date = db.Column(db.Date, nullable=False)
     event_time = db.Column(db.Time, nullable=False)
     duration_hours = db.Column(db.Integer, default=3)
@@ -170,9 +364,10 @@ class Booking(db.Model):
     total_price = db.Column(db.Numeric(10, 2), nullable=False)
     service_fee = db.Column(db.Numeric(10, 2), nullable=False)
     platform_fee = db.Column(db.Numeric(10, 2), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, confirmed, completed, cancelled
-    payment_status = db.Column(db.String(20), default='pending')  # pending, paid, refunded
+    status = db.Column(db.String(20), default='pending')  # pending, confirmed, completed, cancelled, expired (see BOOKING_TRANSITIONS)
+    payment_status = db.Column(db.String(20), default='pending')  # pending, paid, failed, refunded (see PAYMENT_TRANSITIONS)
     stripe_payment_intent_id = db.Column(db.String(200))
+    idempotency_key = db.Column(db.String(64))  # From BookingForm; a resubmitted form finds this booking instead of making another
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -181,6 +376,10 @@ class Booking(db.Model):
     messages = db.relationship('Message', backref='booking', cascade='all, delete-orphan')
 
 class Message(db.Model):
+    __table_args__ = (
+        db.Index('ix_message_booking_id_id', 'booking_id', 'id'),  # Keyset pagination per thread
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -192,6 +391,10 @@ class Message(db.Model):
     sender = db.relationship('User', backref='messages_sent')
 
 class Review(db.Model):
+    __table_args__ = (
+        db.Index('uq_review_booking_id', 'booking_id', unique=True),  # One review per booking
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     chef_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -203,14 +406,150 @@ class Review(db.Model):
     communication = db.Column(db.Integer, nullable=False)  # 1-5 stars
     value_for_money = db.Column(db.Integer, nullable=False)  # 1-5 stars
     comment = db.Column(db.Text)
-    photos = db.Column(db.Text)  # JSON string of photo URLs
+    photos = db.Column(JSONList, default=list)  # Photo URLs
     is_verified = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     booking = db.relationship('Booking', backref='review')
+    
+    @db.validates('photos')
+    def _validate_photos(self, key, value):
+        return string_list(value)
+
+class EmailOutbox(db.Model):
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    to_address = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    template = db.Column(db.String(100), nullable=False)  # templates/emails/<template>.txt and .html
+    context = db.Column(db.Text)  # JSON string of template variables
+    status = db.Column(db.String(20), default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+class StripeEvent(db.Model):
+    id = db.Column(db.String(255), primary_key=True)  # Stripe event id; redeliveries collide here
+    type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # Verified raw JSON body
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, processed, failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+class BookingRollup(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('day', 'dimension', 'dimension_value', name='uq_booking_rollup_day_dimension'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # Day the bookings were requested
+    dimension = db.Column(db.String(20), nullable=False)  # all, cuisine, occasion, chef (see ROLLUP_DIMENSIONS)
+    dimension_value = db.Column(db.String(100), nullable=False, default='')  # '' for all, chef user id for chef
+    bookings = db.Column(db.Integer, default=0)
+    confirmed_bookings = db.Column(db.Integer, default=0)  # confirmed or completed
+    gmv = db.Column(db.Numeric(12, 2), default=0)
+    platform_fee = db.Column(db.Numeric(12, 2), default=0)
+    service_fee = db.Column(db.Numeric(12, 2), default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ServerSession(db.Model):
+    id = db.Column(db.String(64), primary_key=True)  # Random id; the only thing kept in the cookie
+    data = db.Column(db.Text, nullable=False)  # TaggedJSONSerializer payload
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class JobState(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    last_run_at = db.Column(db.DateTime)  # Watermark for incremental jobs
+
+class SchemaMigration(db.Model):
+    """One row per SCHEMA_VERSION the database has been migrated to"""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class ChefCard(db.Model):
+    """Denormalized browse card, one row per chef profile; maintained by refresh_chef_cards()"""
+    __table_args__ = (
+        db.Index('ix_chef_card_available_rating', 'is_available', 'rating'),
+        db.Index('ix_chef_card_available_ranking', 'is_available', 'ranking_score'),
+        db.Index('ix_chef_card_available_price', 'is_available', 'base_price_per_person'),
+        db.Index('ix_chef_card_available_created_at', 'is_available', 'created_at'),
+        db.Index('ix_chef_card_user_id', 'user_id'),
+        db.Index('ix_chef_card_cuisine_types', 'cuisine_types', postgresql_using='gin').ddl_if(dialect='postgresql'),
+        db.Index('ix_chef_card_service_areas', 'service_areas', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Same as ChefProfile.id
+    user_id = db.Column(db.Integer, nullable=False)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    bio_excerpt = db.Column(db.String(200), nullable=False, default='')
+    profile_photo = db.Column(db.String(200))
+    specialties = db.Column(JSONList, nullable=False, default=list)
+    cuisine_types = db.Column(JSONList, nullable=False, default=list)
+    service_areas = db.Column(JSONList, nullable=False, default=list)
+    base_price_per_person = db.Column(db.Numeric(10, 2))
+    teaching_price_per_person = db.Column(db.Numeric(10, 2))
+    travel_fee = db.Column(db.Numeric(10, 2))
+    pricing_version = db.Column(db.Integer, nullable=False, default=1)  # Lets quote_prices() take cards directly
+    min_guests = db.Column(db.Integer)
+    max_guests = db.Column(db.Integer)
+    rating = db.Column(db.Numeric(3, 2), nullable=False, default=0)
+    total_reviews = db.Column(db.Integer, nullable=False, default=0)
+    ranking_score = db.Column(db.Float, nullable=False, default=0)
+    offers_teaching = db.Column(db.Boolean, nullable=False, default=False)
+    is_available = db.Column(db.Boolean, nullable=False, default=True)
+    menu_count = db.Column(db.Integer, nullable=False, default=0)
+    min_menu_price = db.Column(db.Numeric(10, 2))
+    dietary_mask = db.Column(db.Integer, nullable=False, default=0)  # OR of the chef's Menu.dietary_mask
+    created_at = db.Column(db.DateTime)  # Profile creation time, for "newest" sorting
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+class ChefRecommendation(db.Model):
+    """One ranked chef for a subject ("client:<user id>" or "cuisine:<name>"); rebuilt by rebuild_recommendations()"""
+    subject = db.Column(db.String(60), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 1 is the best match
+    chef_id = db.Column(db.Integer, nullable=False)  # ChefProfile.id, the same as ChefCard.id
+    score = db.Column(db.Float, nullable=False)
 
 # Forms
+CUISINE_CHOICES = [
+    ('persian', 'Persian'),
+    ('indian', 'Indian'),
+    ('chinese', 'Chinese'),
+    ('italian', 'Italian'),
+    ('french', 'French'),
+    ('mexican', 'Mexican'),
+    ('japanese', 'Japanese'),
+    ('thai', 'Thai'),
+    ('mediterranean', 'Mediterranean'),
+    ('american', 'American'),
+    ('other', 'Other')
+]
+
+# Menu dietary tags; a tag's position is its bit in Menu.dietary_mask, so only append
+DIETARY_CHOICES = [
+    ('vegetarian', 'Vegetarian'),
+    ('vegan', 'Vegan'),
+    ('pescatarian', 'Pescatarian'),
+    ('gluten-free', 'Gluten-Free'),
+    ('dairy-free', 'Dairy-Free'),
+    ('nut-free', 'Nut-Free'),
+    ('egg-free', 'Egg-Free'),
+    ('shellfish-free', 'Shellfish-Free'),
+    ('halal', 'Halal'),
+    ('kosher', 'Kosher'),
+    ('keto', 'Keto'),
+    ('low-carb', 'Low-Carb')
+]
+
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired()])
@@ -245,19 +584,7 @@ class RegistrationForm(FlaskForm):
 class ChefProfileForm(FlaskForm):
     bio = TextAreaField('Bio', validators=[DataRequired(), Length(min=50, max=1000)])
     specialties = StringField('Specialties (comma-separated)', validators=[DataRequired()])
-    cuisine_types = SelectField('Cuisine Types', choices=[
-        ('persian', 'Persian'),
-        ('indian', 'Indian'),
-        ('chinese', 'Chinese'),
-        ('italian', 'Italian'),
-        ('french', 'French'),
-        ('mexican', 'Mexican'),
-        ('japanese', 'Japanese'),
-        ('thai', 'Thai'),
-        ('mediterranean', 'Mediterranean'),
-        ('american', 'American'),
-        ('other', 'Other')
-    ], validators=[DataRequired()], multiple=True)
+    cuisine_types = SelectMultipleField('Cuisine Types', choices=CUISINE_CHOICES, validators=[DataRequired()])
     experience_years = IntegerField('Years of Experience', validators=[DataRequired(), NumberRange(min=1, max=50)])
     certifications = StringField('Certifications (comma-separated)', validators=[Optional()])
     service_areas = StringField('Service Areas (comma-separated)', validators=[DataRequired()])
@@ -269,32 +596,59 @@ class ChefProfileForm(FlaskForm):
     offers_teaching = BooleanField('Offer Cooking Lessons', default=True)
     teaching_experience = TextAreaField('Teaching Experience', validators=[Optional(), Length(max=500)])
     profile_photo = FileField('Profile Photo', validators=[FileAllowed(['jpg', 'png', 'jpeg'], 'Images only!')])
+    profile_photo_upload = HiddenField()  # Token from /uploads/sign when the browser uploaded directly
     cover_photo = FileField('Cover Photo', validators=[FileAllowed(['jpg', 'png', 'jpeg'], 'Images only!')])
+    cover_photo_upload = HiddenField()
     submit = SubmitField('Update Profile')
 
+class MenuForm(FlaskForm):
+    name = StringField('Menu Name', validators=[DataRequired(), Length(max=100)])
+    description = TextAreaField('Description', validators=[Optional(), Length(max=1000)])
+    price_per_person = DecimalField('Price per Person ($)', validators=[DataRequired(), NumberRange(min=10, max=1000)])
+    course_count = IntegerField('Number of Courses', default=3, validators=[DataRequired(), NumberRange(min=1, max=12)])
+    prep_time_hours = IntegerField('Prep Time (hours)', default=2, validators=[DataRequired(), NumberRange(min=1, max=48)])
+    dietary_tags = SelectMultipleField('Dietary Tags', choices=DIETARY_CHOICES, validators=[Optional()])
+    ingredients = TextAreaField('Ingredients (comma-separated)', validators=[Optional(), Length(max=2000)])
+    is_featured = BooleanField('Feature this menu on my profile')
+    submit = SubmitField('Save Menu')
+
+class MenuItemForm(FlaskForm):
+    course_type = SelectField('Course', choices=[
+        ('appetizer', 'Appetizer'),
+        ('soup', 'Soup'),
+        ('salad', 'Salad'),
+        ('main', 'Main'),
+        ('side', 'Side'),
+        ('dessert', 'Dessert'),
+        ('drink', 'Drink')
+    ], validators=[DataRequired()])
+    name = StringField('Dish Name', validators=[DataRequired(), Length(max=100)])
+    description = TextAreaField('Description', validators=[Optional(), Length(max=500)])
+    order = IntegerField('Position', default=0, validators=[Optional(), NumberRange(min=0, max=100)])
+    submit = SubmitField('Add Dish')
+
+class MenuPhotoForm(FlaskForm):
+    photo = FileField('Photo', validators=[FileAllowed(['jpg', 'png', 'jpeg'], 'Images only!')])
+    photo_upload = HiddenField()  # Token from /uploads/sign when the browser uploaded directly
+    caption = StringField('Caption', validators=[Optional(), Length(max=200)])
+    is_primary = BooleanField('Use as the menu\'s cover photo')
+    submit = SubmitField('Upload Photo')
+    
+    def validate_photo(self, field):
+        if not field.data and not self.photo_upload.data:
+            raise ValidationError('Please choose a photo')
+
 class BookingForm(FlaskForm):
     event_date = DateField('Event Date', validators=[DataRequired()])
     event_time = TimeField('Event Time', validators=[DataRequired()])
     guest_count = IntegerField('Number of Guests', validators=[DataRequired(), NumberRange(min=1, max=50)])
+    menu_id = SelectField('Menu', coerce=int, choices=[(0, "Chef's choice")], default=0, validators=[Optional()])  # Chef's menus added per request
     location_address = TextAreaField('Event Location', validators=[DataRequired(), Length(min=10, max=500)])
     service_type = SelectField('Service Type', choices=[
         ('cooking_only', 'Chef Cooks for You'),
         ('cooking_and_teaching', 'Chef Cooks & Teaches You')
     ], validators=[DataRequired()])
-    cuisine_preference = SelectField('Cuisine Preference', choices=[
-        ('', 'Any Cuisine'),
-        ('persian', 'Persian'),
-        ('indian', 'Indian'),
-        ('chinese', 'Chinese'),
-        ('italian', 'Italian'),
-        ('french', 'French'),
-        ('mexican', 'Mexican'),
-        ('japanese', 'Japanese'),
-        ('thai', 'Thai'),
-        ('mediterranean', 'Mediterranean'),
-        ('american', 'American'),
-        ('other', 'Other')
-    ], validators=[Optional()])
+    cuisine_preference = SelectField('Cuisine Preference', choices=[('', 'Any Cuisine')] + CUISINE_CHOICES, validators=[Optional()])
     occasion_type = SelectField('Occasion', choices=[
         ('dinner_party', 'Dinner Party'),
         ('romantic_dinner', 'Romantic Dinner'),
@@ -307,73 +661,1981 @@ class BookingForm(FlaskForm):
     ], validators=[DataRequired()])
     dietary_restrictions = TextAreaField('Dietary Restrictions/Preferences', validators=[Optional()])
     special_requests = TextAreaField('Special Requests', validators=[Optional()])
+    idempotency_key = HiddenField(validators=[Optional(), Length(max=64)])  # Filled per rendered form; see find_booking_by_key()
     submit = SubmitField('Request Booking')
 
-class ReviewForm(FlaskForm):
-    rating = SelectField('Overall Rating', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], validators=[DataRequired()])
-    food_quality = SelectField('Food Quality', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], validators=[DataRequired()])
-    professionalism = SelectField('Professionalism', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], validators=[DataRequired()])
-    cleanliness = SelectField('Cleanliness', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], validators=[DataRequired()])
-    communication = SelectField('Communication', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], validators=[DataRequired()])
-    value_for_money = SelectField('Value for Money', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], validators=[DataRequired()])
-    comment = TextAreaField('Review Comment', validators=[Optional(), Length(max=1000)])
-    submit = SubmitField('Submit Review')
+class ReviewForm(FlaskForm):
+    rating = SelectField('Overall Rating', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], coerce=int, validators=[DataRequired()])
+    food_quality = SelectField('Food Quality', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], coerce=int, validators=[DataRequired()])
+    professionalism = SelectField('Professionalism', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], coerce=int, validators=[DataRequired()])
+    cleanliness = SelectField('Cleanliness', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], coerce=int, validators=[DataRequired()])
+    communication = SelectField('Communication', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], coerce=int, validators=[DataRequired()])
+    value_for_money = SelectField('Value for Money', choices=[(5, '5 Stars'), (4, '4 Stars'), (3, '3 Stars'), (2, '2 Stars'), (1, '1 Star')], coerce=int, validators=[DataRequired()])
+    comment = TextAreaField('Review Comment', validators=[Optional(), Length(max=1000)])
+    submit = SubmitField('Submit Review')
+
+# Utility functions
+def string_list(value, lower=False):
+    """Clean, de-duplicated list of strings from a list, a JSON array or comma-separated text"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = None
+        value = parsed if isinstance(parsed, list) else value.split(',')
+    items = (str(item).strip() for item in value if item is not None)
+    return list(dict.fromkeys(item.lower() if lower else item for item in items if item))
+
+def upload_filename(original):
+    """Unique stored name; the random part keeps two nodes from picking the same key"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{secure_filename(original)}"
+
+def save_uploaded_file(file, folder, max_size=None):
+    """Store an uploaded file in upload storage and return its filename"""
+    if file and file.filename:
+        filename = upload_filename(file.filename)
+        stream = resize_image(file.stream, max_size) if max_size else file.stream
+        upload_storage.save(f'{folder}/{filename}', stream, file.mimetype)
+        return filename
+    return None
+
+def resize_image(stream, max_size=(800, 600)):
+    """Resize an image to max_size while maintaining aspect ratio; returns a readable stream"""
+    try:
+        with Image.open(stream) as img:
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            resized = io.BytesIO()
+            img.save(resized, format=img.format, optimize=True, quality=85)
+    except Exception as e:
+        print(f"Error resizing image: {e}")
+        stream.seek(0)
+        return stream
+    resized.seek(0)
+    return resized
+
+@app.template_global()
+def upload_url(folder, filename):
+    """Public URL of a stored upload, for <img src>"""
+    return upload_storage.url(f'{folder}/{filename}')
+
+@app.template_global()
+def upload_attrs(folder, token_field):
+    """File input attributes that let main.js upload the file directly and fill token_field"""
+    if not app.config['DIRECT_UPLOADS']:
+        return {}
+    return {'data-direct-upload': folder, 'data-upload-field': token_field.id}
+
+# Direct uploads
+# /uploads/sign hands the browser a short-lived signed URL for one new key and
+# a token naming that key; the form then posts the token instead of the file.
+# With S3 the bytes go straight to the bucket; local storage falls back to
+# upload_direct below, which still writes through this app.
+UPLOAD_TYPES = {'image/jpeg': ('jpg', 'jpeg'), 'image/png': ('png',)}
+
+def _upload_serializer():
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='direct-upload')
+
+def sign_direct_upload(folder, original, content_type, size):
+    """Signed PUT target and form token for one upload, or raise ValueError"""
+    extension = original.rsplit('.', 1)[-1].lower() if '.' in original else ''
+    if folder not in UPLOAD_FOLDERS or extension not in UPLOAD_TYPES.get(content_type, ()):
+        raise ValueError('Images only!')
+    if not 0 < size <= app.config['MAX_CONTENT_LENGTH']:
+        raise ValueError('File is too large')
+    filename = upload_filename(original)
+    token = _upload_serializer().dumps({'folder': folder, 'filename': filename, 'user_id': current_user.id,
+                                        'content_type': content_type, 'size': size})
+    expires = app.config['DIRECT_UPLOAD_EXPIRES_SECONDS']
+    if hasattr(upload_storage, 'presign_upload'):
+        target = upload_storage.presign_upload(f'{folder}/{filename}', content_type, size, expires)
+    else:
+        target = {'method': 'PUT', 'url': url_for('upload_direct', token=token), 'headers': {'Content-Type': content_type}}
+    return dict(target, token=token)
+
+def load_direct_upload(token, folder, check_exists=True):
+    """Upload details for a token this user was issued for folder, or None"""
+    try:
+        max_age = app.config['DIRECT_UPLOAD_EXPIRES_SECONDS'] + 3600  # Time left to finish the form after uploading
+        upload = _upload_serializer().loads(token, max_age=max_age)
+    except BadSignature:
+        return None
+    if upload['folder'] != folder or upload['user_id'] != current_user.id:
+        return None
+    if check_exists and not upload_storage.exists(f"{folder}/{upload['filename']}"):
+        return None
+    return upload
+
+def shrink_stored_image(key, content_type, max_size):
+    """Resize an image already in upload storage in place when it is larger than max_size"""
+    with upload_storage.open(key) as stored:
+        data = stored.read()
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.width <= max_size[0] and img.height <= max_size[1]:
+                return
+    except Exception as e:
+        print(f"Error resizing image: {e}")
+        return
+    upload_storage.save(key, resize_image(io.BytesIO(data), max_size), content_type)
+
+def uploaded_photo(file, token, folder, max_size=None):
+    """Filename of a photo sent with the form or uploaded directly beforehand, or None"""
+    if token:
+        upload = load_direct_upload(token, folder)
+        if not upload:
+            return None
+        if max_size:
+            # The browser skipped the app, so fetch the stored original and shrink it here
+            shrink_stored_image(f"{folder}/{upload['filename']}", upload['content_type'], max_size)
+        return upload['filename']
+    return save_uploaded_file(file, folder, max_size)
+
+# Pricing
+# All money is Decimal, rounded to cents with ROUND_HALF_UP. Quotes are cached
+# per (chef, pricing_version, ...) so a price edit makes old entries unreachable.
+CENTS = Decimal('0.01')
+_quote_cache = OrderedDict()
+_quote_cache_lock = threading.Lock()
+
+def to_money(value):
+    """Quantize a number to cents without going through float"""
+    return Decimal(str(value or 0)).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+def compute_quote(base_per_person, teaching_per_person, travel_fee, guest_count, service_type, menu_price=None):
+    """Price breakdown for one booking configuration"""
+    per_person = to_money(menu_price if menu_price is not None else base_per_person)
+    if service_type == 'cooking_and_teaching':
+        per_person += to_money(teaching_per_person)
+    
+    base_price = per_person * guest_count
+    service_fee = to_money(base_price * app.config['SERVICE_FEE_PERCENTAGE'] / 100)
+    platform_fee = to_money(base_price * app.config['PLATFORM_FEE_PERCENTAGE'] / 100)
+    travel_fee = to_money(travel_fee)
+    return {
+        'per_person': per_person,
+        'base_price': base_price,
+        'travel_fee': travel_fee,
+        'service_fee': service_fee,
+        'platform_fee': platform_fee,
+        'total': base_price + travel_fee + service_fee + platform_fee
+    }
+
+def quote_prices(items):
+    """Quote many (chef_profile, guest_count, service_type, menu_id) tuples in one call.
+
+    Menu prices for all cache misses are fetched in a single query. Teaching
+    is only priced for chefs who offer it. Returns a list of quote dicts in
+    the same order as items.
+    """
+    items = [(chef, guest_count, service_type if chef.offers_teaching else 'cooking_only', menu_id)
+             for chef, guest_count, service_type, menu_id in items]
+    keys = [(chef.id, chef.pricing_version, guest_count, service_type, menu_id)
+            for chef, guest_count, service_type, menu_id in items]
+    with _quote_cache_lock:
+        quotes = [_quote_cache.get(key) for key in keys]
+    
+    misses = [i for i, quote in enumerate(quotes) if quote is None]
+    if not misses:
+        return quotes
+    
+    menu_ids = {items[i][3] for i in misses if items[i][3]}
+    menu_prices = {}
+    if menu_ids:
+        rows = db.session.execute(db.select(Menu.id, Menu.chef_id, Menu.price_per_person).where(Menu.id.in_(menu_ids)))
+        menu_prices = {menu_id: (chef_id, price) for menu_id, chef_id, price in rows}
+    
+    for i in misses:
+        chef, guest_count, service_type, menu_id = items[i]
+        menu_chef_id, menu_price = menu_prices.get(menu_id, (None, None))
+        if menu_chef_id != chef.id:
+            menu_price = None  # Unknown menu or another chef's menu: fall back to base price
+        quotes[i] = compute_quote(chef.base_price_per_person, chef.teaching_price_per_person, chef.travel_fee,
+                                  guest_count, service_type, menu_price)
+    
+    with _quote_cache_lock:
+        for i in misses:
+            _quote_cache[keys[i]] = quotes[i]
+        while len(_quote_cache) > app.config['QUOTE_CACHE_SIZE']:
+            _quote_cache.popitem(last=False)
+    return quotes
+
+def quote_booking(chef_profile, guest_count, service_type='cooking_only', menu_id=None):
+    """Quote a single booking configuration"""
+    return quote_prices([(chef_profile, guest_count, service_type, menu_id)])[0]
+
+def bump_pricing_version(chef_profile):
+    """Invalidate cached quotes for a chef after a price-affecting change"""
+    chef_profile.pricing_version = (chef_profile.pricing_version or 0) + 1
+
+# Menu catalog
+# A chef's menus with their ordered dishes and cover photo, assembled in three
+# queries however many menus there are. Catalogs are plain dicts cached per
+# (chef, menu_version); any menu edit bumps the version so every worker stops
+# serving the old catalog on its next read of the profile.
+_menu_catalog_cache = OrderedDict()
+_menu_catalog_lock = threading.Lock()
+
+
+def load_menu_catalogs(chef_profile_ids):
+    """Assemble catalogs for many chefs at once: {chef_profile_id: [menu, ...]}"""
+    catalogs = {chef_id: [] for chef_id in chef_profile_ids}
+    if not catalogs:
+        return catalogs
+    
+    menus = db.session.execute(
+        db.select(Menu).where(Menu.chef_id.in_(catalogs)).order_by(Menu.chef_id, Menu.is_featured.desc(), Menu.name, Menu.id)
+    ).scalars().all()
+    by_id = {}
+    for menu in menus:
+        by_id[menu.id] = {
+            'id': menu.id,
+            'name': menu.name,
+            'description': menu.description or '',
+            'price_per_person': menu.price_per_person,
+            'course_count': menu.course_count,
+            'prep_time_hours': menu.prep_time_hours,
+            'dietary_tags': menu.dietary_tags or [],
+            'is_featured': bool(menu.is_featured),
+            'dishes': [],
+            'photo': None
+        }
+        catalogs[menu.chef_id].append(by_id[menu.id])
+    if not by_id:
+        return catalogs
+    
+    items = db.session.execute(
+        db.select(MenuItem.menu_id, MenuItem.course_type, MenuItem.name, MenuItem.description)
+        .where(MenuItem.menu_id.in_(by_id)).order_by(MenuItem.menu_id, MenuItem.order, MenuItem.id)
+    )
+    for menu_id, course_type, name, description in items:
+        by_id[menu_id]['dishes'].append({'course_type': course_type, 'name': name, 'description': description or ''})
+    
+    # One cover per menu: the primary photo, else the first uploaded
+    position = db.func.row_number().over(
+        partition_by=MenuPhoto.menu_id, order_by=(MenuPhoto.is_primary.desc(), MenuPhoto.id)
+    ).label('position')
+    ranked = db.select(MenuPhoto.menu_id, MenuPhoto.photo_url, MenuPhoto.caption, position)\
+        .where(MenuPhoto.menu_id.in_(by_id)).subquery()
+    photos = db.session.execute(db.select(ranked.c.menu_id, ranked.c.photo_url, ranked.c.caption).where(ranked.c.position == 1))
+    for menu_id, photo_url, caption in photos:
+        by_id[menu_id]['photo'] = {'url': photo_url, 'caption': caption or ''}
+    return catalogs
+
+def get_menu_catalog(chef_profile):
+    """A chef's menu catalog, served from the per-worker cache when current"""
+    key = (chef_profile.id, chef_profile.menu_version)
+    with _menu_catalog_lock:
+        catalog = _menu_catalog_cache.get(key)
+        if catalog is not None:
+            _menu_catalog_cache.move_to_end(key)
+            return catalog
+    
+    catalog = load_menu_catalogs([chef_profile.id])[chef_profile.id]
+    with _menu_catalog_lock:
+        _menu_catalog_cache[key] = catalog
+        while len(_menu_catalog_cache) > app.config['MENU_CATALOG_CACHE_SIZE']:
+            _menu_catalog_cache.popitem(last=False)
+    return catalog
+
+def bump_menu_version(chef_profile, price_changed=False):
+    """Invalidate a chef's cached catalog (and quotes too when a menu price changed)"""
+    chef_profile.menu_version = (chef_profile.menu_version or 0) + 1
+    if price_changed:
+        bump_pricing_version(chef_profile)
+
+# Scheduled jobs
+# Periodic maintenance functions register themselves here and are driven by
+# the ``flask run-scheduler`` worker process (see Procfile).
+scheduled_jobs = {}
+
+def scheduled_job(name, interval_seconds):
+    """Register a function to be run periodically by the scheduler worker"""
+    def decorator(func):
+        scheduled_jobs[name] = {'func': func, 'interval': interval_seconds}
+        return func
+    return decorator
+
+@app.cli.command('run-scheduler')
+@click.option('--once', is_flag=True, help='Run every job a single time and exit.')
+@click.option('--tick', default=5, show_default=True, help='Seconds between scheduler checks.')
+def run_scheduler(once, tick):
+    """Run registered periodic jobs until interrupted"""
+    last_run = {}
+    while True:
+        for name, job in scheduled_jobs.items():
+            if once or time.monotonic() - last_run.get(name, float('-inf')) >= job['interval']:
+                try:
+                    result = job['func']()
+                    app.logger.info(f"Scheduled job {name} finished: {result}")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Scheduled job {name} failed: {e}")
+                last_run[name] = time.monotonic()
+        if once:
+            break
+        time.sleep(tick)
+
+# Real-time events
+# Events are published per user on channel "user:<id>" and streamed to the
+# browser by /events. The in-memory bus only reaches subscribers in the same
+# worker process; set EVENT_BUS_URL=redis://... when running several workers.
+class InMemoryEventBus:
+    """Process-local pub/sub, used in development and tests"""
+    
+    def __init__(self, max_queue_size=100):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._max_queue_size = max_queue_size
+    
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                pass  # Slow consumer; it will resync on reconnect
+    
+    def subscribe(self, channel):
+        subscriber = queue.Queue(maxsize=self._max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        return InMemorySubscription(self, channel, subscriber)
+    
+    def _unsubscribe(self, channel, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+class InMemorySubscription:
+    def __init__(self, bus, channel, subscriber):
+        self._bus = bus
+        self._channel = channel
+        self._queue = subscriber
+    
+    def get(self, timeout):
+        """Return the next event, or None if nothing arrived within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def close(self):
+        self._bus._unsubscribe(self._channel, self._queue)
+
+class RedisEventBus:
+    """Shared pub/sub over Redis so events reach every gunicorn worker"""
+    
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('EVENT_BUS_URL points at Redis but the redis package is not installed')
+        self._redis = redis.Redis.from_url(url)
+    
+    def publish(self, channel, event):
+        self._redis.publish(channel, json.dumps(event))
+    
+    def subscribe(self, channel):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        return RedisSubscription(pubsub)
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+    
+    def get(self, timeout):
+        message = self._pubsub.get_message(timeout=timeout)
+        return json.loads(message['data']) if message else None
+    
+    def close(self):
+        self._pubsub.close()
+
+def create_event_bus(url):
+    """Build the event bus named by EVENT_BUS_URL (memory:// or redis://)"""
+    if url.startswith('memory://'):
+        return InMemoryEventBus()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisEventBus(url)
+    raise ValueError(f"Unsupported EVENT_BUS_URL: {url}")
+
+event_bus = create_event_bus(app.config['EVENT_BUS_URL'])
+
+def publish_user_event(user_id, event_type, data):
+    """Push an event to a user's open /events streams; never fails the request"""
+    try:
+        event_bus.publish(f'user:{user_id}', {'type': event_type, 'data': data})
+    except Exception as e:
+        app.logger.error(f"Event publish failed for user {user_id}: {e}")
+
+def publish_booking_status(booking):
+    """Tell both participants that a booking changed status"""
+    data = {'booking_id': booking.id, 'status': booking.status}
+    for user_id in (booking.client_id, booking.chef_id):
+        publish_user_event(user_id, 'booking_status', data)
+
+# Read replicas
+# Views wrapped in read_only_view send their SELECTs to a replica (see
+# replicas.py). A client that has just written is kept on the primary for
+# REPLICA_STICKY_SECONDS so the page after a redirect shows its own change.
+def read_only_view(view):
+    """Serve this view's reads from a replica when one is configured and healthy"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = session.get('_primary_until', 0) < time.time()
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def remember_primary_writes(response):
+    if RoutingSession.replicas and db.session.info.get('wrote'):
+        session['_primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+    return response
+
+# Server-side sessions
+# With SESSION_STORAGE_URL=database:// or redis://... the session lives on the
+# server and the cookie carries only a random id, so any node can serve any
+# request and logging out really ends the session. The id is replaced whenever
+# the logged-in user changes, so an id handed out before login cannot be reused.
+class InMemorySessionStore:
+    """Process-local sessions, used in development and tests"""
+    
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+    
+    def load(self, sid):
+        with self._lock:
+            data, expires_at = self._sessions.get(sid, (None, None))
+        return data if expires_at and expires_at > datetime.utcnow() else None
+    
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+    
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+    
+    def purge_expired(self):
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+class DatabaseSessionStore:
+    """Sessions in the ServerSession table, on their own primary connection so
+    they never share a transaction with the request's db.session"""
+    
+    def load(self, sid):
+        with db.engine.connect() as conn:
+            return conn.execute(db.select(ServerSession.data).where(
+                ServerSession.id == sid, ServerSession.expires_at > datetime.utcnow()
+            )).scalar()
+    
+    def save(self, sid, data, expires_at):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(ServerSession).where(ServerSession.id == sid))
+            conn.execute(db.insert(ServerSession).values(id=sid, data=data, expires_at=expires_at))
+    
+    def delete(self, sid):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(ServerSession).where(ServerSession.id == sid))
+    
+    def purge_expired(self):
+        with db.engine.begin() as conn:
+            return conn.execute(db.delete(ServerSession).where(ServerSession.expires_at <= datetime.utcnow())).rowcount
+
+class RedisSessionStore:
+    """Sessions as Redis keys that expire on their own"""
+    
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('SESSION_STORAGE_URL points at Redis but the redis package is not installed')
+        self._redis = redis.Redis.from_url(url)
+    
+    def load(self, sid):
+        data = self._redis.get(f'session:{sid}')
+        return data.decode() if data else None
+    
+    def save(self, sid, data, expires_at):
+        self._redis.set(f'session:{sid}', data, ex=max(1, int((expires_at - datetime.utcnow()).total_seconds())))
+    
+    def delete(self, sid):
+        self._redis.delete(f'session:{sid}')
+    
+    def purge_expired(self):
+        return 0  # Redis expires keys itself
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.user_id = self.get('_user_id')  # Flask-Login's key, to spot logins and logouts
+        self.modified = False
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface keeping data in a session store and an opaque id in the cookie"""
+    
+    serializer = TaggedJSONSerializer()
+    
+    def __init__(self, store):
+        self.store = store
+    
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.load(sid) if sid else None
+        if data is None:
+            return ServerSideSession()
+        return ServerSideSession(self.serializer.loads(data), sid)
+    
+    def save_session(self, app, session, response):
+        name, domain, path = self.get_cookie_name(app), self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session:
+            if session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app), samesite=self.get_cookie_samesite(app))
+            return
+        if session.sid and session.get('_user_id') != session.user_id:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            session.modified = True
+        if session.modified:
+            self.store.save(session.sid, self.serializer.dumps(dict(session)),
+                            datetime.utcnow() + app.permanent_session_lifetime)
+        if session.modified or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+def create_session_interface(url):
+    """Build the session handling named by SESSION_STORAGE_URL (cookie://, memory://, database:// or redis://)"""
+    if url.startswith('cookie://'):
+        return SecureCookieSessionInterface()
+    if url.startswith('memory://'):
+        return ServerSideSessionInterface(InMemorySessionStore())
+    if url.startswith('database://'):
+        return ServerSideSessionInterface(DatabaseSessionStore())
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return ServerSideSessionInterface(RedisSessionStore(url))
+    raise ValueError(f"Unsupported SESSION_STORAGE_URL: {url}")
+
+app.session_interface = create_session_interface(app.config['SESSION_STORAGE_URL'])
+
+@scheduled_job('session_cleanup', interval_seconds=3600)
+def purge_expired_sessions():
+    store = getattr(app.session_interface, 'store', None)
+    return store.purge_expired() if store else 0
+
+# Rate limiting
+# Token buckets keyed per limit and per client (IP, account or user). Checks run
+# in the route decorator, before the form is parsed or any password is hashed.
+# The in-memory store is per worker process; set RATELIMIT_STORAGE_URL=redis://...
+# to share buckets between workers and instances.
+RateLimit = namedtuple('RateLimit', 'rate burst')  # rate in tokens per second
+
+RATE_LIMIT_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+def parse_rate_limit(value):
+    """'10/minute' -> RateLimit(rate=10/60, burst=10)"""
+    amount, period = value.split('/')
+    return RateLimit(int(amount) / RATE_LIMIT_PERIODS[period.strip()], int(amount))
+
+class InMemoryRateLimitStore:
+    """Token buckets in a bounded LRU dict, shared by the threads of one process"""
+    
+    def __init__(self, max_keys=100000):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+    
+    def hit(self, key, limit, cost=1):
+        """Take cost tokens; returns (allowed, seconds until enough tokens are available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (cost - tokens) / limit.rate
+    
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+class RedisRateLimitStore:
+    """Token buckets in Redis, updated atomically by a Lua script using the Redis clock"""
+    
+    SCRIPT = """
+    local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = math.min(burst, (tonumber(state[1]) or burst) + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+    
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_STORAGE_URL points at Redis but the redis package is not installed')
+        self._redis = redis.Redis.from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+    
+    def hit(self, key, limit, cost=1):
+        allowed, tokens = self._script(keys=[f'ratelimit:{key}'], args=[limit.rate, limit.burst, cost])
+        return bool(allowed), 0 if allowed else (cost - float(tokens)) / limit.rate
+    
+    def reset(self):
+        for key in self._redis.scan_iter('ratelimit:*'):
+            self._redis.delete(key)
+
+def create_rate_limit_store(url):
+    """Build the bucket store named by RATELIMIT_STORAGE_URL (memory:// or redis://)"""
+    if url.startswith('memory://'):
+        return InMemoryRateLimitStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisRateLimitStore(url)
+    raise ValueError(f"Unsupported RATELIMIT_STORAGE_URL: {url}")
+
+rate_limit_store = create_rate_limit_store(app.config['RATELIMIT_STORAGE_URL'])
+rate_limit_metrics = Counter()  # (limit name, outcome) -> requests, for /metrics
+_rate_limit_metrics_lock = threading.Lock()
+
+def _record_rate_limit(name, outcome):
+    with _rate_limit_metrics_lock:
+        rate_limit_metrics[(name, outcome)] += 1
+
+def check_rate_limit(name, key, cost=1):
+    """Charge one request against limit name for key; returns seconds to wait, or 0 if allowed.
+
+    A failing shared store lets the request through rather than taking the site down.
+    """
+    try:
+        allowed, retry_after = rate_limit_store.hit(f'{name}:{key}', parse_rate_limit(app.config['RATELIMITS'][name]), cost)
+    except Exception as e:
+        app.logger.warning(f"Rate limit store unavailable, allowing request: {e}")
+        _record_rate_limit(name, 'error')
+        return 0
+    _record_rate_limit(name, 'allowed' if allowed else 'rejected')
+    return 0 if allowed else retry_after
+
+def rate_limit_key(scope):
+    """Identify the client for a scope: ip, user (logged-in id) or account (login email)"""
+    if scope == 'ip':
+        return request.remote_addr or 'unknown'
+    if scope == 'user':
+        return current_user.get_id() if current_user.is_authenticated else None
+    if scope == 'account':
+        email = request.form.get('email', '').strip().lower()
+        return email or None
+    raise ValueError(f"Unknown rate limit scope: {scope}")
+
+def rate_limited_response(retry_after):
+    """429 with Retry-After; JSON for XHR/JSON clients, a short page otherwise"""
+    retry_after = max(1, int(retry_after + 0.999))
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'error': 'Too many requests', 'retry_after': retry_after})
+    else:
+        response = app.make_response(render_template('errors/429.html', retry_after=retry_after))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def rate_limit(name, scope='ip', methods=('POST',)):
+    """Reject requests over app.config['RATELIMITS'][name] before the view runs"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if app.config['RATELIMIT_ENABLED'] and request.method in methods:
+                key = rate_limit_key(scope)
+                retry_after = check_rate_limit(name, key) if key else 0
+                if retry_after:
+                    return rate_limited_response(retry_after)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+@app.before_request
+def apply_global_rate_limit():
+    """Per-IP ceiling across every route except static files and the long-lived event stream"""
+    if not app.config['RATELIMIT_ENABLED'] or request.endpoint in ('static', 'event_stream', 'stripe_webhook', 'readiness', 'liveness', None):
+        return None
+    retry_after = check_rate_limit('global', rate_limit_key('ip'))
+    if retry_after:
+        return rate_limited_response(retry_after)
+    return None
+
+# Outbound email
+# Request handlers only insert an EmailOutbox row in their own transaction;
+# the scheduler worker renders and delivers them in batches.
+def queue_email(to_address, subject, template, **context):
+    """Add an email to the outbox; it is sent after the caller commits"""
+    email = EmailOutbox(to_address=to_address, subject=subject, template=template, context=json.dumps(context))
+    db.session.add(email)
+    return email
+
+def queue_booking_email(booking, recipient, template, subject):
+    """Queue a booking notification for one participant"""
+    other = booking.chef if recipient.id == booking.client_id else booking.client
+    queue_email(
+        recipient.email, subject, template,
+        recipient_name=recipient.first_name,
+        other_name=f"{other.first_name} {other.last_name}",
+        event_date=booking.event_date.strftime('%B %d, %Y'),
+        event_time=booking.event_time.strftime('%I:%M %p'),
+        guest_count=booking.guest_count,
+        total_price=str(booking.total_price),
+        booking_url=url_for('booking_detail', booking_id=booking.id, _external=True)
+    )
+
+def render_email(email):
+    """Build the Flask-Mail message for an outbox row"""
+    context = json.loads(email.context or '{}')
+    return MailMessage(
+        subject=email.subject,
+        recipients=[email.to_address],
+        body=render_template(f'emails/{email.template}.txt', **context),
+        html=render_template(f'emails/{email.template}.html', **context)
+    )
+
+def email_retry_delay(attempts):
+    """Exponential backoff: base, 2x, 4x ... capped at six hours"""
+    return timedelta(seconds=min(app.config['EMAIL_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1), 6 * 3600))
+
+def _record_email_failure(email, error, now):
+    email.attempts = (email.attempts or 0) + 1
+    email.last_error = str(error)[:1000]
+    if email.attempts >= app.config['EMAIL_MAX_ATTEMPTS']:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = now + email_retry_delay(email.attempts)
+
+@scheduled_job('send_emails', interval_seconds=10)
+def send_pending_emails(batch_size=None):
+    """Deliver one batch of due outbox emails over a single SMTP connection"""
+    now = datetime.utcnow()
+    batch = EmailOutbox.query\
+        .filter(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)\
+        .order_by(EmailOutbox.next_attempt_at)\
+        .limit(batch_size or app.config['EMAIL_BATCH_SIZE'])\
+        .with_for_update(skip_locked=True)\
+        .all()
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+    if not batch:
+        return result
+    
+    handled = set()
+    try:
+        with mail.connect() as connection:
+            for email in batch:
+                try:
+                    connection.send(render_email(email))
+                    email.status = 'sent'
+                    email.sent_at = now
+                    result['sent'] += 1
+                except smtplib.SMTPServerDisconnected:
+                    raise
+                except Exception as e:
+                    _record_email_failure(email, e, now)
+                handled.add(email.id)
+    except Exception as e:
+        # Could not connect, or the connection dropped: retry everything not yet handled
+        app.logger.error(f"SMTP connection failed: {e}")
+        for email in batch:
+            if email.id not in handled:
+                _record_email_failure(email, e, now)
+    
+    for email in batch:
+        if email.status == 'failed':
+            result['failed'] += 1
+        elif email.status == 'pending':
+            result['retried'] += 1
+    db.session.commit()
+    return result
+
+# Booking submission
+# Each rendered booking form carries a fresh idempotency key, stored on the
+# booking under a unique (client_id, idempotency_key) index. A double-click or
+# a retried POST finds the booking its key already made and is answered with
+# it, skipping pricing, the insert and the chef's email; two copies racing
+# past that lookup collide on the index and the loser returns the winner.
+def new_idempotency_key():
+    """Random key for one rendered booking form"""
+    return secrets.token_urlsafe(24)
+
+def find_booking_by_key(client_id, idempotency_key):
+    """The booking a client already made with this form submission, if any"""
+    if not idempotency_key:
+        return None
+    return Booking.query.filter_by(client_id=client_id, idempotency_key=idempotency_key).first()
+
+# Booking lifecycle
+# Allowed status changes; anything not listed here is rejected.
+BOOKING_TRANSITIONS = {
+    'pending': {'confirmed', 'cancelled', 'expired'},
+    'confirmed': {'completed', 'cancelled'},
+    'completed': set(),
+    'cancelled': set(),
+    'expired': set(),
+}
+
+class InvalidBookingTransition(Exception):
+    """Raised when a booking status change is not allowed by BOOKING_TRANSITIONS"""
+
+def transition_booking(booking, new_status):
+    """Move a single booking to new_status, enforcing the state machine"""
+    if new_status not in BOOKING_TRANSITIONS.get(booking.status, set()):
+        raise InvalidBookingTransition(f"Cannot move booking {booking.id} from {booking.status} to {new_status}")
+    booking.status = new_status
+    booking.updated_at = datetime.utcnow()
+
+def bulk_transition_bookings(criteria, new_status):
+    """Set-based transition: a single UPDATE over every booking matching criteria.
+
+    Only rows whose current status may legally move to new_status are touched.
+    Returns the number of rows updated.
+    """
+    sources = [status for status, targets in BOOKING_TRANSITIONS.items() if new_status in targets]
+    stmt = db.update(Booking)\
+        .where(Booking.status.in_(sources), *criteria)\
+        .values(status=new_status, updated_at=datetime.utcnow())
+    return db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+
+def complete_past_bookings(today):
+    """Mark confirmed bookings whose event date has passed as completed"""
+    return bulk_transition_bookings([Booking.status == 'confirmed', Booking.event_date < today], 'completed')
+
+def expire_stale_requests(now):
+    """Expire pending requests the chef did not answer within response_time_hours"""
+    # Requests for events that have already happened can never be accepted
+    expired = bulk_transition_bookings([Booking.status == 'pending', Booking.event_date < now.date()], 'expired')
+    
+    # One UPDATE per distinct response window (a handful of values), not per booking
+    response_hours = db.func.coalesce(ChefProfile.response_time_hours, 24)
+    for hours in db.session.execute(db.select(response_hours).distinct()).scalars():
+        chef_ids = db.select(ChefProfile.user_id).where(response_hours == hours)
+        expired += bulk_transition_bookings([
+            Booking.status == 'pending',
+            Booking.created_at < now - timedelta(hours=hours),
+            Booking.chef_id.in_(chef_ids)
+        ], 'expired')
+    return expired
+
+def _availability_slot_criteria(chef_user_id, event_date, event_time):
+    """WHERE clauses matching the ChefAvailability slot covering a booking"""
+    chef_profile_id = db.select(ChefProfile.id).where(ChefProfile.user_id == chef_user_id).scalar_subquery()
+    return [
+        ChefAvailability.chef_id == chef_profile_id,
+        ChefAvailability.date == event_date,
+        ChefAvailability.start_time <= event_time,
+        ChefAvailability.end_time > event_time
+    ]
+
+def reserve_availability(booking):
+    """Count a newly confirmed booking against the chef's availability slot"""
+    stmt = db.update(ChefAvailability)\
+        .where(*_availability_slot_criteria(booking.chef_id, booking.event_date, booking.event_time))\
+        .values(current_bookings=db.func.coalesce(ChefAvailability.current_bookings, 0) + 1)
+    db.session.execute(stmt, execution_options={'synchronize_session': False})
+
+def release_availability(today):
+    """Recount confirmed bookings for every upcoming slot in one UPDATE.
+
+    Slots held by bookings that were cancelled or expired are freed again.
+    """
+    confirmed = db.select(db.func.count(Booking.id))\
+        .join(ChefProfile, ChefProfile.user_id == Booking.chef_id)\
+        .where(
+            ChefProfile.id == ChefAvailability.chef_id,
+            Booking.event_date == ChefAvailability.date,
+            Booking.event_time >= ChefAvailability.start_time,
+            Booking.event_time < ChefAvailability.end_time,
+            Booking.status == 'confirmed'
+        ).scalar_subquery()
+    stmt = db.update(ChefAvailability)\
+        .where(ChefAvailability.date >= today, db.func.coalesce(ChefAvailability.current_bookings, 0) != confirmed)\
+        .values(current_bookings=confirmed)
+    return db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+
+@scheduled_job('booking_transitions', interval_seconds=300)
+def run_booking_transitions(now=None):
+    """Apply time-based booking transitions in bulk"""
+    now = now or datetime.utcnow()
+    today = now.date()
+    result = {
+        'completed': complete_past_bookings(today),
+        'expired': expire_stale_requests(now),
+        'slots_released': release_availability(today)
+    }
+    db.session.commit()
+    return result
+
+# Payments
+# Allowed payment_status changes driven by Stripe webhooks
+PAYMENT_TRANSITIONS = {
+    'pending': {'paid', 'failed'},
+    'failed': {'paid'},
+    'paid': {'refunded'},
+    'refunded': set(),
+}
+
+STRIPE_EVENT_PAYMENT_STATUS = {
+    'payment_intent.succeeded': 'paid',
+    'payment_intent.payment_failed': 'failed',
+    'charge.refunded': 'refunded',
+}
+
+def to_cents(amount):
+    """Convert a Numeric dollar amount to Stripe's integer cents"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1')))
+
+def get_or_create_payment_intent(booking):
+    """Return the booking's PaymentIntent, creating it at most once.
+
+    The DB connection is released before calling Stripe so a slow API call
+    does not hold a pool connection, and the idempotency key makes retries
+    (ours or the client's double-click) return the same intent.
+    """
+    booking_id, intent_id = booking.id, booking.stripe_payment_intent_id
+    amount = to_cents(booking.total_price)
+    db.session.commit()
+    
+    if intent_id:
+        return stripe.PaymentIntent.retrieve(intent_id)
+    
+    intent = stripe.PaymentIntent.create(
+        amount=amount,
+        currency='usd',
+        metadata={'booking_id': booking_id},
+        idempotency_key=f'booking-{booking_id}-payment-intent'
+    )
+    db.session.execute(
+        db.update(Booking)
+        .where(Booking.id == booking_id, Booking.stripe_payment_intent_id == None)
+        .values(stripe_payment_intent_id=intent['id']),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return intent
+
+def apply_stripe_event(event):
+    """Apply one verified Stripe event to its booking; safe to repeat"""
+    new_status = STRIPE_EVENT_PAYMENT_STATUS.get(event['type'])
+    if not new_status:
+        return 0
+    
+    obj = event['data']['object']
+    intent_id = obj['id'] if obj.get('object') == 'payment_intent' else obj.get('payment_intent')
+    if not intent_id:
+        return 0  # Matching on a NULL intent id would hit every booking without one
+    
+    # Match on the intent; the metadata booking id is only a fallback for a
+    # booking that has not recorded its intent yet
+    match = Booking.stripe_payment_intent_id == intent_id
+    booking_id = (obj.get('metadata') or {}).get('booking_id')
+    if booking_id and not db.session.execute(db.select(db.exists().where(match))).scalar():
+        match = db.and_(Booking.id == int(booking_id), Booking.stripe_payment_intent_id == None)
+    
+    sources = [status for status, targets in PAYMENT_TRANSITIONS.items() if new_status in targets]
+    return db.session.execute(
+        db.update(Booking)
+        .where(match, Booking.payment_status.in_(sources))
+        .values(payment_status=new_status, stripe_payment_intent_id=db.func.coalesce(Booking.stripe_payment_intent_id, intent_id)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+@scheduled_job('stripe_events', interval_seconds=5)
+def process_stripe_events(batch_size=100):
+    """Apply queued webhook events; each event id is processed exactly once"""
+    events = StripeEvent.query\
+        .filter(StripeEvent.status == 'pending')\
+        .order_by(StripeEvent.received_at)\
+        .limit(batch_size)\
+        .with_for_update(skip_locked=True)\
+        .all()
+    result = {'processed': 0, 'failed': 0}
+    for event in events:
+        try:
+            with db.session.begin_nested():
+                apply_stripe_event(json.loads(event.payload))
+            event.status = 'processed'
+            event.processed_at = datetime.utcnow()
+            result['processed'] += 1
+        except Exception as e:
+            event.attempts = (event.attempts or 0) + 1
+            event.last_error = str(e)[:1000]
+            if event.attempts >= 5:
+                event.status = 'failed'
+                result['failed'] += 1
+    db.session.commit()
+    return result
+
+# Messaging
+def message_recipient_id(booking, sender):
+    """Return the id of the other participant in a booking thread"""
+    return booking.chef_id if sender.id == booking.client_id else booking.client_id
+
+def send_booking_message(booking, sender, content):
+    """Add a message to a booking thread and bump the recipient's unread counter"""
+    message = Message(booking_id=booking.id, sender_id=sender.id, content=content)
+    db.session.add(message)
+    db.session.execute(
+        db.update(User)
+        .where(User.id == message_recipient_id(booking, sender))
+        .values(unread_messages=User.unread_messages + 1),
+        execution_options={'synchronize_session': False}
+    )
+    return message
+
+def mark_thread_read(booking, user):
+    """Mark every message sent to user in this booking as read.
+
+    A single UPDATE flips the flags; its rowcount is then subtracted from the
+    user's counter so the badge never needs a COUNT.
+    """
+    updated = db.session.execute(
+        db.update(Message)
+        .where(Message.booking_id == booking.id, Message.sender_id != user.id, Message.is_read == False)
+        .values(is_read=True),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if updated:
+        db.session.execute(
+            db.update(User)
+            .where(User.id == user.id)
+            .values(unread_messages=db.case((User.unread_messages > updated, User.unread_messages - updated), else_=0)),
+            execution_options={'synchronize_session': False}
+        )
+    return updated
+
+def get_message_page(booking_id, before_id=None, limit=None):
+    """Keyset-paginated thread history, oldest first.
+
+    Returns (messages, next_before) where next_before is the id to pass as
+    before_id to fetch the previous page, or None when there is nothing older.
+    """
+    limit = limit or app.config['MESSAGES_PER_PAGE']
+    query = Message.query.options(db.joinedload(Message.sender)).filter(Message.booking_id == booking_id)
+    if before_id:
+        query = query.filter(Message.id < before_id)
+    messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, (messages[0].id if has_more else None)
+
+@scheduled_job('unread_counter_reconcile', interval_seconds=3600)
+def reconcile_unread_counters():
+    """Recompute every user's unread counter in one UPDATE to repair any drift"""
+    unread = db.select(db.func.count(Message.id))\
+        .join(Booking, Booking.id == Message.booking_id)\
+        .where(
+            Message.is_read == False,
+            Message.sender_id != User.id,
+            db.or_(Booking.client_id == User.id, Booking.chef_id == User.id)
+        ).scalar_subquery()
+    updated = db.session.execute(
+        db.update(User).where(User.unread_messages != unread).values(unread_messages=unread),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    return {'users_fixed': updated}
+
+# Booking histories
+# Dashboard lists are keyset paginated on (sort column, id), so a page costs the
+# same however long a chef's or client's history grows.
+BOOKING_LISTS = {
+    # name: (status, sort column, newest first, future events only)
+    'upcoming': ('confirmed', 'event_date', False, True),
+    'pending': ('pending', 'created_at', True, False),
+    'past': ('completed', 'event_date', True, False),
+}
+
+def _booking_owner_column(user):
+    return Booking.chef_id if user.role == 'chef' else Booking.client_id
+
+def _parse_booking_cursor(cursor, sort_column):
+    value, _, booking_id = (cursor or '').rpartition('_')
+    try:
+        return sort_column.type.python_type.fromisoformat(value), int(booking_id)
+    except ValueError:
+        abort(400)
+
+def get_booking_page(user, list_name, after=None, limit=None):
+    """Keyset-paginated page of one of a user's dashboard booking lists.
+
+    Returns (bookings, next_after) where next_after is the cursor to pass as
+    after to fetch the following page, or None on the last page.
+    """
+    status, sort_attr, descending, future_only = BOOKING_LISTS[list_name]
+    limit = limit or app.config['DASHBOARD_PAGE_SIZE']
+    sort_column = getattr(Booking, sort_attr)
+    
+    # Cards show the other party and, for finished events, whether a review exists
+    options = [db.joinedload(Booking.client if user.role == 'chef' else Booking.chef)]
+    if status == 'completed':
+        options.append(db.selectinload(Booking.review))
+    query = Booking.query.options(*options).filter(_booking_owner_column(user) == user.id, Booking.status == status)
+    if future_only:
+        query = query.filter(Booking.event_date >= datetime.now().date())
+    if after:
+        value, booking_id = _parse_booking_cursor(after, sort_column)
+        if descending:
+            query = query.filter(db.or_(sort_column < value, db.and_(sort_column == value, Booking.id < booking_id)))
+        else:
+            query = query.filter(db.or_(sort_column > value, db.and_(sort_column == value, Booking.id > booking_id)))
+    order = (sort_column.desc(), Booking.id.desc()) if descending else (sort_column, Booking.id)
+    bookings = query.order_by(*order).limit(limit + 1).all()
+    
+    has_more = len(bookings) > limit
+    bookings = bookings[:limit]
+    if not has_more:
+        return bookings, None
+    last = bookings[-1]
+    return bookings, f'{getattr(last, sort_attr).isoformat()}_{last.id}'
+
+def get_booking_counts(user):
+    """Dashboard summary counts from one grouped query on the (owner, status, event_date) index"""
+    rows = db.session.execute(
+        db.select(
+            Booking.status,
+            db.func.count(),
+            db.func.sum(db.case((Booking.event_date >= datetime.now().date(), 1), else_=0))
+        ).where(_booking_owner_column(user) == user.id).group_by(Booking.status)
+    ).all()
+    totals = {status: (total, upcoming or 0) for status, total, upcoming in rows}
+    return {
+        'upcoming': totals.get('confirmed', (0, 0))[1],
+        'pending': totals.get('pending', (0, 0))[0],
+        'past': totals.get('completed', (0, 0))[0],
+    }
+
+# Ranking
+# The default "best match" order sorts on ChefProfile.ranking_score (copied to
+# ChefCard), a 0-100 score too costly to compute per request. It blends:
+#   - a Bayesian average rating: every chef is credited RANKING_PRIOR_REVIEWS
+#     reviews at the site-wide mean, so one 5-star review does not outrank 200
+#     averaging 4.9; reviews from the last RANKING_RECENT_DAYS count double
+#   - the booking completion rate (completed out of completed, cancelled and
+#     expired), pulled towards RANKING_PRIOR_COMPLETION_RATE the same way
+#   - response time: full marks for answering at once, none at
+#     RANKING_MAX_RESPONSE_HOURS or slower
+# Scores are rewritten by set-based UPDATEs: for the chefs touched by a flush
+# that changes a review, a booking status or a profile, hourly for chefs whose
+# bookings were changed by set-based writes, and nightly for everyone as the
+# recency window and the site-wide mean move.
+RANKING_WEIGHTS = {'rating': 0.7, 'completion': 0.2, 'response': 0.1}
+RANKING_PRIOR_REVIEWS = 10
+RANKING_DEFAULT_MEAN_RATING = 4.0  # Until the site has any reviews
+RANKING_RECENT_DAYS = 180
+RANKING_PRIOR_BOOKINGS = 5
+RANKING_PRIOR_COMPLETION_RATE = 0.9
+RANKING_MAX_RESPONSE_HOURS = 72
+RANKING_DECIDED_STATUSES = ('completed', 'cancelled', 'expired')
+
+def _ranking_score(now):
+    """SQL expression for a chef profile's ranking score, correlated on ChefProfile"""
+    review_weight = db.case((Review.created_at >= now - timedelta(days=RANKING_RECENT_DAYS), 2), else_=1)
+    def review_total(value):
+        return db.select(db.func.coalesce(db.func.sum(value), 0)).where(Review.chef_id == ChefProfile.user_id).scalar_subquery()
+    site_mean = db.select(db.func.coalesce(db.func.avg(Review.rating), RANKING_DEFAULT_MEAN_RATING)).scalar_subquery()
+    rating = (RANKING_PRIOR_REVIEWS * site_mean + review_total(review_weight * Review.rating)) / \
+        (RANKING_PRIOR_REVIEWS + review_total(review_weight))
+    
+    def booking_count(statuses):
+        return db.select(db.func.count(Booking.id))\
+            .where(Booking.chef_id == ChefProfile.user_id, Booking.status.in_(statuses)).scalar_subquery()
+    completion = (booking_count(('completed',)) + RANKING_PRIOR_BOOKINGS * RANKING_PRIOR_COMPLETION_RATE) / \
+        (booking_count(RANKING_DECIDED_STATUSES) + RANKING_PRIOR_BOOKINGS)
+    
+    hours = db.func.coalesce(ChefProfile.response_time_hours, 24)
+    response = db.case((hours >= RANKING_MAX_RESPONSE_HOURS, 0.0), else_=1.0 - hours / float(RANKING_MAX_RESPONSE_HOURS))
+    
+    return 100 * (RANKING_WEIGHTS['rating'] * rating / 5.0 +
+                  RANKING_WEIGHTS['completion'] * completion +
+                  RANKING_WEIGHTS['response'] * response)
+
+def update_ranking_scores(session, user_ids=None, now=None):
+    """Recompute the ranking score of the given chefs (user ids or a select of them), or of every chef.
+
+    Two UPDATEs: the profiles, then their chef cards. Returns the number of profiles updated.
+    """
+    profile_criteria, card_criteria = [], []
+    if user_ids is not None:
+        profile_criteria, card_criteria = [ChefProfile.user_id.in_(user_ids)], [ChefCard.user_id.in_(user_ids)]
+    updated = session.execute(
+        db.update(ChefProfile).where(*profile_criteria).values(ranking_score=_ranking_score(now or datetime.utcnow())),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    profile_score = db.select(ChefProfile.ranking_score).where(ChefProfile.id == ChefCard.id).scalar_subquery()
+    session.execute(db.update(ChefCard).where(*card_criteria).values(ranking_score=profile_score),
+                    execution_options={'synchronize_session': False})
+    return updated
+
+@scheduled_job('ranking_scores', interval_seconds=3600)
+def refresh_ranking_scores(now=None):
+    """Incremental refresh: rescore chefs with bookings or reviews changed since the last run"""
+    now = now or datetime.utcnow()
+    state = db.session.get(JobState, 'ranking_scores') or JobState(name='ranking_scores')
+    if state.last_run_at is None:
+        updated = update_ranking_scores(db.session, now=now)
+    else:
+        touched_chefs = db.union(
+            db.select(Booking.chef_id).where(Booking.updated_at >= state.last_run_at),
+            db.select(Review.chef_id).where(Review.created_at >= state.last_run_at)
+        )
+        updated = update_ranking_scores(db.session, touched_chefs, now)
+    state.last_run_at = now
+    db.session.add(state)
+    db.session.commit()
+    return {'rows_updated': updated}
+
+@scheduled_job('ranking_scores_nightly', interval_seconds=86400)
+def rebuild_ranking_scores():
+    """Nightly: rescore every chef, since the recency window and site-wide mean move without any write to them"""
+    updated = update_ranking_scores(db.session)
+    db.session.commit()
+    return {'rows_updated': updated}
+
+# Chef cards
+# Browse and home page cards read one ChefCard row per chef instead of joining
+# profiles, users, reviews and menus. Flushes that touch those tables rewrite the
+# affected cards in the same transaction; set-based updates that bypass the ORM
+# must call refresh_chef_cards() themselves. A nightly rebuild repairs any drift.
+CHEF_CARD_COLUMNS = [
+    'id', 'user_id', 'first_name', 'last_name', 'bio_excerpt', 'profile_photo', 'specialties', 'cuisine_types',
+    'service_areas', 'base_price_per_person', 'teaching_price_per_person', 'travel_fee', 'pricing_version',
+    'min_guests', 'max_guests', 'rating', 'total_reviews', 'ranking_score', 'offers_teaching', 'is_available', 'menu_count',
+    'min_menu_price', 'dietary_mask', 'created_at', 'refreshed_at'
+]
+CHEF_CARD_USER_FIELDS = ('first_name', 'last_name')
+
+def _chef_card_select(criteria):
+    menu_count = db.select(db.func.count(Menu.id)).where(Menu.chef_id == ChefProfile.id).scalar_subquery()
+    min_menu_price = db.select(db.func.min(Menu.price_per_person)).where(Menu.chef_id == ChefProfile.id).scalar_subquery()
+    # OR of the menus' masks, one MAX per bit since SQLite has no bit_or()
+    menu_bits = [db.func.max(Menu.dietary_mask.bitwise_and(bit)) for bit in DIETARY_BITS.values()]
+    dietary_mask = db.select(db.func.coalesce(sum(menu_bits[1:], menu_bits[0]), 0))\
+        .where(Menu.chef_id == ChefProfile.id).scalar_subquery()
+    return db.select(
+        ChefProfile.id,
+        ChefProfile.user_id,
+        User.first_name,
+        User.last_name,
+        db.func.substr(db.func.coalesce(ChefProfile.bio, ''), 1, 200),
+        ChefProfile.profile_photo,
+        db.func.coalesce(ChefProfile.specialties, db.literal([], JSONList)),
+        db.func.coalesce(ChefProfile.cuisine_types, db.literal([], JSONList)),
+        db.func.coalesce(ChefProfile.service_areas, db.literal([], JSONList)),
+        ChefProfile.base_price_per_person,
+        ChefProfile.teaching_price_per_person,
+        ChefProfile.travel_fee,
+        ChefProfile.pricing_version,
+        ChefProfile.min_guests,
+        ChefProfile.max_guests,
+        db.func.coalesce(ChefProfile.rating, 0),
+        db.func.coalesce(ChefProfile.total_reviews, 0),
+        db.func.coalesce(ChefProfile.ranking_score, 0),
+        db.func.coalesce(ChefProfile.offers_teaching, False),
+        db.func.coalesce(ChefProfile.is_available, True),
+        menu_count,
+        min_menu_price,
+        dietary_mask,
+        ChefProfile.created_at,
+        db.literal(datetime.utcnow(), db.DateTime)
+    ).join(User, User.id == ChefProfile.user_id).where(*criteria)
+
+def _write_chef_cards(session, profile_ids=None, user_ids=None):
+    """Replace the cards of the given chefs (by profile or user id), or every card when both are None"""
+    card_criteria, profile_criteria = [], []
+    if profile_ids is not None or user_ids is not None:
+        profile_ids, user_ids = list(profile_ids or ()), list(user_ids or ())
+        card_criteria = [db.or_(ChefCard.id.in_(profile_ids), ChefCard.user_id.in_(user_ids))]
+        profile_criteria = [db.or_(ChefProfile.id.in_(profile_ids), ChefProfile.user_id.in_(user_ids))]
+    session.execute(db.delete(ChefCard).where(*card_criteria), execution_options={'synchronize_session': False})
+    return session.execute(db.insert(ChefCard).from_select(CHEF_CARD_COLUMNS, _chef_card_select(profile_criteria))).rowcount
+
+def refresh_chef_cards(profile_ids=None, user_ids=None):
+    """Rewrite chef cards in the current transaction (all of them when no ids are given); returns rows written"""
+    return _write_chef_cards(db.session, profile_ids, user_ids)
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_chef_card_changes(session, flush_context):
+    """Note which chefs' cards and ranking scores this flush made stale"""
+    profile_ids, user_ids = session.info.setdefault('stale_chef_cards', (set(), set()))
+    ranking_user_ids = session.info.setdefault('stale_ranking_scores', set())
+    for obj in list(session.new) + list(session.deleted) + [obj for obj in session.dirty if session.is_modified(obj)]:
+        if isinstance(obj, ChefProfile):
+            profile_ids.add(obj.id)
+            if obj in session.new or db.inspect(obj).attrs.response_time_hours.history.has_changes():
+                ranking_user_ids.add(obj.user_id)
+        elif isinstance(obj, Menu):
+            profile_ids.add(obj.chef_id)
+        elif isinstance(obj, Review):
+            user_ids.add(obj.chef_id)
+            ranking_user_ids.add(obj.chef_id)
+        elif isinstance(obj, Booking):
+            status_changed = db.inspect(obj).attrs.status.history.has_changes()
+            if obj in session.deleted or (status_changed and obj.status in RANKING_DECIDED_STATUSES):
+                ranking_user_ids.add(obj.chef_id)
+        elif isinstance(obj, User) and obj in session.dirty:
+            state = db.inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in CHEF_CARD_USER_FIELDS):
+                user_ids.add(obj.id)
+
+@db.event.listens_for(db.session, 'after_flush_postexec')
+def _refresh_stale_chef_cards(session, flush_context):
+    ranking_user_ids = session.info.pop('stale_ranking_scores', set())
+    if ranking_user_ids:
+        update_ranking_scores(session, list(ranking_user_ids))
+    profile_ids, user_ids = session.info.pop('stale_chef_cards', (set(), set()))
+    if profile_ids or user_ids:
+        _write_chef_cards(session, profile_ids, user_ids)
+
+@scheduled_job('chef_cards_nightly', interval_seconds=86400)
+def rebuild_chef_cards():
+    """Nightly safety net: rebuild every card in case a set-based write skipped a refresh"""
+    written = refresh_chef_cards()
+    db.session.commit()
+    return {'rows_written': written}
+
+@app.cli.command('rebuild-chef-cards')
+def rebuild_chef_cards_command():
+    """Rebuild the chef_card read model from profiles, users and menus"""
+    click.echo(f"Wrote {rebuild_chef_cards()['rows_written']} chef cards")
+
+# Dietary search
+# Browse filters on diets and allergens without reading menu text. Each menu's
+# dietary tags are kept as a bitmask (bit n is DIETARY_CHOICES[n]) and every
+# chef card carries the OR of its menus' masks, so "vegan and gluten-free"
+# is one integer test per card. Ingredients are indexed by term in
+# MenuIngredient; "no nuts" finds the menus containing any nut term through
+# that index and keeps chefs with another menu whose ingredients are listed.
+DIETARY_BITS = {value: 1 << position for position, (value, _) in enumerate(DIETARY_CHOICES)}
+DIETARY_ALIASES = {'plant-based': 'vegan', 'pescetarian': 'pescatarian', 'gf': 'gluten-free',
+                   'lactose-free': 'dairy-free', 'no-nuts': 'nut-free', 'low-carbohydrate': 'low-carb'}
+# Allergens clients can exclude, as ingredient terms (see ingredient_terms())
+ALLERGEN_TERMS = {
+    'nuts': ('nut', 'almond', 'walnut', 'pecan', 'cashew', 'pistachio', 'hazelnut', 'macadamia', 'peanut'),
+    'peanuts': ('peanut',),
+    'dairy': ('milk', 'butter', 'cream', 'cheese', 'yogurt', 'yoghurt', 'ghee', 'paneer', 'kashk'),
+    'gluten': ('wheat', 'flour', 'bread', 'barley', 'rye', 'pasta', 'noodle', 'couscous', 'bulgur', 'semolina'),
+    'eggs': ('egg',),
+    'fish': ('fish', 'salmon', 'tuna', 'cod', 'trout', 'anchovy', 'sardine'),
+    'shellfish': ('shellfish', 'shrimp', 'prawn', 'crab', 'lobster', 'clam', 'mussel', 'oyster', 'scallop'),
+    'soy': ('soy', 'tofu', 'edamame', 'miso', 'tempeh'),
+    'sesame': ('sesame', 'tahini'),
+}
+INGREDIENT_TERM_LENGTH = 50  # MenuIngredient.term
+
+def normalize_dietary_tags(value):
+    """Dietary tags in their DIETARY_CHOICES spelling ("Gluten free" -> "gluten-free"); unknown tags are kept"""
+    tags = ('-'.join(tag.replace('_', ' ').split()) for tag in string_list(value, lower=True))
+    return list(dict.fromkeys(DIETARY_ALIASES.get(tag, tag) for tag in tags))
+
+def dietary_mask(tags):
+    """Bitmask of the known tags among (normalized) tags"""
+    mask = 0
+    for tag in tags or ():
+        mask |= DIETARY_BITS.get(tag, 0)
+    return mask
+
+def ingredient_terms(ingredients):
+    """Index terms for ingredient names: lowercase words, with a plural "s" dropped ("Pine nuts" -> pine, nut)"""
+    terms = set()
+    for ingredient in ingredients or ():
+        for word in re.findall(r'[a-z]+', ingredient.lower()):
+            if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+                word = word[:-1]
+            terms.add(word[:INGREDIENT_TERM_LENGTH])
+    return terms
+
+def excluded_terms(excluded):
+    """Ingredient terms to avoid, from allergen names (ALLERGEN_TERMS keys) or ingredient names"""
+    terms = set()
+    for value in string_list(excluded, lower=True):
+        terms.update(ALLERGEN_TERMS.get(value) or ingredient_terms([value]))
+    return terms
+
+def dietary_criteria(tags=(), excluded=()):
+    """ChefCard filters: a menu tagged with each of tags, and a menu with listed ingredients free of excluded"""
+    criteria = []
+    required = dietary_mask(normalize_dietary_tags(tags))
+    if required:
+        criteria.append(ChefCard.dietary_mask.bitwise_and(required) == required)
+    terms = excluded_terms(excluded)
+    if terms:
+        unsafe_menus = db.select(MenuIngredient.menu_id).where(MenuIngredient.term.in_(sorted(terms)))
+        criteria.append(db.exists().where(
+            Menu.chef_id == ChefCard.id,
+            db.exists().where(MenuIngredient.menu_id == Menu.id),
+            Menu.id.not_in(unsafe_menus)
+        ))
+    return criteria
+
+def _write_menu_ingredients(session, postings):
+    """Replace the index rows of menus in postings ({menu id: terms}, None for a deleted menu)"""
+    session.execute(db.delete(MenuIngredient).where(MenuIngredient.menu_id.in_(list(postings))),
+                    execution_options={'synchronize_session': False})
+    rows = [{'term': term, 'menu_id': menu_id} for menu_id, terms in postings.items() for term in terms or ()]
+    if rows:
+        session.execute(db.insert(MenuIngredient.__table__), rows)
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_menu_ingredient_changes(session, flush_context):
+    """Note the new ingredient terms of menus this flush added, changed or deleted"""
+    postings = session.info.setdefault('stale_menu_ingredients', {})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Menu):
+            continue
+        if obj in session.deleted:
+            postings[obj.id] = None
+        elif obj in session.new or db.inspect(obj).attrs.ingredients.history.has_changes():
+            postings[obj.id] = ingredient_terms(obj.ingredients)
+
+@db.event.listens_for(db.session, 'after_flush_postexec')
+def _refresh_menu_ingredients(session, flush_context):
+    postings = session.info.pop('stale_menu_ingredients', {})
+    if postings:
+        _write_menu_ingredients(session, postings)
+
+def rebuild_dietary_index(batch_size=1000):
+    """Re-normalize every menu's dietary tags and mask and rewrite the ingredient index.
+
+    For rows written without the ORM (seeding, migrations); refresh the chef
+    cards afterwards so they pick up the masks. Returns counts.
+    """
+    db.session.execute(db.delete(MenuIngredient), execution_options={'synchronize_session': False})
+    menus = terms = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Menu.id, Menu.dietary_tags, Menu.ingredients)
+            .where(Menu.id > last_id).order_by(Menu.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        updates, postings = [], {}
+        for menu_id, tags, ingredients in rows:
+            tags = normalize_dietary_tags(tags)
+            updates.append({'id': menu_id, 'dietary_tags': tags, 'dietary_mask': dietary_mask(tags)})
+            postings[menu_id] = ingredient_terms(string_list(ingredients))
+        db.session.execute(db.update(Menu), updates)
+        _write_menu_ingredients(db.session, postings)
+        menus += len(rows)
+        terms += sum(len(menu_terms) for menu_terms in postings.values())
+        last_id = rows[-1].id
+    db.session.commit()
+    return {'menus': menus, 'terms': terms}
+
+@app.cli.command('rebuild-dietary-index')
+def rebuild_dietary_index_command():
+    """Recompute menu dietary masks and the ingredient index, then the chef cards"""
+    counts = rebuild_dietary_index()
+    click.echo(f"Indexed {counts['terms']} ingredient terms over {counts['menus']} menus")
+    click.echo(f"Wrote {rebuild_chef_cards()['rows_written']} chef cards")
+
+# Recommendations
+# "Chefs you might like" lists are computed offline from booking and review
+# history (scoring in recommendations.py) and stored as ranked rows per
+# subject: "client:<user id>" for every client with bookings and
+# "cuisine:<name>" for each cuisine. Pages read a list with one primary-key
+# range lookup joined to chef_card, never touching bookings or reviews.
+RECOMMENDATION_COUNT = 6
+RECOMMENDATION_CHUNK_SIZE = 5000  # Booking rows streamed, and result rows inserted, per batch
+
+def recommended_chefs(subject, limit=RECOMMENDATION_COUNT):
+    """Available chef cards stored for subject, best first"""
+    return ChefCard.query.join(ChefRecommendation, ChefRecommendation.chef_id == ChefCard.id)\
+        .filter(ChefRecommendation.subject == subject, ChefCard.is_available == True)\
+        .order_by(ChefRecommendation.rank).limit(limit).all()
+
+@scheduled_job('recommendations_nightly', interval_seconds=86400)
+def rebuild_recommendations(k=RECOMMENDATION_COUNT):
+    """Recompute every client's and cuisine's top k chefs; returns counts"""
+    from recommendations import (DISLIKED_RATING, OCCASION_WEIGHT, OFFERED_CUISINE_WEIGHT, AffinityMatrix,
+                                 FeatureIndex, interaction_weight, recommend_for_clients, recommend_for_features)
+    
+    def distinct_values(column):
+        values = db.session.execute(db.select(column).where(column.isnot(None)).distinct()).scalars()
+        return {value.strip().lower() for value in values if value.strip()}
+    features = FeatureIndex(sorted(set(BROWSE_CUISINES) | distinct_values(Booking.cuisine_preference)),
+                            sorted(distinct_values(Booking.occasion_type)))
+    
+    chefs = db.session.execute(
+        db.select(ChefProfile.id, ChefProfile.user_id, ChefProfile.cuisine_types, ChefProfile.ranking_score)
+        .where(db.func.coalesce(ChefProfile.is_available, True)).order_by(ChefProfile.id)
+    ).all()
+    chef_rows = {chef.user_id: row for row, chef in enumerate(chefs)}
+    client_rows = {client_id: row for row, client_id in enumerate(
+        db.session.execute(db.select(Booking.client_id).distinct().order_by(Booking.client_id)).scalars())}
+    chef_affinity = AffinityMatrix(len(chefs), len(features))
+    client_affinity = AffinityMatrix(len(client_rows), len(features))
+    
+    offered = [(row, column) for row, chef in enumerate(chefs)
+               for column in map(features.cuisine, chef.cuisine_types or []) if column is not None]
+    chef_affinity.add([row for row, _ in offered], [column for _, column in offered], [OFFERED_CUISINE_WEIGHT] * len(offered))
+    
+    excluded = {}
+    history = db.select(Booking.client_id, Booking.chef_id, Booking.cuisine_preference, Booking.occasion_type,
+                        Booking.status, Review.rating)\
+        .outerjoin(Review, Review.booking_id == Booking.id).order_by(Booking.id)
+    for rows in iter_export_chunks(history, RECOMMENDATION_CHUNK_SIZE):
+        clients, chef_indices, columns, weights = [], [], [], []
+        for client_id, chef_user_id, cuisine, occasion, status, rating in rows:
+            chef_row = chef_rows.get(chef_user_id)
+            if rating is not None and rating <= DISLIKED_RATING and chef_row is not None:
+                excluded.setdefault(client_rows[client_id], []).append(chef_row)
+            weight = interaction_weight(status, rating)
+            for column, scale in ((features.cuisine(cuisine), 1.0), (features.occasion(occasion), OCCASION_WEIGHT)):
+                if column is not None and weight > 0:
+                    clients.append(client_rows[client_id])
+                    chef_indices.append(chef_row)
+                    columns.append(column)
+                    weights.append(weight * scale)
+        client_affinity.add(clients, columns, weights)
+        served = [i for i, chef_row in enumerate(chef_indices) if chef_row is not None]
+        chef_affinity.add([chef_indices[i] for i in served], [columns[i] for i in served], [weights[i] for i in served])
+    
+    chef_vectors = chef_affinity.normalized()
+    quality = [(chef.ranking_score or 0) / 100 for chef in chefs]
+    client_ids = {row: client_id for client_id, row in client_rows.items()}
+    
+    db.session.execute(db.delete(ChefRecommendation))
+    batch, written = [], 0
+    def flush():
+        nonlocal written
+        if batch:
+            db.session.execute(db.insert(ChefRecommendation), batch)
+            written += len(batch)
+            batch.clear()
+    def write(subject, indices, scores):
+        batch.extend({'subject': subject, 'rank': rank, 'chef_id': chefs[index].id, 'score': float(score)}
+                     for rank, (index, score) in enumerate(zip(indices, scores), start=1))
+        if len(batch) >= RECOMMENDATION_CHUNK_SIZE:
+            flush()
+    
+    clients_written = 0
+    for row, indices, scores in recommend_for_clients(client_affinity.normalized(), chef_vectors, quality, k, excluded):
+        write(f'client:{client_ids[row]}', indices, scores)
+        clients_written += 1
+    cuisines = features.cuisine_columns()
+    by_column = recommend_for_features(chef_vectors, quality, [column for _, column in cuisines], k)
+    for name, column in cuisines:
+        write(f'cuisine:{name}', *by_column[column])
+    flush()
+    db.session.commit()
+    return {'clients': clients_written, 'cuisines': len(cuisines), 'rows_written': written}
+
+@app.cli.command('rebuild-recommendations')
+def rebuild_recommendations_command():
+    """Recompute the "chefs you might like" lists (needs numpy)"""
+    result = rebuild_recommendations()
+    click.echo(f"Wrote {result['rows_written']} recommendations for {result['clients']} clients and {result['cuisines']} cuisines")
+
+# Reporting
+# Daily booking totals are pre-aggregated into BookingRollup so admin reports
+# never GROUP BY over raw bookings. Rows are keyed by the day a booking was
+# requested; GMV and fees only count bookings that were accepted.
+REVENUE_STATUSES = ('confirmed', 'completed')
+
+def _rollup_dimension_value(column):
+    return db.func.coalesce(db.func.nullif(column, ''), 'unspecified')
+
+ROLLUP_DIMENSIONS = {
+    'all': None,
+    'cuisine': _rollup_dimension_value(Booking.cuisine_preference),
+    'occasion': _rollup_dimension_value(Booking.occasion_type),
+    'chef': db.cast(Booking.chef_id, db.String),
+}
+
+def _replace_rollups(booking_criteria, rollup_criteria):
+    """Delete the rollup rows matching rollup_criteria and recompute them from bookings.
+
+    One INSERT ... SELECT per dimension; returns the number of rows written.
+    """
+    db.session.execute(db.delete(BookingRollup).where(*rollup_criteria), execution_options={'synchronize_session': False})
+
+    booking_day = db.func.date(Booking.created_at)
+    accepted = Booking.status.in_(REVENUE_STATUSES)
+    def accepted_sum(column):
+        return db.func.coalesce(db.func.sum(db.case((accepted, column), else_=0)), 0)
+
+    written = 0
+    refreshed_at = datetime.utcnow()
+    for dimension, value in ROLLUP_DIMENSIONS.items():
+        group_by = [booking_day] if value is None else [booking_day, value]
+        select = db.select(
+            booking_day,
+            db.literal(dimension),
+            db.literal('') if value is None else value,
+            db.func.count(Booking.id),
+            db.func.sum(db.case((accepted, 1), else_=0)),
+            accepted_sum(Booking.total_price),
+            accepted_sum(Booking.platform_fee),
+            accepted_sum(Booking.service_fee),
+            db.literal(refreshed_at, db.DateTime)
+        ).where(*booking_criteria).group_by(*group_by)
+        stmt = db.insert(BookingRollup).from_select(
+            ['day', 'dimension', 'dimension_value', 'bookings', 'confirmed_bookings',
+             'gmv', 'platform_fee', 'service_fee', 'refreshed_at'],
+            select
+        )
+        written += db.session.execute(stmt).rowcount
+    return written
+
+def rebuild_booking_rollups(start_day=None, end_day=None):
+    """Recompute rollups for every day in [start_day, end_day]; open-ended bounds cover all history"""
+    booking_criteria, rollup_criteria = [], []
+    if start_day:
+        booking_criteria.append(Booking.created_at >= datetime.combine(start_day, datetime.min.time()))
+        rollup_criteria.append(BookingRollup.day >= start_day)
+    if end_day:
+        booking_criteria.append(Booking.created_at < datetime.combine(end_day + timedelta(days=1), datetime.min.time()))
+        rollup_criteria.append(BookingRollup.day <= end_day)
+    written = _replace_rollups(booking_criteria, rollup_criteria)
+    db.session.commit()
+    return written
+
+@scheduled_job('booking_rollups', interval_seconds=900)
+def refresh_booking_rollups(now=None):
+    """Incremental refresh: recompute only the days with bookings changed since the last run"""
+    now = now or datetime.utcnow()
+    state = db.session.get(JobState, 'booking_rollups') or JobState(name='booking_rollups')
+    if state.last_run_at is None:
+        written = _replace_rollups([], [])
+    else:
+        touched_days = db.select(db.func.date(Booking.created_at))\
+            .where(Booking.updated_at >= state.last_run_at)\
+            .distinct()
+        written = _replace_rollups([db.func.date(Booking.created_at).in_(touched_days)],
+                                   [BookingRollup.day.in_(touched_days)])
+    state.last_run_at = now
+    db.session.add(state)
+    db.session.commit()
+    return {'rows_written': written}
+
+@scheduled_job('booking_rollups_nightly', interval_seconds=86400)
+def rebuild_recent_booking_rollups(days=7):
+    """Nightly safety net: rebuild the trailing week in case an incremental run missed a change"""
+    today = datetime.utcnow().date()
+    return {'rows_written': rebuild_booking_rollups(today - timedelta(days=days - 1), today)}
+
+@app.cli.command('backfill-rollups')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to rebuild (default: all history).')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day to rebuild (default: today).')
+def backfill_rollups(start, end):
+    """Rebuild booking rollups from raw bookings"""
+    written = rebuild_booking_rollups(start.date() if start else None, end.date() if end else None)
+    click.echo(f"Wrote {written} booking rollup rows")
+
+# Data export
+# Exports stream rows through a server-side cursor (yield_per) and are written
+# out one chunk at a time, so memory use does not grow with the table size.
+EXPORTS = {
+    'bookings': lambda: db.select(
+        Booking.id, Booking.created_at, Booking.event_date, Booking.event_time, Booking.status,
+        Booking.payment_status, Booking.client_id, Booking.chef_id, Booking.menu_id, Booking.guest_count,
+        Booking.service_type, Booking.cuisine_preference, Booking.occasion_type,
+        Booking.total_price, Booking.service_fee, Booking.platform_fee
+    ).order_by(Booking.id),
+    'reviews': lambda: db.select(
+        Review.id, Review.created_at, Review.booking_id, Review.client_id, Review.chef_id, Review.rating,
+        Review.food_quality, Review.professionalism, Review.cleanliness, Review.communication,
+        Review.value_for_money, Review.comment
+    ).order_by(Review.id),
+    'chefs': lambda: db.select(
+        ChefProfile.id, ChefProfile.user_id, User.first_name, User.last_name, User.email,
+        ChefProfile.experience_years, ChefProfile.base_price_per_person, ChefProfile.teaching_price_per_person,
+        ChefProfile.travel_fee, ChefProfile.service_areas, ChefProfile.rating, ChefProfile.total_reviews,
+        ChefProfile.offers_teaching, ChefProfile.is_available, ChefProfile.created_at
+    ).join(User, User.id == ChefProfile.user_id).order_by(ChefProfile.id),
+}
+EXPORT_CHUNK_SIZE = 1000
+
+def iter_export_chunks(stmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of at most chunk_size rows from a server-side cursor"""
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield partition
+
+def iter_export_csv(name, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generate an export as CSV text, one chunk of rows per yielded string"""
+    stmt = EXPORTS[name]()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    def drain():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+    
+    writer.writerow(stmt.selected_columns.keys())
+    yield drain()
+    for rows in iter_export_chunks(stmt, chunk_size):
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield drain()
+
+def _csv_value(value):
+    """Write JSON list columns as JSON text rather than Python reprs"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+def _arrow_type(pa, column):
+    """Map a SQLAlchemy column type to a fixed Arrow type so every chunk shares one schema"""
+    sql_type = column.type
+    if isinstance(sql_type, db.Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, db.Integer):
+        return pa.int64()
+    if isinstance(sql_type, db.Numeric):
+        return pa.decimal128(sql_type.precision or 12, sql_type.scale or 2)
+    if isinstance(sql_type, db.DateTime):
+        return pa.timestamp('us')
+    if isinstance(sql_type, db.Date):
+        return pa.date32()
+    if isinstance(sql_type, db.Time):
+        return pa.time64('us')
+    if isinstance(sql_type, db.JSON):
+        return pa.list_(pa.string())  # JSONList columns
+    return pa.string()
+
+def write_export_parquet(name, sink, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write an export to a binary file-like sink as Parquet.
+
+    A generator: each chunk is written as its own row group and control returns
+    to the caller after every one, so the output can be flushed as it grows.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export requires the pyarrow package')
+
+    stmt = EXPORTS[name]()
+    schema = pa.schema([(column.key, _arrow_type(pa, column)) for column in stmt.selected_columns])
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in iter_export_chunks(stmt, chunk_size):
+            writer.write_batch(pa.RecordBatch.from_pylist([dict(row._mapping) for row in rows], schema=schema))
+            yield
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def iter_export_parquet(name, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generate an export as Parquet bytes, flushing each row group as it is written"""
+    sink = _ChunkSink()
+    for _ in write_export_parquet(name, sink, chunk_size):
+        data = sink.drain()
+        if data:
+            yield data
+    yield sink.drain()
+
+@app.cli.command('export-data')
+@click.argument('name', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'export_format', type=click.Choice(['csv', 'parquet']), default='csv', show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='File to write (default: stdout for CSV).')
+@click.option('--chunk-size', default=EXPORT_CHUNK_SIZE, show_default=True, help='Rows fetched and written per chunk.')
+def export_data(name, export_format, output, chunk_size):
+    """Stream bookings, reviews or chefs to CSV or Parquet"""
+    if export_format == 'parquet':
+        if not output:
+            raise click.UsageError('--output is required for Parquet exports')
+        with open(output, 'wb') as sink:
+            for _ in write_export_parquet(name, sink, chunk_size):
+                pass
+        return
+
+    with click.open_file(output or '-', 'w') as sink:
+        for text in iter_export_csv(name, chunk_size):
+            sink.write(text)
+
+# Warm-up
+# warm_up() compiles every template, configures the ORM mappers and builds the
+# URL matcher so the first requests after a deploy or worker recycle do not pay
+# for it. With gunicorn's preload_app it runs once in the master before fork
+# (see gunicorn.conf.py) and workers share the result copy-on-write; anywhere
+# else /readyz starts it on first probe. A failed attempt is logged and
+# reported by /readyz, and the next probe starts another. Reference lists live
+# here as module-level tuples for the same reason.
+BROWSE_CUISINES = ('persian', 'indian', 'chinese', 'italian', 'french', 'mexican', 'japanese', 'thai',
+                   'mediterranean', 'american', 'filipino', 'korean', 'vietnamese')
+BROWSE_LOCATIONS = ('Metrotown', 'Brentwood', 'Edmonds', 'Lougheed', 'Burnaby Heights', 'Deer Lake', 'Highgate', 'Kingsway')
+
+warmup_state = {'started': False, 'ready': False}
+_warmup_lock = threading.Lock()
+
+def warm_up():
+    """Do the lazy first-request work now; returns warmup_state"""
+    with _warmup_lock:
+        if warmup_state['ready']:
+            return warmup_state
+        warmup_state['started'] = True
+        started = time.perf_counter()
+        try:
+            templates = app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+            for name in templates:
+                app.jinja_env.get_template(name)
+            db.configure_mappers()
+            app.url_map.update()
+        except Exception as e:
+            # Let the next /readyz probe retry instead of reporting 'warming' forever
+            app.logger.exception(f"Warm-up failed: {e}")
+            warmup_state.update(started=False, error=f"{type(e).__name__}: {e}")
+            return warmup_state
+        warmup_state.pop('error', None)
+        warmup_state.update(
+            ready=True,
+            templates=len(templates),
+            seconds=round(time.perf_counter() - started, 3),
+            pid=os.getpid(),
+        )
+    app.logger.info(f"Warm-up compiled {len(templates)} templates in {warmup_state['seconds']}s")
+    return warmup_state
 
-# Utility functions
-def save_uploaded_file(file, folder):
-    """Save uploaded file and return filename"""
-    if file and file.filename:
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = timestamp + filename
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], folder, filename)
-        file.save(filepath)
-        return filename
-    return None
+def start_warm_up():
+    """Run warm_up() in the background unless it has already started"""
+    with _warmup_lock:
+        if warmup_state['started']:
+            return
+        warmup_state['started'] = True
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
 
-def resize_image(filepath, max_size=(800, 600)):
-    """Resize image to max_size while maintaining aspect ratio"""
-    try:
-        with Image.open(filepath) as img:
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            img.save(filepath, optimize=True, quality=85)
-    except Exception as e:
-        print(f"Error resizing image: {e}")
+# Readiness
+# /readyz tells load balancers whether to send this worker traffic: warm-up has
+# finished, the database answers SELECT 1 within READINESS_TIMEOUT_SECONDS and
+# it has been migrated to SCHEMA_VERSION. The database check borrows one pooled
+# connection on a background thread, so a hung checkout cannot hold the probe
+# past the timeout, and its result is reused for READINESS_CACHE_SECONDS so
+# frequent probes cost one query per worker every few seconds. /healthz only
+# says the process is serving requests and touches nothing else.
+SCHEMA_VERSION = 6  # Bump with each step added to /migrate-db and migrate_production.py
 
-def calculate_booking_total(chef_profile, guest_count, menu_price=None):
-    """Calculate total booking cost including fees"""
-    if menu_price:
-        base_price = menu_price * guest_count
-    else:
-        base_price = chef_profile.base_price_per_person * guest_count
-    
-    travel_fee = chef_profile.travel_fee or 0
-    service_fee = base_price * 0.1  # 10% service fee
-    platform_fee = base_price * 0.15  # 15% platform fee
-    
-    total = base_price + travel_fee + service_fee + platform_fee
-    return {
-        'base_price': base_price,
-        'travel_fee': travel_fee,
-        'service_fee': service_fee,
-        'platform_fee': platform_fee,
-        'total': total
-    }
+_readiness_cache = {'checked_at': None, 'result': None}
+_readiness_lock = threading.Lock()
+_readiness_executor = None
+_readiness_probe = None
+
+def stamp_schema_version(version=SCHEMA_VERSION):
+    """Record that the database has every migration up to version"""
+    if db.session.get(SchemaMigration, version) is None:
+        db.session.add(SchemaMigration(version=version))
+        db.session.commit()
+
+def _probe_database(timeout):
+    """SELECT 1 on a pooled connection; returns the migrated schema version (None if unstamped)"""
+    with app.app_context(), db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(db.text(f"SET LOCAL statement_timeout = {int(timeout * 1000)}"))
+        conn.execute(db.text('SELECT 1'))
+        try:
+            return conn.execute(db.select(db.func.max(SchemaMigration.version))).scalar()
+        except DBAPIError:
+            return None  # No schema_migration table: /migrate-db has never run
+
+def check_database_readiness():
+    """The cached result of the /readyz database check, as a dict with 'ok'"""
+    global _readiness_executor, _readiness_probe
+    timeout = app.config['READINESS_TIMEOUT_SECONDS']
+    with _readiness_lock:
+        now = time.monotonic()
+        checked_at = _readiness_cache['checked_at']
+        if checked_at is not None and now - checked_at < app.config['READINESS_CACHE_SECONDS']:
+            return _readiness_cache['result']
+        # A probe still stuck from an earlier timeout is waited on again rather than queued behind
+        if _readiness_probe is None or _readiness_probe.done():
+            if _readiness_executor is None:
+                _readiness_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='readyz')
+            _readiness_probe = _readiness_executor.submit(_probe_database, timeout)
+        try:
+            version = _readiness_probe.result(timeout=timeout)
+        except FutureTimeout:
+            result = {'ok': False, 'database': f'no answer within {timeout}s'}
+        except Exception as e:
+            app.logger.warning(f"Readiness database check failed: {e}")
+            result = {'ok': False, 'database': 'unreachable'}
+        else:
+            result = {
+                'ok': version is not None and version >= SCHEMA_VERSION,
+                'database': 'ok',
+                'schema_version': version,
+                'expected_schema_version': SCHEMA_VERSION
+            }
+        _readiness_cache.update(checked_at=time.monotonic(), result=result)
+        return result
 
 # Routes
 @app.route('/')
+@read_only_view
 def index():
     """Home page with optimized queries"""
     try:
-        # Optimized query with eager loading
-        featured_chefs = ChefProfile.query.filter_by(is_available=True)\
-            .options(db.joinedload(ChefProfile.user))\
-            .order_by(ChefProfile.rating.desc())\
-            .limit(6).all()
+        # Clients see their precomputed recommendations; everyone else the best-ranked chefs
+        featured_chefs = []
+        if current_user.is_authenticated and current_user.role == 'client':
+            featured_chefs = recommended_chefs(f'client:{current_user.id}')
+        personalized = bool(featured_chefs)
+        if not personalized:
+            featured_chefs = ChefCard.query.filter_by(is_available=True)\
+                .order_by(ChefCard.ranking_score.desc())\
+                .limit(6).all()
         
         # Optimized reviews query
         recent_reviews = Review.query\
-            .options(db.joinedload(Review.client), db.joinedload(Review.chef_reviewed))\
+            .options(db.joinedload(Review.reviewer), db.joinedload(Review.chef_reviewed))\
             .order_by(Review.created_at.desc())\
             .limit(3).all()
             
@@ -381,11 +2643,14 @@ def index():
     except Exception as e:
         app.logger.error(f"Database query error: {e}")
         featured_chefs = []
+        personalized = False
         recent_reviews = []
     
-    return render_template('index.html', featured_chefs=featured_chefs, recent_reviews=recent_reviews)
+    return render_template('index.html', featured_chefs=featured_chefs, personalized=personalized, recent_reviews=recent_reviews)
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit('login_ip')
+@rate_limit('login_account', scope='account')
 def login():
     """User login"""
     if current_user.is_authenticated:
@@ -395,6 +2660,8 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data):
+            if password_hasher.needs_rehash(user.password_hash):
+                user.set_password(form.password.data)  # Hash settings changed since this password was set
             login_user(user, remember=form.remember_me.data)
             user.last_login = datetime.utcnow()
             db.session.commit()
@@ -408,6 +2675,7 @@ def login():
     return render_template('auth/login.html', form=form)
 
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limit('register_ip')
 def register():
     """User registration"""
     if current_user.is_authenticated:
@@ -437,6 +2705,8 @@ def register():
         
         return render_template('auth/register.html', form=form)
         
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
         print(f"Registration error: {e}")
         import traceback
@@ -475,19 +2745,16 @@ def client_dashboard():
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    upcoming_bookings = Booking.query.filter_by(
-        client_id=current_user.id,
-        status='confirmed'
-    ).filter(Booking.event_date >= datetime.now().date()).order_by(Booking.event_date).all()
-    
-    past_bookings = Booking.query.filter_by(
-        client_id=current_user.id,
-        status='completed'
-    ).order_by(Booking.event_date.desc()).limit(5).all()
+    upcoming_bookings, upcoming_after = get_booking_page(current_user, 'upcoming')
+    past_bookings, past_after = get_booking_page(current_user, 'past')
     
     return render_template('client/dashboard.html', 
+                         counts=get_booking_counts(current_user),
+                         recommended_chefs=recommended_chefs(f'client:{current_user.id}'),
                          upcoming_bookings=upcoming_bookings,
-                         past_bookings=past_bookings)
+                         upcoming_after=upcoming_after,
+                         past_bookings=past_bookings,
+                         past_after=past_after)
 
 @app.route('/chef/dashboard')
 @login_required
@@ -502,24 +2769,31 @@ def chef_dashboard():
         flash('Please complete your chef profile first', 'warning')
         return redirect(url_for('chef_profile'))
     
-    upcoming_bookings = Booking.query.filter_by(
-        chef_id=current_user.id,
-        status='confirmed'
-    ).filter(Booking.event_date >= datetime.now().date()).order_by(Booking.event_date).all()
+    upcoming_bookings, upcoming_after = get_booking_page(current_user, 'upcoming')
+    pending_requests, pending_after = get_booking_page(current_user, 'pending')
     
-    pending_requests = Booking.query.filter_by(
-        chef_id=current_user.id,
-        status='pending'
-    ).order_by(Booking.created_at.desc()).all()
-    
-    recent_reviews = Review.query.filter_by(chef_id=current_user.id).order_by(Review.created_at.desc()).limit(5).all()
+    recent_reviews = Review.query.options(db.joinedload(Review.reviewer))\
+        .filter_by(chef_id=current_user.id).order_by(Review.created_at.desc()).limit(5).all()
     
     return render_template('chef/dashboard.html',
                          chef_profile=chef_profile,
+                         counts=get_booking_counts(current_user),
                          upcoming_bookings=upcoming_bookings,
+                         upcoming_after=upcoming_after,
                          pending_requests=pending_requests,
+                         pending_after=pending_after,
                          recent_reviews=recent_reviews)
 
+@app.route('/dashboard/bookings/<list_name>')
+@login_required
+def dashboard_bookings(list_name):
+    """Next page of a dashboard booking list as a server-rendered fragment"""
+    if list_name not in BOOKING_LISTS or current_user.role not in ('client', 'chef'):
+        abort(404)
+    
+    bookings, next_after = get_booking_page(current_user, list_name, after=request.args.get('after'))
+    return render_template('bookings/_booking_cards.html', list_name=list_name, bookings=bookings, next_after=next_after)
+
 @app.route('/chef/profile', methods=['GET', 'POST'])
 @login_required
 def chef_profile():
@@ -538,6 +2812,7 @@ def chef_profile():
         
         chef_profile.bio = form.bio.data
         chef_profile.specialties = form.specialties.data
+        chef_profile.cuisine_types = form.cuisine_types.data
         chef_profile.experience_years = form.experience_years.data
         chef_profile.certifications = form.certifications.data
         chef_profile.service_areas = form.service_areas.data
@@ -545,15 +2820,16 @@ def chef_profile():
         chef_profile.min_guests = form.min_guests.data
         chef_profile.max_guests = form.max_guests.data
         chef_profile.travel_fee = form.travel_fee.data or 0
+        bump_pricing_version(chef_profile)
         
         # Handle file uploads
-        if form.profile_photo.data:
-            filename = save_uploaded_file(form.profile_photo.data, 'profiles')
+        if form.profile_photo.data or form.profile_photo_upload.data:
+            filename = uploaded_photo(form.profile_photo.data, form.profile_photo_upload.data, 'profiles')
             if filename:
                 chef_profile.profile_photo = filename
         
-        if form.cover_photo.data:
-            filename = save_uploaded_file(form.cover_photo.data, 'profiles')
+        if form.cover_photo.data or form.cover_photo_upload.data:
+            filename = uploaded_photo(form.cover_photo.data, form.cover_photo_upload.data, 'profiles')
             if filename:
                 chef_profile.cover_photo = filename
         
@@ -566,10 +2842,11 @@ def chef_profile():
     # Pre-populate form if profile exists
     if chef_profile:
         form.bio.data = chef_profile.bio
-        form.specialties.data = chef_profile.specialties
+        form.specialties.data = ', '.join(chef_profile.specialties or [])
+        form.cuisine_types.data = chef_profile.cuisine_types or []
         form.experience_years.data = chef_profile.experience_years
-        form.certifications.data = chef_profile.certifications
-        form.service_areas.data = chef_profile.service_areas
+        form.certifications.data = ', '.join(chef_profile.certifications or [])
+        form.service_areas.data = ', '.join(chef_profile.service_areas or [])
         form.base_price_per_person.data = chef_profile.base_price_per_person
         form.min_guests.data = chef_profile.min_guests
         form.max_guests.data = chef_profile.max_guests
@@ -577,7 +2854,232 @@ def chef_profile():
     
     return render_template('chef/profile.html', form=form, chef_profile=chef_profile)
 
+def _chef_menu_or_redirect(menu_id):
+    """(chef_profile, menu) when the current chef owns menu_id, else (None, redirect response)"""
+    chef_profile = current_user.chef_profile if current_user.role == 'chef' else None
+    if not chef_profile:
+        flash('Access denied', 'error')
+        return None, redirect(url_for('dashboard'))
+    
+    menu = Menu.query.get_or_404(menu_id)
+    if menu.chef_id != chef_profile.id:
+        flash('Access denied', 'error')
+        return None, redirect(url_for('chef_menus'))
+    return chef_profile, menu
+
+def _apply_menu_form(menu, form):
+    menu.name = form.name.data
+    menu.description = form.description.data
+    menu.price_per_person = form.price_per_person.data
+    menu.course_count = form.course_count.data
+    menu.prep_time_hours = form.prep_time_hours.data
+    menu.dietary_tags = form.dietary_tags.data
+    menu.ingredients = form.ingredients.data
+    menu.is_featured = form.is_featured.data
+
+@app.route('/chef/menus')
+@login_required
+def chef_menus():
+    """A chef's menus"""
+    chef_profile = current_user.chef_profile if current_user.role == 'chef' else None
+    if not chef_profile:
+        flash('Please complete your chef profile first', 'warning')
+        return redirect(url_for('chef_profile') if current_user.role == 'chef' else url_for('dashboard'))
+    
+    return render_template('chef/menus.html', chef_profile=chef_profile, menus=get_menu_catalog(chef_profile))
+
+@app.route('/chef/menus/new', methods=['GET', 'POST'])
+@login_required
+def create_menu():
+    """Create a menu"""
+    chef_profile = current_user.chef_profile if current_user.role == 'chef' else None
+    if not chef_profile:
+        flash('Please complete your chef profile first', 'warning')
+        return redirect(url_for('dashboard'))
+    
+    form = MenuForm()
+    if form.validate_on_submit():
+        menu = Menu(chef_id=chef_profile.id)
+        _apply_menu_form(menu, form)
+        db.session.add(menu)
+        bump_menu_version(chef_profile)
+        db.session.commit()
+        
+        flash('Menu created! Add its dishes and photos below.', 'success')
+        return redirect(url_for('edit_menu', menu_id=menu.id))
+    
+    return render_template('chef/menu_form.html', form=form, menu=None)
+
+@app.route('/chef/menus/<int:menu_id>/edit', methods=['GET', 'POST'])
+@login_required
+def edit_menu(menu_id):
+    """Edit a menu, its dishes and its photos"""
+    chef_profile, menu = _chef_menu_or_redirect(menu_id)
+    if not chef_profile:
+        return menu
+    
+    form = MenuForm(obj=menu)
+    if request.method == 'GET':
+        form.ingredients.data = ', '.join(menu.ingredients or [])
+    if form.validate_on_submit():
+        price_changed = to_money(form.price_per_person.data) != to_money(menu.price_per_person)
+        _apply_menu_form(menu, form)
+        bump_menu_version(chef_profile, price_changed=price_changed)
+        db.session.commit()
+        
+        flash('Menu updated!', 'success')
+        return redirect(url_for('edit_menu', menu_id=menu.id))
+    
+    return render_template('chef/menu_form.html', form=form, menu=menu,
+                         item_form=MenuItemForm(formdata=None), photo_form=MenuPhotoForm(formdata=None))
+
+@app.route('/chef/menus/<int:menu_id>/delete', methods=['POST'])
+@login_required
+def delete_menu(menu_id):
+    """Delete a menu that no booking refers to"""
+    chef_profile, menu = _chef_menu_or_redirect(menu_id)
+    if not chef_profile:
+        return menu
+    
+    if db.session.query(Booking.query.filter_by(menu_id=menu.id).exists()).scalar():
+        flash('This menu has bookings and cannot be deleted. Remove it from your profile by editing it instead.', 'error')
+        return redirect(url_for('edit_menu', menu_id=menu.id))
+    
+    db.session.delete(menu)
+    bump_menu_version(chef_profile, price_changed=True)
+    db.session.commit()
+    
+    flash('Menu deleted', 'success')
+    return redirect(url_for('chef_menus'))
+
+@app.route('/chef/menus/<int:menu_id>/items', methods=['POST'])
+@login_required
+def add_menu_item(menu_id):
+    """Add a dish to a menu"""
+    chef_profile, menu = _chef_menu_or_redirect(menu_id)
+    if not chef_profile:
+        return menu
+    
+    form = MenuItemForm()
+    if form.validate_on_submit():
+        db.session.add(MenuItem(
+            menu_id=menu.id,
+            course_type=form.course_type.data,
+            name=form.name.data,
+            description=form.description.data,
+            order=form.order.data or 0
+        ))
+        bump_menu_version(chef_profile)
+        db.session.commit()
+        flash('Dish added', 'success')
+    else:
+        flash('Please check the dish details', 'error')
+    return redirect(url_for('edit_menu', menu_id=menu.id))
+
+@app.route('/chef/menus/<int:menu_id>/items/<int:item_id>/delete', methods=['POST'])
+@login_required
+def delete_menu_item(menu_id, item_id):
+    """Remove a dish from a menu"""
+    chef_profile, menu = _chef_menu_or_redirect(menu_id)
+    if not chef_profile:
+        return menu
+    
+    item = MenuItem.query.filter_by(id=item_id, menu_id=menu.id).first_or_404()
+    db.session.delete(item)
+    bump_menu_version(chef_profile)
+    db.session.commit()
+    
+    flash('Dish removed', 'success')
+    return redirect(url_for('edit_menu', menu_id=menu.id))
+
+@app.route('/chef/menus/<int:menu_id>/photos', methods=['POST'])
+@login_required
+def add_menu_photo(menu_id):
+    """Upload a menu photo"""
+    chef_profile, menu = _chef_menu_or_redirect(menu_id)
+    if not chef_profile:
+        return menu
+    
+    form = MenuPhotoForm()
+    filename = None
+    if form.validate_on_submit():
+        filename = uploaded_photo(form.photo.data, form.photo_upload.data, 'menus', max_size=(800, 600))
+    if not filename:
+        flash('Please choose a JPG or PNG photo', 'error')
+        return redirect(url_for('edit_menu', menu_id=menu.id))
+    
+    if form.is_primary.data:
+        MenuPhoto.query.filter_by(menu_id=menu.id).update({'is_primary': False})
+    db.session.add(MenuPhoto(menu_id=menu.id, photo_url=filename, caption=form.caption.data, is_primary=form.is_primary.data))
+    bump_menu_version(chef_profile)
+    db.session.commit()
+    
+    flash('Photo uploaded', 'success')
+    return redirect(url_for('edit_menu', menu_id=menu.id))
+
+@app.route('/chef/menus/<int:menu_id>/photos/<int:photo_id>/primary', methods=['POST'])
+@login_required
+def set_primary_menu_photo(menu_id, photo_id):
+    """Make a photo the menu's cover"""
+    chef_profile, menu = _chef_menu_or_redirect(menu_id)
+    if not chef_profile:
+        return menu
+    
+    photo = MenuPhoto.query.filter_by(id=photo_id, menu_id=menu.id).first_or_404()
+    MenuPhoto.query.filter(MenuPhoto.menu_id == menu.id, MenuPhoto.id != photo.id).update({'is_primary': False})
+    photo.is_primary = True
+    bump_menu_version(chef_profile)
+    db.session.commit()
+    
+    flash('Cover photo updated', 'success')
+    return redirect(url_for('edit_menu', menu_id=menu.id))
+
+@app.route('/chef/menus/<int:menu_id>/photos/<int:photo_id>/delete', methods=['POST'])
+@login_required
+def delete_menu_photo(menu_id, photo_id):
+    """Remove a menu photo"""
+    chef_profile, menu = _chef_menu_or_redirect(menu_id)
+    if not chef_profile:
+        return menu
+    
+    photo = MenuPhoto.query.filter_by(id=photo_id, menu_id=menu.id).first_or_404()
+    db.session.delete(photo)
+    bump_menu_version(chef_profile)
+    db.session.commit()
+    
+    flash('Photo removed', 'success')
+    return redirect(url_for('edit_menu', menu_id=menu.id))
+
+@app.route('/uploads/sign', methods=['POST'])
+@login_required
+@rate_limit('upload_user', scope='user')
+def sign_upload():
+    """Signed target for uploading a chef photo straight to storage"""
+    if current_user.role != 'chef':
+        return jsonify({'error': 'Only chefs can upload photos'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        target = sign_direct_upload(str(data.get('folder', '')), str(data.get('filename', '')),
+                                    str(data.get('content_type', '')), int(data.get('size') or 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(target)
+
+@app.route('/uploads/direct/<token>', methods=['PUT'])
+@login_required
+def upload_direct(token):
+    """Receive a signed direct upload when storage cannot take it itself (local files)"""
+    try:
+        upload = _upload_serializer().loads(token, max_age=app.config['DIRECT_UPLOAD_EXPIRES_SECONDS'])
+    except BadSignature:
+        abort(403)
+    if upload['user_id'] != current_user.id or request.content_length != upload['size']:
+        abort(403)
+    upload_storage.save(f"{upload['folder']}/{upload['filename']}", request.stream, upload['content_type'])
+    return '', 204
+
 @app.route('/chefs')
+@read_only_view
 def browse_chefs():
     """Browse all chefs with advanced filtering"""
     page = request.args.get('page', 1, type=int)
@@ -587,50 +3089,64 @@ def browse_chefs():
     rating_min = request.args.get('rating_min', type=float)
     location_filter = request.args.get('location', '')
     service_type_filter = request.args.get('service_type', '')
-    sort_by = request.args.get('sort', 'rating')  # rating, price_low, price_high, newest
+    dietary_filter = [tag for tag in request.args.getlist('diet') if tag in DIETARY_BITS]
+    exclude_filter = [allergen for allergen in request.args.getlist('exclude') if allergen in ALLERGEN_TERMS]
+    sort_by = request.args.get('sort', 'best')  # best, rating, price_low, price_high, newest
+    guests = min(max(request.args.get('guests', 4, type=int), 1), 50)
     
-    query = ChefProfile.query.filter_by(is_available=True)
+    query = ChefCard.query.filter_by(is_available=True)
     
     # Cuisine filtering
     if cuisine_filter:
-        query = query.filter(ChefProfile.specialties.contains(cuisine_filter))
+        query = query.filter(json_list_contains(ChefCard.cuisine_types, cuisine_filter.lower()))
     
     # Price filtering
     if price_min:
-        query = query.filter(ChefProfile.base_price_per_person >= price_min)
+        query = query.filter(ChefCard.base_price_per_person >= price_min)
     
     if price_max:
-        query = query.filter(ChefProfile.base_price_per_person <= price_max)
+        query = query.filter(ChefCard.base_price_per_person <= price_max)
     
     # Rating filtering
     if rating_min:
-        query = query.filter(ChefProfile.rating >= rating_min)
+        query = query.filter(ChefCard.rating >= rating_min)
     
     # Location filtering (service areas)
     if location_filter:
-        query = query.filter(ChefProfile.service_areas.contains(location_filter))
+        query = query.filter(json_list_contains(ChefCard.service_areas, location_filter.lower()))
     
     # Service type filtering (cooking only vs cooking + teaching)
     if service_type_filter == 'teaching':
-        query = query.filter(ChefProfile.offers_teaching == True)
+        query = query.filter(ChefCard.offers_teaching == True)
+    
+    # Dietary filtering (menu tag bitmask, allergens through the ingredient index)
+    query = query.filter(*dietary_criteria(dietary_filter, exclude_filter))
     
     # Sorting
     if sort_by == 'price_low':
-        query = query.order_by(ChefProfile.base_price_per_person.asc())
+        query = query.order_by(ChefCard.base_price_per_person.asc())
     elif sort_by == 'price_high':
-        query = query.order_by(ChefProfile.base_price_per_person.desc())
+        query = query.order_by(ChefCard.base_price_per_person.desc())
     elif sort_by == 'newest':
-        query = query.order_by(ChefProfile.created_at.desc())
-    else:  # default: rating
-        query = query.order_by(ChefProfile.rating.desc())
+        query = query.order_by(ChefCard.created_at.desc())
+    elif sort_by == 'rating':
+        query = query.order_by(ChefCard.rating.desc())
+    else:  # default: best match, an index scan on ix_chef_card_available_ranking
+        query = query.order_by(ChefCard.ranking_score.desc())
     
     chefs = query.paginate(
         page=page, per_page=12, error_out=False
     )
     
-    # Get filter options for the UI
-    all_cuisines = ['persian', 'indian', 'chinese', 'italian', 'french', 'mexican', 'japanese', 'thai', 'mediterranean', 'american', 'filipino', 'korean', 'vietnamese']
-    all_locations = ['Metrotown', 'Brentwood', 'Edmonds', 'Lougheed', 'Burnaby Heights', 'Deer Lake', 'Highgate', 'Kingsway']
+    # Precomputed top picks for the cuisine, shown above the first page
+    cuisine_picks = recommended_chefs(f'cuisine:{cuisine_filter.lower()}') if cuisine_filter and page == 1 else []
+    
+    # "Price for N guests" column, quoted for the whole page in one batch
+    service_type = 'cooking_and_teaching' if service_type_filter == 'teaching' else 'cooking_only'
+    quotes = dict(zip(
+        [chef.id for chef in chefs.items],
+        quote_prices([(chef, guests, service_type, None) for chef in chefs.items])
+    ))
     
     return render_template('chefs/browse.html', 
                          chefs=chefs, 
@@ -640,24 +3156,52 @@ def browse_chefs():
                          rating_min=rating_min,
                          location_filter=location_filter,
                          service_type_filter=service_type_filter,
+                         dietary_filter=dietary_filter,
+                         exclude_filter=exclude_filter,
                          sort_by=sort_by,
-                         all_cuisines=all_cuisines,
-                         all_locations=all_locations)
+                         guests=guests,
+                         quotes=quotes,
+                         cuisine_picks=cuisine_picks,
+                         all_cuisines=BROWSE_CUISINES,
+                         all_locations=BROWSE_LOCATIONS,
+                         all_diets=DIETARY_CHOICES,
+                         all_allergens=tuple(ALLERGEN_TERMS))
 
 @app.route('/chef/<int:chef_id>')
+@read_only_view
 def chef_detail(chef_id):
     """Chef profile detail page"""
     chef_profile = ChefProfile.query.get_or_404(chef_id)
-    menus = Menu.query.filter_by(chef_id=chef_id).all()
-    reviews = Review.query.filter_by(chef_id=chef_profile.user_id).order_by(Review.created_at.desc()).limit(10).all()
+    menus = get_menu_catalog(chef_profile)
+    reviews = Review.query.options(db.joinedload(Review.reviewer))\
+        .filter_by(chef_id=chef_profile.user_id).order_by(Review.created_at.desc()).limit(10).all()
     
     return render_template('chefs/detail.html', 
                          chef_profile=chef_profile,
                          menus=menus,
                          reviews=reviews)
 
+@app.route('/chef/<int:chef_id>/quote')
+@read_only_view
+def chef_quote(chef_id):
+    """JSON price breakdown for the booking form's live price display"""
+    chef_profile = ChefProfile.query.get_or_404(chef_id)
+    guest_count = request.args.get('guests', type=int)
+    service_type = request.args.get('service_type', 'cooking_only')
+    
+    if not guest_count or not 1 <= guest_count <= 50:
+        return jsonify({'error': 'guests must be between 1 and 50'}), 400
+    if service_type not in ('cooking_only', 'cooking_and_teaching'):
+        return jsonify({'error': 'Unknown service_type'}), 400
+    if service_type == 'cooking_and_teaching' and not chef_profile.offers_teaching:
+        return jsonify({'error': 'This chef does not offer cooking lessons'}), 400
+    
+    quote = quote_booking(chef_profile, guest_count, service_type, request.args.get('menu_id', type=int))
+    return jsonify({key: str(value) for key, value in quote.items()})
+
 @app.route('/chef/<int:chef_id>/book', methods=['GET', 'POST'])
 @login_required
+@rate_limit('booking_user', scope='user')
 def book_chef(chef_id):
     """Book a chef"""
     if current_user.role != 'client':
@@ -665,35 +3209,62 @@ def book_chef(chef_id):
         return redirect(url_for('dashboard'))
     
     chef_profile = ChefProfile.query.get_or_404(chef_id)
+    menus = get_menu_catalog(chef_profile)
     form = BookingForm()
+    form.menu_id.choices = [(0, "Chef's choice")] + [
+        (menu['id'], f"{menu['name']} (${menu['price_per_person']}/person)") for menu in menus
+    ]
+    if not chef_profile.offers_teaching:
+        form.service_type.choices = [choice for choice in form.service_type.choices if choice[0] == 'cooking_only']
+    if request.method == 'GET':
+        form.menu_id.data = request.args.get('menu_id', 0, type=int)
+        form.idempotency_key.data = new_idempotency_key()
     
-    if form.validate_on_submit():
+    # A resubmitted form gets the booking it already made
+    booking = find_booking_by_key(current_user.id, form.idempotency_key.data) if form.is_submitted() else None
+    
+    if booking is None and form.validate_on_submit():
+        menu_id = form.menu_id.data or None
+        
         # Calculate pricing
-        pricing = calculate_booking_total(chef_profile, form.guest_count.data)
+        pricing = quote_booking(chef_profile, form.guest_count.data, form.service_type.data, menu_id)
         
         booking = Booking(
             client_id=current_user.id,
             chef_id=chef_profile.user_id,
-            menu_id=1,  # Default menu for now
+            menu_id=menu_id,
             event_date=form.event_date.data,
             event_time=form.event_time.data,
             guest_count=form.guest_count.data,
             location_address=form.location_address.data,
+            service_type=form.service_type.data,
+            cuisine_preference=form.cuisine_preference.data or None,
             occasion_type=form.occasion_type.data,
             dietary_restrictions=form.dietary_restrictions.data,
             special_requests=form.special_requests.data,
             total_price=pricing['total'],
             service_fee=pricing['service_fee'],
-            platform_fee=pricing['platform_fee']
+            platform_fee=pricing['platform_fee'],
+            idempotency_key=form.idempotency_key.data or None
         )
         
         db.session.add(booking)
-        db.session.commit()
-        
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()  # A concurrent copy of this submission got there first
+            booking = find_booking_by_key(current_user.id, form.idempotency_key.data)
+            if booking is None:
+                raise
+        else:
+            queue_booking_email(booking, booking.chef, 'booking_requested', 'New booking request')
+            db.session.commit()
+    
+    if booking is not None:
         flash('Booking request sent! The chef will respond within 24 hours.', 'success')
         return redirect(url_for('booking_detail', booking_id=booking.id))
     
-    return render_template('bookings/create.html', form=form, chef_profile=chef_profile)
+    return render_template('bookings/create.html', form=form, chef_profile=chef_profile, menus=menus)
 
 @app.route('/booking/<int:booking_id>')
 @login_required
@@ -706,7 +3277,72 @@ def booking_detail(booking_id):
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    return render_template('bookings/detail.html', booking=booking)
+    if current_user.id in [booking.client_id, booking.chef_id] and mark_thread_read(booking, current_user):
+        db.session.commit()
+    
+    messages, next_before = get_message_page(booking.id)
+    return render_template('bookings/detail.html', booking=booking, messages=messages, next_before=next_before)
+
+@app.route('/booking/<int:booking_id>/messages', methods=['GET'])
+@login_required
+def booking_messages(booking_id):
+    """Older messages in a booking thread (JSON, keyset paginated)"""
+    booking = Booking.query.get_or_404(booking_id)
+    
+    if current_user.id not in [booking.client_id, booking.chef_id] and not current_user.is_admin():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    messages, next_before = get_message_page(booking.id, before_id=request.args.get('before', type=int))
+    return jsonify({
+        'messages': [{
+            'id': message.id,
+            'sender_id': message.sender_id,
+            'sender_name': message.sender.first_name,
+            'content': message.content,
+            'created_at': message.created_at.isoformat()
+        } for message in messages],
+        'next_before': next_before
+    })
+
+@app.route('/booking/<int:booking_id>/messages', methods=['POST'])
+@login_required
+@rate_limit('message_user', scope='user')
+def send_message(booking_id):
+    """Send a message in a booking thread"""
+    booking = Booking.query.get_or_404(booking_id)
+    
+    if current_user.id not in [booking.client_id, booking.chef_id]:
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    
+    content = request.form.get('message', '').strip()
+    if not content:
+        flash('Message cannot be empty', 'error')
+        return redirect(url_for('booking_detail', booking_id=booking_id))
+    
+    message = send_booking_message(booking, current_user, content[:2000])
+    db.session.commit()
+    publish_user_event(message_recipient_id(booking, current_user), 'new_message', {
+        'booking_id': booking.id,
+        'message_id': message.id,
+        'sender_name': current_user.first_name,
+        'content': message.content[:200]
+    })
+    
+    return redirect(url_for('booking_detail', booking_id=booking_id) + '#messages')
+
+@app.route('/booking/<int:booking_id>/messages/read', methods=['POST'])
+@login_required
+def read_messages(booking_id):
+    """Mark a booking thread as read"""
+    booking = Booking.query.get_or_404(booking_id)
+    
+    if current_user.id not in [booking.client_id, booking.chef_id]:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    marked = mark_thread_read(booking, current_user)
+    db.session.commit()
+    return jsonify({'marked_read': marked, 'unread_messages': current_user.unread_messages})
 
 @app.route('/booking/<int:booking_id>/accept', methods=['POST'])
 @login_required
@@ -718,8 +3354,16 @@ def accept_booking(booking_id):
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    booking.status = 'confirmed'
+    try:
+        transition_booking(booking, 'confirmed')
+    except InvalidBookingTransition:
+        flash(f'This booking is already {booking.status} and can no longer be accepted', 'error')
+        return redirect(url_for('booking_detail', booking_id=booking_id))
+    
+    reserve_availability(booking)
+    queue_booking_email(booking, booking.client, 'booking_confirmed', 'Your booking is confirmed')
     db.session.commit()
+    publish_booking_status(booking)
     
     flash('Booking accepted!', 'success')
     return redirect(url_for('booking_detail', booking_id=booking_id))
@@ -734,14 +3378,68 @@ def decline_booking(booking_id):
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    booking.status = 'cancelled'
+    try:
+        transition_booking(booking, 'cancelled')
+    except InvalidBookingTransition:
+        flash(f'This booking is already {booking.status} and can no longer be declined', 'error')
+        return redirect(url_for('booking_detail', booking_id=booking_id))
+    
+    queue_booking_email(booking, booking.client, 'booking_declined', 'Your booking request was declined')
     db.session.commit()
+    publish_booking_status(booking)
     
     flash('Booking declined', 'info')
     return redirect(url_for('chef_dashboard'))
 
+@app.route('/booking/<int:booking_id>/pay', methods=['POST'])
+@login_required
+@rate_limit('payment_user', scope='user')
+def create_payment(booking_id):
+    """Create (or reuse) the Stripe PaymentIntent for a confirmed booking"""
+    booking = Booking.query.get_or_404(booking_id)
+    
+    if current_user.id != booking.client_id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if booking.status != 'confirmed' or booking.payment_status not in ('pending', 'failed'):
+        return jsonify({'error': 'This booking cannot be paid'}), 400
+    
+    try:
+        intent = get_or_create_payment_intent(booking)
+    except stripe.error.StripeError as e:
+        app.logger.error(f"Stripe error for booking {booking_id}: {e}")
+        return jsonify({'error': 'Payment service unavailable. Please try again.'}), 502
+    
+    return jsonify({
+        'client_secret': intent['client_secret'],
+        'publishable_key': app.config['STRIPE_PUBLISHABLE_KEY']
+    })
+
+@app.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    """Verify a Stripe webhook and queue it; processing happens in the worker"""
+    secret = app.config['STRIPE_WEBHOOK_SECRET']
+    if not secret:
+        app.logger.error("Stripe webhook received but STRIPE_WEBHOOK_SECRET is not set")
+        return jsonify({'error': 'Webhooks not configured'}), 503
+    
+    payload = request.get_data(as_text=True)
+    try:
+        event = stripe.Webhook.construct_event(payload, request.headers.get('Stripe-Signature', ''), secret)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return jsonify({'error': 'Invalid payload or signature'}), 400
+    
+    db.session.add(StripeEvent(id=event['id'], type=event['type'], payload=payload))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # Redelivery of an event we already queued
+    
+    return jsonify({'received': True})
+
 @app.route('/booking/<int:booking_id>/review', methods=['GET', 'POST'])
 @login_required
+@rate_limit('review_user', scope='user')
 def review_booking(booking_id):
     """Review a completed booking"""
     booking = Booking.query.get_or_404(booking_id)
@@ -772,15 +3470,22 @@ def review_booking(booking_id):
         )
         
         db.session.add(review)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()  # A concurrent copy of this submission saved the review first
+            flash('You have already reviewed this booking', 'info')
+            return redirect(url_for('booking_detail', booking_id=booking_id))
         
         # Update chef rating
         chef_profile = ChefProfile.query.filter_by(user_id=booking.chef_id).first()
         if chef_profile:
             # Recalculate average rating
-            all_reviews = Review.query.filter_by(chef_id=booking.chef_id).all()
-            total_rating = sum(r.rating for r in all_reviews)
-            chef_profile.rating = total_rating / len(all_reviews)
-            chef_profile.total_reviews = len(all_reviews)
+            average_rating, review_count = db.session.execute(
+                db.select(db.func.avg(Review.rating), db.func.count(Review.id)).where(Review.chef_id == booking.chef_id)
+            ).one()
+            chef_profile.rating = average_rating
+            chef_profile.total_reviews = review_count
         
         db.session.commit()
         
@@ -789,38 +3494,210 @@ def review_booking(booking_id):
     
     return render_template('reviews/create.html', form=form, booking=booking)
 
-# Debug route to check database status
-@app.route('/debug-db')
+@app.route('/events')
+@login_required
+def event_stream():
+    """Server-sent events stream of the current user's booking and message events.
+
+    Each open stream holds a connection for up to EVENT_STREAM_MAX_SECONDS, so
+    serve it from gevent (or another async/green) workers; the browser's
+    EventSource reconnects automatically when the stream ends.
+    """
+    user_id = current_user.id
+    heartbeat = app.config['EVENT_STREAM_HEARTBEAT_SECONDS']
+    max_seconds = app.config['EVENT_STREAM_MAX_SECONDS']
+    
+    def generate():
+        subscription = event_bus.subscribe(f'user:{user_id}')
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f"retry: {heartbeat * 1000}\n\n"
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            subscription.close()
+    
+    # Not wrapped in stream_with_context: the request's DB session is released
+    # before streaming starts, so idle streams do not hold pool connections.
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/healthz')
+def liveness():
+    """200 while the process can answer; no database or session work"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readiness():
+    """503 until this process has warmed up and the database is reachable and migrated"""
+    if not warmup_state['ready']:
+        body = {'status': 'warming'}
+        if 'error' in warmup_state:
+            body['error'] = warmup_state['error']  # From the last attempt; this probe starts another
+        start_warm_up()
+        return jsonify(body), 503
+    checks = check_database_readiness()
+    if checks['ok']:
+        status = 'ready'
+    else:
+        status = 'migration_pending' if checks['database'] == 'ok' else 'database_unavailable'
+    body = {'status': status, 'templates': warmup_state['templates'], 'warmup_seconds': warmup_state['seconds']}
+    body.update((key, value) for key, value in checks.items() if key != 'ok')
+    return jsonify(body), 200 if checks['ok'] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this worker's rate limiter counters"""
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif not (current_user.is_authenticated and current_user.is_admin()):
+        abort(403)
+    
+    with _rate_limit_metrics_lock:
+        counts = sorted(rate_limit_metrics.items())
+    lines = [
+        '# HELP hometaste_rate_limit_requests_total Requests checked against each rate limit, by outcome.',
+        '# TYPE hometaste_rate_limit_requests_total counter'
+    ]
+    lines += [f'hometaste_rate_limit_requests_total{{limit="{name}",outcome="{outcome}"}} {count}'
+              for (name, outcome), count in counts]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# Database report for admins. Schema introspection runs a handful of catalog
+# queries, so the report is reused for DEBUG_DB_CACHE_SECONDS (?refresh=1 rebuilds it)
+_debug_db_report = {'built_at': None, 'text': None}
+_debug_db_lock = threading.Lock()
+
+def build_debug_db_report():
+    """Plain-text summary of tables, key columns, schema version and pool state"""
+    from sqlalchemy import inspect
+    inspector = inspect(db.engine)
+    tables = inspector.get_table_names()
+    
+    result = f"Database tables: {tables}\n"
+    for table, label in (('user', 'User table'), ('chef_profile', 'Chef profile'), ('booking', 'Booking')):
+        if table in tables:
+            result += f"{label} columns: {[col['name'] for col in inspector.get_columns(table)]}\n"
+    
+    version = db.session.query(db.func.max(SchemaMigration.version)).scalar() if 'schema_migration' in tables else None
+    result += f"Schema version: {version} (this release expects {SCHEMA_VERSION})\n"
+    result += f"Connection pool: {db.engine.pool.status()}\n"
+    return result
+
+@app.route('/admin/debug-db')
+@login_required
 def debug_database():
     """Debug database status"""
+    if not current_user.is_admin():
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    
     try:
-        with app.app_context():
-            from sqlalchemy import inspect
-            inspector = inspect(db.engine)
-            tables = inspector.get_table_names()
-            
-            result = f"Database tables: {tables}\n"
-            
-            if 'user' in tables:
-                user_columns = [col['name'] for col in inspector.get_columns('user')]
-                result += f"User table columns: {user_columns}\n"
-            
-            if 'chef_profile' in tables:
-                chef_columns = [col['name'] for col in inspector.get_columns('chef_profile')]
-                result += f"Chef profile columns: {chef_columns}\n"
-            
-            if 'booking' in tables:
-                booking_columns = [col['name'] for col in inspector.get_columns('booking')]
-                result += f"Booking columns: {booking_columns}\n"
-            
-            return f"<pre>{result}</pre>"
+        with _debug_db_lock:
+            built_at = _debug_db_report['built_at']
+            if request.args.get('refresh') or built_at is None or time.monotonic() - built_at >= app.config['DEBUG_DB_CACHE_SECONDS']:
+                _debug_db_report.update(text=build_debug_db_report(), built_at=time.monotonic())
+            report = _debug_db_report['text']
+        age = int(time.monotonic() - _debug_db_report['built_at'])
+        return Response(f"{report}Report built {age}s ago\n", mimetype='text/plain')
     except Exception as e:
         return f"Database debug error: {str(e)}", 500
 
-# Database migration route (for production deployment)
-@app.route('/migrate-db')
+# Columns that held comma-separated text before becoming JSON lists
+JSON_LIST_COLUMNS = {
+    'chef_profile': ('specialties', 'cuisine_types', 'certifications', 'service_areas'),
+    'menu': ('dietary_tags', 'ingredients'),
+    'review': ('photos',),
+    'chef_card': ('specialties', 'cuisine_types', 'service_areas'),
+}
+# Browse filters match these by exact element, so they are stored lowercase
+LOWERCASE_LIST_COLUMNS = ('cuisine_types', 'service_areas')
+
+def migrate_json_list_columns():
+    """Rewrite list columns as JSON arrays (and retype them JSONB on PostgreSQL); safe to re-run.
+
+    Chefs with no cuisine_types get the CUISINE_CHOICES found in their
+    specialties, since the profile form never saved cuisines before, and
+    LOWERCASE_LIST_COLUMNS are lowercased. Returns the number of rows rewritten.
+    """
+    from sqlalchemy import inspect, text
+    inspector = inspect(db.engine)
+    postgresql = db.engine.dialect.name == 'postgresql'
+    cuisines = {value for value, _ in CUISINE_CHOICES}
+    rewritten = 0
+    for table, columns in JSON_LIST_COLUMNS.items():
+        if not inspector.has_table(table):
+            continue
+        types = {column['name']: column['type'] for column in inspector.get_columns(table)}
+        pending = [column for column in columns if column in types and not (postgresql and isinstance(types[column], JSONB))]
+        converted = [column for column in columns if column in types and column not in pending]
+        for column in set(converted) & set(LOWERCASE_LIST_COLUMNS):
+            with db.engine.begin() as conn:
+                rewritten += conn.execute(text(
+                    f"UPDATE {table} SET {column} = lower({column}::text)::jsonb WHERE {column}::text <> lower({column}::text)"
+                )).rowcount
+        if not pending:
+            continue
+        with db.engine.begin() as conn:
+            updates = []
+            for row in conn.execute(text(f"SELECT id, {', '.join(pending)} FROM {table}")).mappings():
+                values = {column: string_list(row[column], lower=column in LOWERCASE_LIST_COLUMNS) for column in pending}
+                if table == 'chef_profile' and not values['cuisine_types']:
+                    values['cuisine_types'] = [value for value in string_list(row['specialties'], lower=True) if value in cuisines]
+                values = {column: json.dumps(value) for column, value in values.items()}
+                if any(values[column] != row[column] for column in pending):
+                    updates.append({'row_id': row['id'], **values})
+            if updates:
+                assignments = ', '.join(f"{column} = :{column}" for column in pending)
+                conn.execute(text(f"UPDATE {table} SET {assignments} WHERE id = :row_id"), updates)
+            if postgresql:
+                for column in pending:
+                    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} DROP DEFAULT"))
+                    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb"))
+            rewritten += len(updates)
+    return rewritten
+
+def remove_duplicate_reviews():
+    """Keep each booking's first review so uq_review_booking_id can be created; returns reviews deleted.
+
+    Written without the ORM, so rebuild ranking scores and chef cards after;
+    the affected chefs' rating and total_reviews are recounted here.
+    """
+    first_reviews = db.select(db.func.min(Review.id)).group_by(Review.booking_id)
+    duplicates = db.session.execute(db.select(Review.id, Review.chef_id).where(Review.id.not_in(first_reviews))).all()
+    if duplicates:
+        db.session.execute(db.delete(Review).where(Review.id.in_([review_id for review_id, _ in duplicates])),
+                           execution_options={'synchronize_session': False})
+        reviews = db.select(db.func.count(Review.id)).where(Review.chef_id == ChefProfile.user_id).scalar_subquery()
+        rating = db.select(db.func.coalesce(db.func.round(db.func.avg(Review.rating), 2), 0))\
+            .where(Review.chef_id == ChefProfile.user_id).scalar_subquery()
+        db.session.execute(
+            db.update(ChefProfile)
+            .where(ChefProfile.user_id.in_({chef_id for _, chef_id in duplicates}))
+            .values(rating=rating, total_reviews=reviews),
+            execution_options={'synchronize_session': False}
+        )
+    db.session.commit()
+    return len(duplicates)
+
+# Database migration route (for production deployment); runs DDL, so only for
+# admins or deploy scripts sending MIGRATE_TOKEN
+@app.route('/migrate-db', methods=['GET', 'POST'])
 def migrate_database():
     """Create database tables - for production deployment"""
+    token = app.config['MIGRATE_TOKEN']
+    if not (token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')):
+        if not (current_user.is_authenticated and current_user.is_admin()):
+            abort(403)
+    
     try:
         with app.app_context():
             db.create_all()
@@ -838,7 +3715,10 @@ def migrate_database():
                     ('cuisine_types', 'TEXT'),
                     ('teaching_price_per_person', 'NUMERIC(10, 2)'),
                     ('offers_teaching', 'BOOLEAN DEFAULT TRUE'),
-                    ('teaching_experience', 'TEXT')
+                    ('teaching_experience', 'TEXT'),
+                    ('pricing_version', 'INTEGER NOT NULL DEFAULT 1'),
+                    ('menu_version', 'INTEGER NOT NULL DEFAULT 1'),
+                    ('ranking_score', 'FLOAT NOT NULL DEFAULT 0')
                 ]
                 
                 for column_name, column_type in new_chef_columns:
@@ -847,10 +3727,31 @@ def migrate_database():
                             conn.execute(text(f"ALTER TABLE chef_profile ADD COLUMN {column_name} {column_type}"))
                             conn.commit()
                 
+                # Add new columns to chef_card
+                card_columns = [col['name'] for col in inspector.get_columns('chef_card')]
+                new_card_columns = [
+                    ('ranking_score', 'FLOAT NOT NULL DEFAULT 0'),
+                    ('dietary_mask', 'INTEGER NOT NULL DEFAULT 0')
+                ]
+                
+                for column_name, column_type in new_card_columns:
+                    if column_name not in card_columns:
+                        with db.engine.connect() as conn:
+                            conn.execute(text(f"ALTER TABLE chef_card ADD COLUMN {column_name} {column_type}"))
+                            conn.commit()
+                
+                # Add new columns to menu
+                menu_columns = [col['name'] for col in inspector.get_columns('menu')]
+                if 'dietary_mask' not in menu_columns:
+                    with db.engine.connect() as conn:
+                        conn.execute(text("ALTER TABLE menu ADD COLUMN dietary_mask INTEGER NOT NULL DEFAULT 0"))
+                        conn.commit()
+                
                 # Add new columns to booking
                 new_booking_columns = [
                     ('service_type', 'VARCHAR(20) DEFAULT \'cooking_only\''),
-                    ('cuisine_preference', 'VARCHAR(50)')
+                    ('cuisine_preference', 'VARCHAR(50)'),
+                    ('idempotency_key', 'VARCHAR(64)')
                 ]
                 
                 for column_name, column_type in new_booking_columns:
@@ -858,6 +3759,74 @@ def migrate_database():
                         with db.engine.connect() as conn:
                             conn.execute(text(f"ALTER TABLE booking ADD COLUMN {column_name} {column_type}"))
                             conn.commit()
+                
+                # Add new columns to user ("user" is reserved in PostgreSQL)
+                user_columns = [col['name'] for col in inspector.get_columns('user')]
+                new_user_columns = [
+                    ('unread_messages', 'INTEGER NOT NULL DEFAULT 0')
+                ]
+                
+                for column_name, column_type in new_user_columns:
+                    if column_name not in user_columns:
+                        with db.engine.connect() as conn:
+                            conn.execute(text(f'ALTER TABLE "user" ADD COLUMN {column_name} {column_type}'))
+                            conn.commit()
+                
+                # Widen password_hash for scrypt/bcrypt hashes (SQLite ignores VARCHAR lengths)
+                if db.engine.dialect.name == 'postgresql':
+                    with db.engine.connect() as conn:
+                        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
+                        conn.commit()
+                    
+                    # Bookings may now be made without picking one of the chef's menus
+                    with db.engine.connect() as conn:
+                        conn.execute(text('ALTER TABLE booking ALTER COLUMN menu_id DROP NOT NULL'))
+                        conn.commit()
+                
+                # Comma-separated list columns become JSON arrays (JSONB on PostgreSQL)
+                migrate_json_list_columns()
+                if db.engine.dialect.name == 'postgresql':
+                    with db.engine.connect() as conn:
+                        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_chef_card_cuisine_types ON chef_card USING gin (cuisine_types)'))
+                        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_chef_card_service_areas ON chef_card USING gin (service_areas)'))
+                        conn.commit()
+                
+                # Indexes added after the tables were first created
+                new_indexes = [
+                    ('ix_message_booking_id_id', 'message (booking_id, id)'),
+                    ('ix_booking_chef_id_event_date', 'booking (chef_id, event_date)'),
+                    ('ix_booking_chef_id_status_event_date', 'booking (chef_id, status, event_date)'),
+                    ('ix_booking_client_id_status_event_date', 'booking (client_id, status, event_date)'),
+                    ('ix_menu_chef_id', 'menu (chef_id)'),
+                    ('ix_menu_item_menu_id_order', 'menu_item (menu_id, "order")'),
+                    ('ix_menu_photo_menu_id', 'menu_photo (menu_id)'),
+                    ('ix_chef_card_available_ranking', 'chef_card (is_available, ranking_score)')
+                ]
+                
+                for index_name, index_target in new_indexes:
+                    with db.engine.connect() as conn:
+                        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {index_target}"))
+                        conn.commit()
+                
+                # Unique indexes that make form resubmissions harmless; older
+                # duplicate reviews have to go first
+                remove_duplicate_reviews()
+                new_unique_indexes = [
+                    ('uq_review_booking_id', 'review (booking_id)'),
+                    ('uq_booking_client_id_idempotency_key', 'booking (client_id, idempotency_key)')
+                ]
+                
+                for index_name, index_target in new_unique_indexes:
+                    with db.engine.connect() as conn:
+                        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {index_target}"))
+                        conn.commit()
+                
+                # Score every chef, mask and index every menu, then backfill the
+                # chef card read model
+                rebuild_ranking_scores()
+                rebuild_dietary_index()
+                rebuild_chef_cards()
+                stamp_schema_version()
                             
             except Exception as col_error:
                 return f"Table creation successful but column migration failed: {str(col_error)}"
@@ -875,10 +3844,13 @@ def admin_dashboard():
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    total_users = User.query.count()
-    total_chefs = User.query.filter_by(role='chef').count()
-    total_bookings = Booking.query.count()
-    pending_bookings = Booking.query.filter_by(status='pending').count()
+    # All four counters in a single round trip
+    total_users, total_chefs, total_bookings, pending_bookings = db.session.execute(db.select(
+        db.select(db.func.count(User.id)).scalar_subquery(),
+        db.select(db.func.count(User.id)).where(User.role == 'chef').scalar_subquery(),
+        db.select(db.func.count(Booking.id)).scalar_subquery(),
+        db.select(db.func.count(Booking.id)).where(Booking.status == 'pending').scalar_subquery()
+    )).one()
     
     recent_bookings = Booking.query.order_by(Booking.created_at.desc()).limit(10).all()
     
@@ -889,6 +3861,76 @@ def admin_dashboard():
                          pending_bookings=pending_bookings,
                          recent_bookings=recent_bookings)
 
+@app.route('/admin/reports')
+@login_required
+def admin_reports():
+    """Booking and revenue reports, read only from BookingRollup"""
+    if not current_user.is_admin():
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    start_day = datetime.utcnow().date() - timedelta(days=days - 1)
+    in_range = [BookingRollup.day >= start_day]
+    
+    daily = BookingRollup.query\
+        .filter(BookingRollup.dimension == 'all', *in_range)\
+        .order_by(BookingRollup.day).all()
+    totals = {
+        'bookings': sum(row.bookings for row in daily),
+        'confirmed_bookings': sum(row.confirmed_bookings for row in daily),
+        'gmv': sum((row.gmv for row in daily), Decimal('0')),
+        'platform_fee': sum((row.platform_fee for row in daily), Decimal('0')),
+        'service_fee': sum((row.service_fee for row in daily), Decimal('0'))
+    }
+    
+    def top_values(dimension, limit=10):
+        gmv = db.func.sum(BookingRollup.gmv)
+        bookings = db.func.sum(BookingRollup.bookings)
+        return db.session.execute(
+            db.select(BookingRollup.dimension_value, bookings.label('bookings'), gmv.label('gmv'))
+            .where(BookingRollup.dimension == dimension, *in_range)
+            .group_by(BookingRollup.dimension_value)
+            .order_by(gmv.desc(), bookings.desc())
+            .limit(limit)
+        ).all()
+    
+    top_chefs = top_values('chef')
+    chef_ids = [int(row.dimension_value) for row in top_chefs]
+    chef_names = {user.id: f"{user.first_name} {user.last_name}"
+                  for user in User.query.filter(User.id.in_(chef_ids)).all()} if chef_ids else {}
+    
+    return render_template('admin/reports.html',
+                         days=days,
+                         start_day=start_day,
+                         daily=daily,
+                         totals=totals,
+                         top_cuisines=top_values('cuisine'),
+                         top_occasions=top_values('occasion'),
+                         top_chefs=top_chefs,
+                         chef_names=chef_names)
+
+@app.route('/admin/export/<name>')
+@login_required
+def admin_export(name):
+    """Stream bookings, reviews or chefs as CSV (default) or Parquet"""
+    if not current_user.is_admin():
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    if name not in EXPORTS:
+        abort(404)
+    
+    export_format = request.args.get('format', 'csv')
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if export_format == 'csv':
+        return Response(stream_with_context(iter_export_csv(name)), mimetype='text/csv', headers=headers)
+    if export_format == 'parquet':
+        if importlib.util.find_spec('pyarrow') is None:
+            abort(503)  # Checked up front; once streaming starts an ImportError could only cut the download short
+        return Response(stream_with_context(iter_export_parquet(name)), mimetype='application/vnd.apache.parquet', headers=headers)
+    abort(400)
+
 # Enhanced Error handlers
 @app.errorhandler(400)
 def bad_request_error(error):
@@ -919,6 +3961,17 @@ def internal_error(error):
 def service_unavailable_error(error):
     return render_template('errors/503.html'), 503
 
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy_error(error):
+    app.logger.warning(f"Password hashing overloaded: {error}")
+    return render_template('errors/503.html'), 503, {'Retry-After': '5'}
+
+@app.errorhandler(StorageError)
+def storage_error(error):
+    db.session.rollback()
+    app.logger.error(f"Upload storage failed: {error}")
+    return render_template('errors/503.html'), 503
+
 # Initialize database
 def create_tables():
     with app.app_context():
@@ -942,15 +3995,19 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.setLevel(logging.INFO)
     app.logger.info('HomeTaste startup')
+    if 'SECRET_KEY' not in os.environ:
+        app.logger.warning('SECRET_KEY is not set; every node must share one secret key or logins break between them')
 
-# Initialize database on app startup (for production)
+# Initialize database on app startup (for production). A brand-new database gets
+# the current schema from create_all(), so it is stamped as already migrated
 with app.app_context():
     try:
+        fresh_database = not db.inspect(db.engine).has_table('user')
         db.create_all()
-        print("Production database initialized")
+        if fresh_database:
+            stamp_schema_version()
         app.logger.info("Database initialized successfully")
     except Exception as e:
-        print(f"Production database init error: {e}")
         app.logger.error(f"Database initialization error: {e}")
 
 if __name__ == '__main__':
@@ -0,0 +1,31 @@
+"""
+ASGI entry point
+Wraps the Flask app for ASGI servers (uvicorn, hypercorn, or gunicorn with
+GUNICORN_MODE=asgi). Each request still runs synchronously, on a thread pool,
+so this does not make views asynchronous; it is for platforms that only speak
+ASGI. asgiref's stock WsgiToAsgi runs every request on one shared
+"thread-sensitive" thread, which serializes them and breaks under concurrent
+load, so requests are sent to the default executor instead.
+
+    pip install asgiref uvicorn
+    uvicorn asgi:application --port 8000
+"""
+
+try:
+    from asgiref.sync import sync_to_async
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+except ImportError:
+    raise RuntimeError('asgi.py needs the asgiref package (pip install asgiref uvicorn)')
+
+from app import app
+
+class _PooledInstance(WsgiToAsgiInstance):
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi running each request on the event loop's thread pool"""
+    
+    async def __call__(self, scope, receive, send):
+        await _PooledInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+application = PooledWsgiToAsgi(app)
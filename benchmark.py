@@ -0,0 +1,409 @@
+"""
+Route benchmarks
+Drives the hot routes through the Flask test client (in-process) or a real
+gunicorn server and records p50/p95/p99 latency, throughput, SQL statements
+per request and peak RSS as JSON. Run it against a seeded database (see
+seed_data.py) and compare the result with a saved baseline:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python seed_data.py --scale 0.1
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmark.py --output baseline.json
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmark.py --gunicorn --workers 4 --concurrency 8
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmark.py --gunicorn --mode gevent --open-streams 32
+    python benchmark.py --compare baseline.json results.json --threshold 0.25
+
+--mode selects the gunicorn.conf.py worker model (sync is plain ``gunicorn
+app:app``); --open-streams holds that many /events streams open during the run,
+as logged-in browsers do.
+
+A comparison exits with status 1 when any route's p95 grows past the threshold
+or it issues more SQL statements than in the baseline.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import queue
+import re
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+from datetime import time as clock
+import requests
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Benchmarks send far more requests per IP than any real client; the limiter
+# would turn most of them into 429s (gunicorn inherits this too)
+os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+from app import app, db, User, ChefProfile, Booking
+
+BENCH_PASSWORD = 'password123'
+CSRF_PATTERN = re.compile(rb'name="csrf_token" type="hidden" value="([^"]+)"')
+
+# role is the account the request runs as (None for anonymous); expected is the
+# status code of a successful request
+Scenario = namedtuple('Scenario', 'name role method path data expected')
+
+BROWSE_FILTERS = {
+    'all': {},
+    'cuisine': {'cuisine': 'persian'},
+    'price': {'price_min': 40, 'price_max': 90},
+    'rating': {'rating_min': 4},
+    'location': {'location': 'Metrotown'},
+    'teaching': {'service_type': 'teaching'},
+}
+BROWSE_SORTS = ['rating', 'price_low', 'price_high', 'newest']
+
+def _query_string(params):
+    return '&'.join(f"{key}={value}" for key, value in params.items())
+
+def build_scenarios(fixtures):
+    """Every benchmarked request; paths and form data may be callables taking the next fixture"""
+    chef_id = fixtures['chef_profile_id']
+    event_date = (date.today() + timedelta(days=30)).isoformat()
+    scenarios = [Scenario('index', None, 'GET', '/', None, 200)]
+    for (filter_name, params), sort in itertools.product(BROWSE_FILTERS.items(), BROWSE_SORTS):
+        path = '/chefs?' + _query_string(dict(params, sort=sort))
+        scenarios.append(Scenario(f"browse_chefs[{filter_name},{sort}]", None, 'GET', path, None, 200))
+    scenarios += [
+        Scenario('chef_detail', None, 'GET', f"/chef/{chef_id}", None, 200),
+        Scenario('client_dashboard', 'client', 'GET', '/client/dashboard', None, 200),
+        Scenario('chef_dashboard', 'chef', 'GET', '/chef/dashboard', None, 200),
+        Scenario('admin_dashboard', 'admin', 'GET', '/admin/dashboard', None, 200),
+        Scenario('book_chef', 'client', 'POST', f"/chef/{chef_id}/book", {
+            'event_date': event_date,
+            'event_time': '19:00',
+            'guest_count': '6',
+            'location_address': '4700 Kingsway, Burnaby, BC',
+            'service_type': 'cooking_only',
+            'cuisine_preference': 'persian',
+            'occasion_type': 'dinner_party',
+        }, 302),
+        Scenario('review_booking', 'client', 'POST', lambda booking_id: f"/booking/{booking_id}/review", {
+            'rating': '5', 'food_quality': '5', 'professionalism': '4', 'cleanliness': '5',
+            'communication': '4', 'value_for_money': '4', 'comment': 'Benchmark review',
+        }, 302),
+    ]
+    return scenarios
+
+def _ensure_user(email, role, first_name):
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        user = User(email=email, first_name=first_name, last_name='Bench', role=role, is_verified=True)
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+        db.session.flush()
+    return user
+
+def prepare_fixtures(review_bookings):
+    """Create the benchmark accounts and enough completed bookings for every review POST"""
+    db.create_all()
+    busiest_chef = db.session.execute(
+        db.select(ChefProfile.id, ChefProfile.user_id)
+        .join(Booking, Booking.chef_id == ChefProfile.user_id)
+        .group_by(ChefProfile.id, ChefProfile.user_id)
+        .order_by(db.func.count(Booking.id).desc())
+        .limit(1)
+    ).first()
+    if busiest_chef is None:
+        raise SystemExit('No bookings found; seed the database first (python seed_data.py)')
+    chef_user = db.session.get(User, busiest_chef.user_id)
+
+    client = _ensure_user('bench-client@example.com', 'client', 'Client')
+    admin = _ensure_user('bench-admin@example.com', 'admin', 'Admin')
+    event_date = date.today() - timedelta(days=7)
+    rows = [{
+        'client_id': client.id, 'chef_id': chef_user.id, 'menu_id': 1,
+        'event_date': event_date, 'event_time': clock(19, 0), 'guest_count': 4,
+        'location_address': '4700 Kingsway, Burnaby, BC', 'total_price': 300,
+        'service_fee': 30, 'platform_fee': 45, 'status': 'completed', 'payment_status': 'paid',
+        'special_requests': 'benchmark',
+    } for _ in range(review_bookings)]
+    if rows:
+        db.session.execute(db.insert(Booking), rows)
+    db.session.commit()
+    booking_ids = db.session.execute(
+        db.select(Booking.id)
+        .where(Booking.client_id == client.id, Booking.special_requests == 'benchmark', ~Booking.review.any())
+        .order_by(Booking.id.desc()).limit(review_bookings)
+    ).scalars().all()
+    return {
+        'chef_profile_id': busiest_chef.id,
+        'accounts': {'client': client.email, 'chef': chef_user.email, 'admin': admin.email},
+        'review_booking_ids': booking_ids,
+    }
+
+class InProcessClient:
+    """Flask test client with the same get/post interface as HttpClient"""
+
+    def __init__(self):
+        self._client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        return response.status_code, response.data
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._session = requests.Session()
+
+    def request(self, method, path, data=None):
+        response = self._session.request(method, self.base_url + path, data=data, allow_redirects=False, timeout=60)
+        return response.status_code, response.content
+
+def login(client, email):
+    """Log in through the real form and return a CSRF token for later POSTs"""
+    _, body = client.request('GET', '/login')
+    token = CSRF_PATTERN.search(body).group(1).decode()
+    status, _ = client.request('POST', '/login', {'email': email, 'password': BENCH_PASSWORD, 'csrf_token': token})
+    if status != 302:
+        raise SystemExit(f"Could not log in as {email} (status {status})")
+    return token
+
+class SQLCounter:
+    """Counts statements sent to the database by this process"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._increment)
+
+    def _increment(self, *args):
+        self.count += 1
+
+def percentile(sorted_values, pct):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method='inclusive')[pct - 1]
+
+def run_scenario(scenario, clients, tokens, fixture_queue, iterations, warmup):
+    """Send warmup + iterations requests per client thread; returns latencies (ms) and status counts"""
+    latencies, statuses, lock = [], Counter(), threading.Lock()
+
+    def worker(client, token):
+        for i in range(warmup + iterations):
+            path = scenario.path
+            if callable(path):
+                path = path(fixture_queue.get_nowait())
+            data = dict(scenario.data, csrf_token=token) if scenario.data else None
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(scenario.method, path, data)
+            except requests.RequestException:
+                status = 0
+            elapsed = (time.perf_counter() - started) * 1000
+            if i >= warmup:
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(client, tokens[id(client)])) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return latencies, statuses, wall
+
+def measure_sql(scenario, client, token, fixture_queue, counter):
+    """SQL statements issued by one in-process request"""
+    path = scenario.path(fixture_queue.get_nowait()) if callable(scenario.path) else scenario.path
+    data = dict(scenario.data, csrf_token=token) if scenario.data else None
+    before = counter.count
+    client.request(scenario.method, path, data)
+    return counter.count - before
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_gunicorn(workers, port, mode='gthread'):
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, '-m', 'gunicorn', '--chdir', here, '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--log-level', 'warning']
+    if mode == 'sync':
+        command += ['--config', os.devnull, 'app:app']  # gunicorn's defaults, skipping ./gunicorn.conf.py
+    else:
+        command += ['-c', os.path.join(here, 'gunicorn.conf.py')]
+    process = subprocess.Popen(command, env=dict(os.environ, GUNICORN_MODE=mode))
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + '/login', timeout=2)
+            return process, base_url
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                raise SystemExit('gunicorn exited during startup')
+            time.sleep(0.25)
+    process.terminate()
+    raise SystemExit('gunicorn did not start within 60s')
+
+def open_event_streams(base_url, email, count):
+    """Keep count /events streams open in background threads until the server goes away"""
+    def hold():
+        client = HttpClient(base_url)
+        try:
+            login(client, email)
+            with client._session.get(base_url + '/events', stream=True, timeout=None) as response:
+                for _ in response.iter_content(chunk_size=None):
+                    pass
+        except (requests.RequestException, SystemExit):
+            pass
+
+    for _ in range(count):
+        threading.Thread(target=hold, daemon=True).start()
+    time.sleep(2)  # Let the streams connect before measuring
+
+def run_benchmarks(args):
+    selected = lambda name: not args.only or re.search(args.only, name)
+    reviews_needed = (args.warmup + args.requests) * args.concurrency + 1 if selected('review_booking') else 0
+    with app.app_context():
+        fixtures = prepare_fixtures(reviews_needed)
+    scenarios = [s for s in build_scenarios(fixtures) if selected(s.name)]
+    fixture_queue = queue.Queue()
+    for booking_id in fixtures['review_booking_ids']:
+        fixture_queue.put(booking_id)
+
+    process = None
+    if args.gunicorn:
+        process, base_url = start_gunicorn(args.workers, args.port or _free_port(), args.mode)
+        make_client, concurrency = (lambda: HttpClient(base_url)), args.concurrency
+        if args.open_streams:
+            open_event_streams(base_url, fixtures['accounts']['client'], args.open_streams)
+    else:
+        make_client, concurrency = InProcessClient, 1
+
+    try:
+        # One logged-in client per thread and role
+        sessions = {}
+        for role in {s.role for s in scenarios}:
+            clients = [make_client() for _ in range(concurrency)]
+            tokens = {id(client): login(client, fixtures['accounts'][role]) if role else None for client in clients}
+            sessions[role] = (clients, tokens)
+
+        # SQL counts always come from an in-process request against the same database
+        with app.app_context():
+            sql_counter = SQLCounter(db.engine)
+        sql_clients = {}
+        for role in sessions:
+            client = InProcessClient()
+            sql_clients[role] = (client, login(client, fixtures['accounts'][role]) if role else None)
+
+        routes = {}
+        for scenario in scenarios:
+            clients, tokens = sessions[scenario.role]
+            latencies, statuses, wall = run_scenario(scenario, clients, tokens, fixture_queue, args.requests, args.warmup)
+            sql_client, sql_token = sql_clients[scenario.role]
+            latencies.sort()
+            routes[scenario.name] = {
+                'requests': len(latencies),
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'mean_ms': round(statistics.fmean(latencies), 3),
+                'throughput_rps': round(len(latencies) / wall, 1),
+                'sql_queries': measure_sql(scenario, sql_client, sql_token, fixture_queue, sql_counter),
+                'errors': sum(count for status, count in statuses.items() if status != scenario.expected),
+                'status_codes': {str(status): count for status, count in statuses.items()},
+            }
+            print(f"{scenario.name:40} p50 {routes[scenario.name]['p50_ms']:8.2f}ms  "
+                  f"p95 {routes[scenario.name]['p95_ms']:8.2f}ms  "
+                  f"{routes[scenario.name]['throughput_rps']:8.1f} req/s  "
+                  f"{routes[scenario.name]['sql_queries']:3d} SQL"
+                  + (f"  {routes[scenario.name]['errors']} errors" if routes[scenario.name]['errors'] else ''))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    # ru_maxrss is KiB on Linux; for gunicorn this is the largest (reaped) worker
+    who = resource.RUSAGE_CHILDREN if process else resource.RUSAGE_SELF
+    return {
+        'meta': {
+            'target': 'gunicorn' if process else 'test_client',
+            'workers': args.workers if process else None,
+            'mode': args.mode if process else None,
+            'open_streams': args.open_streams if process else 0,
+            'concurrency': concurrency,
+            'requests_per_route': args.requests * concurrency,
+            'database': make_url(app.config['SQLALCHEMY_DATABASE_URI']).render_as_string(hide_password=True),
+            'python': platform.python_version(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        },
+        'peak_rss_mb': round(resource.getrusage(who).ru_maxrss / 1024, 1),
+        'routes': routes,
+    }
+
+def compare_results(baseline, current, threshold=0.25, metric='p95_ms', min_delta_ms=1.0):
+    """Return human-readable regressions of current against baseline.
+
+    A route regresses when its metric grows by more than threshold (a fraction)
+    and by at least min_delta_ms, or when it issues more SQL statements.
+    """
+    regressions = []
+    for name, result in current['routes'].items():
+        base = baseline['routes'].get(name)
+        if not base:
+            continue
+        before, after = base[metric], result[metric]
+        if after > before * (1 + threshold) and after - before >= min_delta_ms:
+            regressions.append(f"{name}: {metric} {before:.2f}ms -> {after:.2f}ms (+{(after / before - 1) * 100:.0f}%)")
+        if result['sql_queries'] > base['sql_queries']:
+            regressions.append(f"{name}: SQL statements {base['sql_queries']} -> {result['sql_queries']}")
+        if result['errors'] and not base['errors']:
+            regressions.append(f"{name}: {result['errors']} failed requests")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hot routes and compare against a baseline')
+    parser.add_argument('--requests', type=int, default=50, help='Measured requests per route and client (default: 50)')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per route and client (default: 5)')
+    parser.add_argument('--gunicorn', action='store_true', help='Benchmark a real gunicorn server instead of the test client')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (default: 2)')
+    parser.add_argument('--mode', choices=['sync', 'gthread', 'gevent', 'asgi'], default='gthread',
+                        help='gunicorn worker model from gunicorn.conf.py (default: gthread)')
+    parser.add_argument('--open-streams', type=int, default=0, help='/events streams held open during a gunicorn run')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients against gunicorn (default: 4)')
+    parser.add_argument('--port', type=int, help='gunicorn port (default: a free port)')
+    parser.add_argument('--only', help='Regular expression selecting routes to run')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write results (default: benchmark_results.json)')
+    parser.add_argument('--baseline', help='Compare this run with a saved result and fail on regressions')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two saved results without running')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed p95 growth as a fraction (default: 0.25)')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+    else:
+        current = run_benchmarks(args)
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Peak RSS {current['peak_rss_mb']} MB; results written to {args.output}")
+        if not args.baseline:
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = compare_results(baseline, current, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print('No regressions against baseline')
+
+if __name__ == '__main__':
+    main()
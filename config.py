@@ -58,7 +58,8 @@ class Config:
     THUMBNAIL_SIZE = (300, 300)
     
     # Rate limiting
-    RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://'
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or os.environ.get('REDIS_URL') or 'memory://'
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
@@ -0,0 +1,117 @@
+"""
+Local debugging SMTP server
+Accepts mail on a local port and keeps it in memory (and prints it) instead of
+delivering it. Used by the tests and for trying the email outbox locally:
+
+    python debug_smtp.py --port 1025
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false flask --app app run-scheduler
+"""
+
+import argparse
+import socketserver
+import threading
+from email import message_from_bytes
+from email.policy import default as default_policy
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self):
+        self.reply('220 localhost debug SMTP ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+
+            if verb == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(raw[1:] if raw.startswith(b'..') else raw)
+                self.server.deliver(sender, recipients, b''.join(data))
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """SMTP stand-in that records every message it receives in ``self.messages``"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, echo=False):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.echo = echo
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def verify_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        return True
+
+    def deliver(self, sender, recipients, data):
+        message = message_from_bytes(data, policy=default_policy)
+        with self._lock:
+            self.messages.append({'sender': sender, 'recipients': recipients, 'message': message})
+        if self.echo:
+            print(f"---------- MESSAGE FOLLOWS ({', '.join(recipients)}) ----------")
+            print(data.decode(errors='replace'))
+            print("------------ END MESSAGE ------------")
+
+    def start(self):
+        """Serve in a background thread; returns self for chaining"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Print outgoing mail instead of delivering it')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    args = parser.parse_args()
+
+    server = DebugSMTPServer(args.host, args.port, echo=True)
+    print(f"Debug SMTP server listening on {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDebug SMTP server stopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+gunicorn settings
+Loaded automatically by ``gunicorn`` from the working directory (Procfile runs
+``gunicorn -c gunicorn.conf.py``). GUNICORN_MODE picks the worker model:
+
+    gthread (default)  threads per worker; simple and safe with every library
+    gevent             green threads; thousands of open /events streams and
+                       slow Stripe/SMTP calls only cost a greenlet each
+                       (pip install gevent; psycogreen for PostgreSQL)
+    asgi               uvicorn workers serving asgi.py, an asgiref adapter
+                       around app.py, for ASGI-only hosting
+
+Worker count comes from WEB_CONCURRENCY, else from the CPUs and memory the
+container may use. Benchmark numbers for each mode are in DEPLOYMENT_GUIDE.md.
+"""
+
+import gc
+import os
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _memory_limit_mb():
+    """The container's memory limit (cgroup v2 or v1), else physical memory"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:  # v1 reports "unlimited" as a huge number
+            return int(value) // (1024 * 1024)
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+
+mode = os.environ.get('GUNICORN_MODE', 'gthread')
+if mode not in ('gthread', 'gevent', 'asgi'):
+    raise RuntimeError(f"Unsupported GUNICORN_MODE {mode!r}; use gthread, gevent or asgi")
+
+if mode == 'gevent':
+    # Patch before app.py is preloaded so its sockets, locks and threads are cooperative
+    try:
+        from gevent import monkey
+    except ImportError:
+        raise RuntimeError('GUNICORN_MODE=gevent but the gevent package is not installed')
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass  # psycopg2 queries then block the worker while they run
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+wsgi_app = 'asgi:application' if mode == 'asgi' else 'app:app'
+worker_class = {'gthread': 'gthread', 'gevent': 'gevent', 'asgi': 'uvicorn.workers.UvicornWorker'}[mode]
+
+# Workers peaked at 110-120 MB RSS in benchmark.py runs; keep 20% of the limit free
+worker_memory_mb = _env_int('GUNICORN_WORKER_MEMORY_MB', 150)
+cpu_workers = 2 * _cpu_count() + 1 if mode == 'gthread' else _cpu_count()
+memory_workers = _memory_limit_mb() * 8 // 10 // worker_memory_mb
+workers = _env_int('WEB_CONCURRENCY', max(1, min(cpu_workers, memory_workers)))
+threads = _env_int('GUNICORN_THREADS', 4) if mode == 'gthread' else 1
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 1000)  # gevent: concurrent requests per worker
+
+# Import the app once in the master so workers fork with it loaded (less memory,
+# faster restarts); post_fork below drops the connections the master opened
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ['true', 'on', '1']
+
+# Recycle workers now and then so slow leaks cannot grow without bound; the
+# jitter keeps them from restarting all at once
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+timeout = _env_int('GUNICORN_TIMEOUT', 30)  # Kill a worker stuck this long
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)  # Let requests finish on restart/deploy
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)  # Longer than the default 2s, for a proxy reusing connections
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None  # Heartbeat file off the (maybe slow) disk
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # "-" for stdout
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+def when_ready(server):
+    """Warm up the preloaded app in the master, then freeze it so forked workers share its pages"""
+    if not preload_app:
+        return
+    from app import warm_up
+    state = warm_up()
+    gc.freeze()  # Keep the collector from touching (and copying) inherited objects in every worker
+    if state['ready']:
+        server.log.info(f"Warmed up {state['templates']} templates in {state['seconds']}s before forking")
+    else:
+        server.log.warning(f"Warm-up failed before forking ({state['error']}); workers will retry on /readyz")
+
+def post_worker_init(worker):
+    """Without preload each worker imports the app itself; warm it before it takes traffic"""
+    if not preload_app:
+        from app import warm_up
+        warm_up()
+
+def post_fork(server, worker):
+    """Give each worker its own database connections instead of the master's"""
+    if not preload_app:
+        return
+    from app import app, db
+    from replicas import RoutingSession
+    with app.app_context():
+        db.engine.dispose(close=False)
+    for engine in RoutingSession.replicas.engines:
+        engine.dispose(close=False)
@@ -4,7 +4,8 @@ This script adds the new fields for cooking and teaching services
 """
 
 import os
-from app import app, db
+from app import (app, db, migrate_json_list_columns, rebuild_chef_cards, rebuild_dietary_index, rebuild_ranking_scores,
+                 remove_duplicate_reviews, stamp_schema_version, SCHEMA_VERSION)
 from sqlalchemy import text
 
 def migrate_production_database():
@@ -24,6 +25,7 @@ def migrate_production_database():
                 print(f"Error getting table info: {e}")
                 # If tables don't exist, create them
                 db.create_all()
+                stamp_schema_version()
                 print("Created all tables")
                 return True
             
@@ -35,7 +37,10 @@ def migrate_production_database():
                 ('cuisine_types', 'TEXT'),
                 ('teaching_price_per_person', 'NUMERIC(10, 2)'),
                 ('offers_teaching', 'BOOLEAN DEFAULT TRUE'),
-                ('teaching_experience', 'TEXT')
+                ('teaching_experience', 'TEXT'),
+                ('pricing_version', 'INTEGER NOT NULL DEFAULT 1'),
+                ('menu_version', 'INTEGER NOT NULL DEFAULT 1'),
+                ('ranking_score', 'FLOAT NOT NULL DEFAULT 0')
             ]
             
             for column_name, column_type in new_chef_columns:
@@ -50,10 +55,40 @@ def migrate_production_database():
                 else:
                     print(f"Column {column_name} already exists in chef_profile")
             
+            # Add new columns to chef_card table (created by create_all below if missing)
+            if inspector.has_table('chef_card'):
+                card_columns = [col['name'] for col in inspector.get_columns('chef_card')]
+                for column_name, column_type in [('ranking_score', 'FLOAT NOT NULL DEFAULT 0'),
+                                                 ('dietary_mask', 'INTEGER NOT NULL DEFAULT 0')]:
+                    if column_name not in card_columns:
+                        try:
+                            with db.engine.connect() as conn:
+                                conn.execute(text(f"ALTER TABLE chef_card ADD COLUMN {column_name} {column_type}"))
+                                conn.commit()
+                            print(f"Added column {column_name} to chef_card")
+                        except Exception as e:
+                            print(f"Error adding {column_name}: {e}")
+                    else:
+                        print(f"Column {column_name} already exists in chef_card")
+            
+            # Add new columns to menu table
+            menu_columns = [col['name'] for col in inspector.get_columns('menu')]
+            if 'dietary_mask' not in menu_columns:
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(text("ALTER TABLE menu ADD COLUMN dietary_mask INTEGER NOT NULL DEFAULT 0"))
+                        conn.commit()
+                    print("Added column dietary_mask to menu")
+                except Exception as e:
+                    print(f"Error adding dietary_mask: {e}")
+            else:
+                print("Column dietary_mask already exists in menu")
+            
             # Add new columns to booking table
             new_booking_columns = [
                 ('service_type', 'VARCHAR(20) DEFAULT \'cooking_only\''),
-                ('cuisine_preference', 'VARCHAR(50)')
+                ('cuisine_preference', 'VARCHAR(50)'),
+                ('idempotency_key', 'VARCHAR(64)')
             ]
             
             for column_name, column_type in new_booking_columns:
@@ -68,6 +103,106 @@ def migrate_production_database():
                 else:
                     print(f"Column {column_name} already exists in booking")
             
+            # Add new columns to user table ("user" is reserved in PostgreSQL)
+            user_columns = [col['name'] for col in inspector.get_columns('user')]
+            new_user_columns = [
+                ('unread_messages', 'INTEGER NOT NULL DEFAULT 0')
+            ]
+            
+            for column_name, column_type in new_user_columns:
+                if column_name not in user_columns:
+                    try:
+                        with db.engine.connect() as conn:
+                            conn.execute(text(f'ALTER TABLE "user" ADD COLUMN {column_name} {column_type}'))
+                            conn.commit()
+                        print(f"Added column {column_name} to user")
+                    except Exception as e:
+                        print(f"Error adding {column_name}: {e}")
+                else:
+                    print(f"Column {column_name} already exists in user")
+            
+            # Widen password_hash for scrypt/bcrypt hashes (SQLite ignores VARCHAR lengths)
+            if db.engine.dialect.name == 'postgresql':
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
+                        conn.commit()
+                    print("Widened user.password_hash to VARCHAR(255)")
+                except Exception as e:
+                    print(f"Error widening password_hash: {e}")
+                
+                # Bookings may now be made without picking one of the chef's menus
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(text('ALTER TABLE booking ALTER COLUMN menu_id DROP NOT NULL'))
+                        conn.commit()
+                    print("Made booking.menu_id optional")
+                except Exception as e:
+                    print(f"Error relaxing booking.menu_id: {e}")
+            
+            # Add indexes created after the tables were first deployed
+            new_indexes = [
+                ('ix_message_booking_id_id', 'message (booking_id, id)'),
+                ('ix_booking_chef_id_event_date', 'booking (chef_id, event_date)'),
+                ('ix_booking_chef_id_status_event_date', 'booking (chef_id, status, event_date)'),
+                ('ix_booking_client_id_status_event_date', 'booking (client_id, status, event_date)'),
+                ('ix_menu_chef_id', 'menu (chef_id)'),
+                ('ix_menu_item_menu_id_order', 'menu_item (menu_id, "order")'),
+                ('ix_menu_photo_menu_id', 'menu_photo (menu_id)'),
+                ('ix_chef_card_available_ranking', 'chef_card (is_available, ranking_score)')
+            ]
+            
+            for index_name, index_target in new_indexes:
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {index_target}"))
+                        conn.commit()
+                    print(f"Ensured index {index_name}")
+                except Exception as e:
+                    print(f"Error creating index {index_name}: {e}")
+            
+            # Unique indexes that make form resubmissions harmless; older
+            # duplicate reviews have to go first
+            try:
+                print(f"Removed {remove_duplicate_reviews()} duplicate reviews")
+            except Exception as e:
+                print(f"Error removing duplicate reviews: {e}")
+            new_unique_indexes = [
+                ('uq_review_booking_id', 'review (booking_id)'),
+                ('uq_booking_client_id_idempotency_key', 'booking (client_id, idempotency_key)')
+            ]
+            
+            for index_name, index_target in new_unique_indexes:
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {index_target}"))
+                        conn.commit()
+                    print(f"Ensured unique index {index_name}")
+                except Exception as e:
+                    print(f"Error creating index {index_name}: {e}")
+            
+            # Comma-separated list columns become JSON arrays (JSONB on PostgreSQL)
+            try:
+                print(f"Rewrote {migrate_json_list_columns()} rows with JSON list columns")
+                if db.engine.dialect.name == 'postgresql':
+                    with db.engine.connect() as conn:
+                        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_chef_card_cuisine_types ON chef_card USING gin (cuisine_types)'))
+                        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_chef_card_service_areas ON chef_card USING gin (service_areas)'))
+                        conn.commit()
+                    print("Ensured GIN indexes on chef_card list columns")
+            except Exception as e:
+                print(f"Error converting list columns: {e}")
+            
+            # Create tables added since the first deploy, score every chef, mask
+            # and index every menu, then backfill the chef card read model
+            db.create_all()
+            print(f"Scored {rebuild_ranking_scores()['rows_updated']} chefs")
+            counts = rebuild_dietary_index()
+            print(f"Indexed {counts['terms']} ingredient terms over {counts['menus']} menus")
+            print(f"Wrote {rebuild_chef_cards()['rows_written']} chef cards")
+            stamp_schema_version()
+            print(f"Stamped schema version {SCHEMA_VERSION}")
+            
             print("Production database migration completed successfully!")
             return True
             
@@ -0,0 +1,158 @@
+"""
+Local S3 stand-in
+Serves path-style object PUT/GET/HEAD/DELETE from memory, checking AWS
+Signature Version 4 on both signed requests and presigned URLs, so upload
+storage and direct browser uploads can be tested without MinIO or network
+access:
+
+    python mock_s3.py --port 9100
+    STORAGE_URL=s3://uploads S3_ENDPOINT_URL=http://localhost:9100 \
+        S3_ACCESS_KEY_ID=mock S3_SECRET_ACCESS_KEY=mock-secret python app.py
+"""
+
+import argparse
+import hashlib
+import hmac
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit, unquote
+from storage import UNSIGNED_PAYLOAD, canonical_request, signature
+
+class _S3Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body=b'', content_type='application/xml'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_error_code(self, status, code):
+        self.send_body(status, f'<?xml version="1.0"?><Error><Code>{code}</Code></Error>'.encode())
+
+    def _object(self):
+        bucket, _, key = unquote(urlsplit(self.path).path).lstrip('/').partition('/')
+        return bucket, key
+
+    def _authorized(self, body):
+        """Check the Authorization header or X-Amz-* query signature against the server's keys"""
+        server = self.server
+        url = f'http://{self.headers["Host"]}{self.path}'
+        query = dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+        if 'X-Amz-Signature' in query:
+            given = query.pop('X-Amz-Signature')
+            access_key, date_stamp, region = query.get('X-Amz-Credential', '').split('/')[:3]
+            amz_date = query.get('X-Amz-Date', '')
+            issued = datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ')
+            if datetime.utcnow() > issued + timedelta(seconds=int(query.get('X-Amz-Expires', 0))):
+                return False
+            signed_headers = query['X-Amz-SignedHeaders'].split(';')
+            payload_hash = UNSIGNED_PAYLOAD
+        else:
+            auth = self.headers.get('Authorization', '')
+            if not auth.startswith('AWS4-HMAC-SHA256 '):
+                return False
+            fields = dict(part.strip().split('=', 1) for part in auth[len('AWS4-HMAC-SHA256 '):].split(','))
+            access_key, date_stamp, region = fields['Credential'].split('/')[:3]
+            signed_headers = fields['SignedHeaders'].split(';')
+            given = fields['Signature']
+            amz_date = self.headers.get('x-amz-date', '')
+            payload_hash = self.headers.get('x-amz-content-sha256', '')
+            if payload_hash != UNSIGNED_PAYLOAD and payload_hash != hashlib.sha256(body).hexdigest():
+                return False
+            query = None
+        secret = server.credentials.get(access_key)
+        if secret is None or not amz_date.startswith(date_stamp):
+            return False
+        headers = {name: self.headers.get(name, '') for name in signed_headers}
+        request = canonical_request(self.command, url, headers, signed_headers, payload_hash, query)
+        return hmac.compare_digest(signature(secret, amz_date, region, request), given)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+
+        bucket, key = self._object()
+        if bucket != server.bucket or not key:
+            return self.send_error_code(404, 'NoSuchBucket')
+        public_read = self.command in ('GET', 'HEAD') and server.public_read
+        if not public_read and not self._authorized(body):
+            return self.send_error_code(403, 'SignatureDoesNotMatch')
+
+        with server.lock:
+            if self.command == 'PUT':
+                server.objects[key] = (body, self.headers.get('Content-Type', 'application/octet-stream'))
+                return self.send_body(200)
+            if self.command == 'DELETE':
+                server.objects.pop(key, None)
+                return self.send_body(204)
+            stored = server.objects.get(key)
+        if stored is None:
+            return self.send_error_code(404, 'NoSuchKey')
+        self.send_body(200, stored[0], stored[1])
+
+    do_PUT = do_GET = do_HEAD = do_DELETE = _handle
+
+    def do_OPTIONS(self):
+        """CORS preflight for browser uploads to presigned URLs"""
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, PUT, HEAD')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+class MockS3Server(ThreadingHTTPServer):
+    """One in-memory bucket; objects are readable without signing when ``public_read``"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, bucket='uploads', access_key='mock', secret_key='mock-secret',
+                 public_read=True):
+        super().__init__((host, port), _S3Handler)
+        self.lock = threading.Lock()
+        self.bucket = bucket
+        self.credentials = {access_key: secret_key}
+        self.public_read = public_read
+        self.objects = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        """Serve in a background thread; returns self for chaining"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for an S3 bucket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--bucket', default='uploads')
+    parser.add_argument('--access-key', default='mock')
+    parser.add_argument('--secret-key', default='mock-secret')
+    args = parser.parse_args()
+
+    server = MockS3Server(args.host, args.port, args.bucket, args.access_key, args.secret_key)
+    print(f"Mock S3 bucket '{args.bucket}' listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nMock S3 stopped")
+
+if __name__ == '__main__':
+    main()
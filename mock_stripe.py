@@ -0,0 +1,133 @@
+"""
+Local Stripe stand-in
+Serves the small part of the Stripe REST API the app uses (PaymentIntents) so
+payments can be tested without network access, and signs webhook payloads the
+same way Stripe does:
+
+    python mock_stripe.py --port 12111
+    STRIPE_API_BASE=http://localhost:12111 STRIPE_SECRET_KEY=sk_test_mock python app.py
+"""
+
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+def sign_webhook_payload(payload, secret, timestamp=None):
+    """Return a Stripe-Signature header value for payload (str)"""
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def _parse_form(body):
+    """Decode Stripe's form encoding, including metadata[key]=value pairs"""
+    params = {}
+    for key, values in parse_qs(body).items():
+        if '[' in key:
+            outer, inner = key.rstrip(']').split('[', 1)
+            params.setdefault(outer, {})[inner] = values[0]
+        else:
+            params[key] = values[0]
+    return params
+
+class _StripeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        params = _parse_form(self.rfile.read(length).decode())
+        server = self.server
+        with server.lock:
+            server.requests.append(('POST', self.path, dict(self.headers), params))
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        if self.path == '/v1/payment_intents':
+            idempotency_key = self.headers.get('Idempotency-Key')
+            with server.lock:
+                if idempotency_key and idempotency_key in server.idempotent_responses:
+                    return self.send_json(200, server.idempotent_responses[idempotency_key])
+                intent_id = f"pi_mock_{next(server.ids)}"
+                intent = {
+                    'id': intent_id,
+                    'object': 'payment_intent',
+                    'amount': int(params.get('amount', 0)),
+                    'currency': params.get('currency', 'usd'),
+                    'metadata': params.get('metadata', {}),
+                    'status': 'requires_payment_method',
+                    'client_secret': f"{intent_id}_secret_mock"
+                }
+                server.payment_intents[intent_id] = intent
+                if idempotency_key:
+                    server.idempotent_responses[idempotency_key] = intent
+            return self.send_json(200, intent)
+
+        self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': f'Unknown path {self.path}'}})
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(('GET', self.path, dict(self.headers), {}))
+        if self.path.startswith('/v1/payment_intents/'):
+            intent = server.payment_intents.get(self.path.rsplit('/', 1)[1])
+            if intent:
+                return self.send_json(200, intent)
+        self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}})
+
+class MockStripeServer(ThreadingHTTPServer):
+    """In-memory PaymentIntent API; ``delay`` simulates a slow Stripe"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0):
+        super().__init__((host, port), _StripeHandler)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.payment_intents = {}
+        self.idempotent_responses = {}
+        self.requests = []
+        self.delay = delay
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        """Serve in a background thread; returns self for chaining"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the Stripe API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12111)
+    args = parser.parse_args()
+
+    server = MockStripeServer(args.host, args.port)
+    print(f"Mock Stripe API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nMock Stripe API stopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Password hashing
+Hashes and verifies passwords with a configurable algorithm (pbkdf2, scrypt or
+bcrypt) and cost, optionally on a small process pool so the CPU-heavy work
+runs outside the request's worker. A bounded number of hashes may be queued
+at once; beyond that PasswordHasherBusy is raised so a login storm is turned
+away quickly instead of stalling every other request.
+
+Kept free of app imports so the pool's worker processes start cheaply.
+"""
+
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashes are already queued or a hash took too long"""
+
+def werkzeug_method(algorithm, cost):
+    """Werkzeug method string for pbkdf2 (iterations) or scrypt (N)"""
+    if algorithm == 'pbkdf2':
+        return f'pbkdf2:sha256:{cost}'
+    if algorithm == 'scrypt':
+        return f'scrypt:{cost}:8:1'
+    raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+
+def hash_password(password, algorithm, cost):
+    if algorithm == 'bcrypt':
+        import bcrypt
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=cost)).decode()
+    return generate_password_hash(password, method=werkzeug_method(algorithm, cost))
+
+def verify_password(password_hash, password):
+    """Check password against a hash made by any supported algorithm"""
+    if not password_hash:
+        return False
+    if password_hash.startswith('$2'):
+        import bcrypt
+        return bcrypt.checkpw(password.encode(), password_hash.encode())
+    return check_password_hash(password_hash, password)
+
+def hash_parameters(password_hash):
+    """(algorithm, cost) a stored hash was made with, or None if unrecognised"""
+    if password_hash.startswith('$2'):
+        return 'bcrypt', int(password_hash.split('$')[2])
+    method = password_hash.split('$', 1)[0].split(':')
+    if method[0] == 'pbkdf2' and len(method) == 3:
+        return 'pbkdf2', int(method[2])
+    if method[0] == 'scrypt' and len(method) == 4:
+        return 'scrypt', int(method[1])
+    return None
+
+class PasswordHasher:
+    """Hash/verify front end enforcing the configured algorithm, cost and queue depth.
+
+    workers=0 hashes on the calling thread; otherwise a process pool of that
+    size is started lazily in each (forked) worker process.
+    """
+
+    def __init__(self, algorithm='scrypt', cost=32768, workers=0, max_pending=16, timeout=10):
+        self.algorithm = algorithm
+        self.cost = cost
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+                atexit.register(self._pool.shutdown, wait=False)
+            return self._pool
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy('Too many password hashes queued')
+        if not self.workers:
+            try:
+                return func(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._executor().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the pool is done with the hash, even if we stop
+        # waiting for it, so abandoned hashes still count towards max_pending
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()  # Only succeeds while the hash is still queued
+            raise PasswordHasherBusy('Password hashing timed out')
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.algorithm, self.cost)
+
+    def verify(self, password_hash, password):
+        return self._run(verify_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different algorithm or cost than configured"""
+        return hash_parameters(password_hash or '') != (self.algorithm, self.cost)
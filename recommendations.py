@@ -0,0 +1,127 @@
+"""
+Chef recommendations
+Kept free of app imports so the scoring can be tested and profiled on its own;
+app.rebuild_recommendations() feeds it rows from the database and stores the
+results. Only the scheduler worker imports this module, so web workers do not
+load NumPy.
+
+Clients and chefs are both described by affinity rows over the same features
+(cuisines and occasions). A client's row sums their bookings; a chef's row sums
+the bookings they served plus the cuisines they list. Reviews scale a booking's
+weight, so a 1-star experience counts for nothing and a 5-star one double.
+Rows are L2-normalized and compared by cosine similarity, blended with the
+chef's ranking score so that among similar chefs the better ones come first.
+
+Memory is bounded by the affinity matrices (entities x features, a few dozen
+columns) plus one block of clients x chefs scores at a time, sized to stay
+within max_block_bytes.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    raise RuntimeError('Recommendations need the numpy package (pip install numpy)')
+
+STATUS_WEIGHTS = {'completed': 1.0, 'confirmed': 1.0, 'pending': 0.5}  # Cancelled and expired bookings say little
+OCCASION_WEIGHT = 0.5  # An occasion counts half as much as a cuisine
+OFFERED_CUISINE_WEIGHT = 2.0  # Per cuisine a chef lists on their profile
+QUALITY_WEIGHT = 0.2  # Share of the final score taken from the ranking score
+DISLIKED_RATING = 2  # Never recommend a chef the client rated this low or lower
+
+def interaction_weight(status, rating=None):
+    """How much one booking says about taste: by status, scaled by the review if any"""
+    weight = STATUS_WEIGHTS.get(status, 0.0)
+    if rating is not None:
+        weight *= 1 + (rating - 3) / 2
+    return weight
+
+class FeatureIndex:
+    """Column numbers for cuisine and occasion features"""
+
+    def __init__(self, cuisines, occasions):
+        self.names = [f'cuisine:{name}' for name in cuisines] + [f'occasion:{name}' for name in occasions]
+        self.columns = {name: column for column, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def cuisine(self, name):
+        return self.columns.get(f'cuisine:{(name or "").strip().lower()}')
+
+    def occasion(self, name):
+        return self.columns.get(f'occasion:{(name or "").strip().lower()}')
+
+    def cuisine_columns(self):
+        """(cuisine name, column) for every cuisine feature"""
+        return [(name.split(':', 1)[1], column) for column, name in enumerate(self.names) if name.startswith('cuisine:')]
+
+class AffinityMatrix:
+    """Dense entities x features weights, filled from (row, column, weight) batches"""
+
+    def __init__(self, n_rows, n_features):
+        self.values = np.zeros((n_rows, n_features), dtype=np.float32)
+
+    def add(self, rows, columns, weights):
+        """Accumulate one batch; repeated (row, column) pairs add up"""
+        if len(rows):
+            np.add.at(self.values, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)),
+                      np.asarray(weights, dtype=np.float32))
+
+    def normalized(self):
+        """Rows scaled to unit length (all-zero rows stay zero)"""
+        norms = np.linalg.norm(self.values, axis=1, keepdims=True)
+        return np.divide(self.values, norms, out=np.zeros_like(self.values), where=norms > 0)
+
+def top_k(scores, k):
+    """Column indices of the k best finite scores in each row, best first, and their scores.
+
+    Returns a list with one (indices, scores) pair of arrays per row.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return [(np.empty(0, dtype=np.intp), np.empty(0, dtype=scores.dtype)) for _ in range(scores.shape[0])]
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+    result = []
+    for indices, values in zip(candidates, candidate_scores):
+        keep = np.isfinite(values)
+        result.append((indices[keep], values[keep]))
+    return result
+
+def blend(similarity, quality):
+    """Final score: cosine similarity (0-1) blended with the ranking score scaled to 0-1"""
+    return (1 - QUALITY_WEIGHT) * similarity + QUALITY_WEIGHT * quality
+
+def recommend_for_clients(clients, chefs, quality, k, excluded=None, max_block_bytes=64 * 1024 * 1024):
+    """Yield (client row, chef indices, scores) with the top k chefs for every client with any affinity.
+
+    clients and chefs are normalized affinity matrices; quality holds each
+    chef's ranking score scaled to 0-1; excluded maps a client row to chef
+    indices never to recommend to them.
+    """
+    excluded = excluded or {}
+    n_chefs = chefs.shape[0]
+    block_rows = max(1, max_block_bytes // (4 * max(n_chefs, 1)))
+    quality = np.asarray(quality, dtype=np.float32)
+    active = np.flatnonzero(clients.any(axis=1))
+    for start in range(0, len(active), block_rows):
+        rows = active[start:start + block_rows]
+        scores = blend(clients[rows] @ chefs.T, quality)
+        for offset, row in enumerate(rows):
+            if row in excluded:
+                scores[offset, excluded[row]] = -np.inf
+        for row, (indices, values) in zip(rows, top_k(scores, k)):
+            yield int(row), indices, values
+
+def recommend_for_features(chefs, quality, columns, k):
+    """Top k chefs for each feature column, for visitors without history: {column: (indices, scores)}"""
+    quality = np.asarray(quality, dtype=np.float32)
+    result = {}
+    for column in columns:
+        affinity = chefs[:, column]
+        scores = np.where(affinity > 0, blend(affinity, quality), -np.inf).astype(np.float32)
+        result[column] = top_k(scores[np.newaxis, :], k)[0]
+    return result
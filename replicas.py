@@ -0,0 +1,118 @@
+"""
+Read replicas
+Routes SELECTs from views marked read-only to replica engines. Anything else
+(flushes, INSERT/UPDATE/DELETE, raw SQL, SELECT ... FOR UPDATE) and every query
+after the session has written goes to the primary, so a request always reads
+its own writes. Replicas that fail a health check or raise a disconnect error
+are skipped for a while and their reads fall back to the primary.
+
+Kept free of app imports; app.py wires it up from config.
+"""
+
+import itertools
+import threading
+import time
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc, text
+
+class ReplicaPool:
+    """Replica engines with cached health checks, chosen round-robin"""
+
+    def __init__(self, urls=(), engine_options=None, health_check_seconds=5, retry_seconds=30, max_lag_seconds=None):
+        self.engine_options = engine_options or {}
+        self.health_check_seconds = health_check_seconds
+        self.retry_seconds = retry_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self._lock = threading.Lock()
+        self.configure(urls)
+
+    def configure(self, urls):
+        """Replace the replica set (used at startup and by tests)"""
+        with self._lock:
+            for engine in getattr(self, 'engines', []):
+                engine.dispose()
+            self.engines = [self._create_engine(url) for url in urls if url]
+            self._checked_at = {}
+            self._down_until = {}
+            self._cycle = itertools.cycle(self.engines)
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def _create_engine(self, url):
+        engine = create_engine(url, **self.engine_options)
+        event.listen(engine, 'handle_error', self._on_error)
+        return engine
+
+    def _on_error(self, context):
+        if context.is_disconnect or isinstance(context.original_exception, exc.OperationalError):
+            self.mark_unhealthy(context.engine)
+
+    def mark_unhealthy(self, engine):
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.retry_seconds
+
+    def _healthy(self, engine, now):
+        if self._down_until.get(engine, 0) > now:
+            return False
+        if now - self._checked_at.get(engine, float('-inf')) < self.health_check_seconds:
+            return True
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                if self.max_lag_seconds is not None and engine.dialect.name == 'postgresql':
+                    lag = conn.execute(text(
+                        'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+                    )).scalar()
+                    if lag > self.max_lag_seconds:
+                        raise exc.OperationalError('replica lag check', None, Exception(f'{lag:.1f}s behind'))
+        except exc.SQLAlchemyError:
+            self.mark_unhealthy(engine)
+            return False
+        self._checked_at[engine] = now
+        return True
+
+    def choose(self):
+        """A healthy replica engine, or None to use the primary"""
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self._healthy(engine, now):
+                return engine
+        return None
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible reads to ReplicaPool engines.
+
+    Reads are eligible only while g.use_replica is set (see the read_only_view
+    decorator in app.py) and the session has not written anything yet.
+    """
+
+    replicas = ReplicaPool()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._replica_eligible(clause):
+            engine = self.replicas.choose()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_eligible(self, clause):
+        if not self.replicas or self.info.get('wrote') or self._flushing:
+            return False
+        if clause is None or not getattr(clause, 'is_select', False) or getattr(clause, '_for_update_arg', None) is not None:
+            return False
+        if self.new or self.dirty or self.deleted:
+            return False  # The next autoflush will write
+        return has_app_context() and g.get('use_replica', False)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_wrote_after_flush(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_wrote_on_dml(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
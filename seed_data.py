@@ -0,0 +1,362 @@
+"""
+Bulk marketplace seeding
+Generates a realistic dataset (clients, chefs, menus, availability, bookings
+and reviews) for benchmarking and load testing. Rows are written with Core
+insert() executemany in fixed-size batches, and the same --seed and --today
+always produce the same data:
+
+    python seed_data.py                          # about 1M rows
+    python seed_data.py --scale 0.01 --seed 7    # small local dataset
+
+Every seeded account uses the password "password123".
+"""
+
+import argparse
+import itertools
+import random
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as clock
+from app import (app, db, User, ChefProfile, Menu, MenuItem, ChefAvailability, Booking, Review,
+                 compute_quote, rebuild_dietary_index, release_availability, refresh_chef_cards)
+from passwords import hash_password
+
+SEED_PASSWORD = 'password123'
+
+# Row volumes at --scale 1.0 (about 1M rows in total)
+VOLUMES = {
+    'clients': 100000,
+    'chefs': 10000,
+    'bookings': 450000,
+}
+MENUS_PER_CHEF = 3
+ITEMS_PER_MENU = 4
+AVAILABILITY_DAYS = 20
+REVIEW_RATE = 0.6  # Share of completed bookings that get a review
+
+FIRST_NAMES = ['Sara', 'Ali', 'Maryam', 'Reza', 'Priya', 'Arjun', 'Mei', 'Wei', 'Giulia', 'Marco',
+               'Camille', 'Louis', 'Sofia', 'Diego', 'Yuki', 'Haruto', 'Ananya', 'Noah', 'Emma', 'Liam',
+               'Olivia', 'Lucas', 'Minh', 'Linh', 'Ji-woo', 'Min-jun', 'Isabel', 'Paolo', 'Leila', 'Omar']
+LAST_NAMES = ['Ahmadi', 'Hosseini', 'Karimi', 'Patel', 'Sharma', 'Chen', 'Wang', 'Li', 'Rossi', 'Bianchi',
+              'Martin', 'Bernard', 'Garcia', 'Lopez', 'Tanaka', 'Sato', 'Nguyen', 'Tran', 'Kim', 'Park',
+              'Smith', 'Brown', 'Wilson', 'Santos', 'Reyes', 'Singh', 'Mehta', 'Moretti', 'Dubois', 'Haddad']
+
+# (cuisine, relative share of chefs)
+CUISINES = [('persian', 18), ('indian', 14), ('chinese', 14), ('italian', 12), ('japanese', 8),
+            ('mexican', 7), ('mediterranean', 7), ('french', 5), ('thai', 5), ('korean', 4),
+            ('vietnamese', 3), ('filipino', 2), ('american', 1)]
+AREAS = [('Metrotown', 25), ('Brentwood', 18), ('Edmonds', 12), ('Lougheed', 12),
+         ('Burnaby Heights', 10), ('Deer Lake', 8), ('Highgate', 8), ('Kingsway', 7)]
+OCCASIONS = [('dinner_party', 35), ('birthday', 18), ('romantic_dinner', 12), ('anniversary', 10),
+             ('corporate_event', 8), ('meal_prep', 8), ('cooking_class', 6), ('other', 3)]
+COURSES = ['appetizer', 'main', 'side', 'dessert']
+DIETARY_TAGS = ['vegetarian', 'vegan', 'gluten-free', 'dairy-free', 'nut-free', 'halal']
+INGREDIENTS = ['basmati rice', 'saffron', 'pistachios', 'walnuts', 'almonds', 'yogurt', 'butter', 'cream',
+               'eggs', 'wheat flour', 'chickpeas', 'lentils', 'eggplant', 'tomatoes', 'onions', 'garlic',
+               'chicken', 'lamb', 'salmon', 'shrimp', 'tofu', 'sesame seeds', 'fresh herbs', 'lemon']
+REVIEW_RATINGS = ([1, 2, 3, 4, 5], [3, 5, 12, 30, 50])
+
+def _weighted(options):
+    values, weights = zip(*options)
+    return list(values), list(itertools.accumulate(weights))
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _next_id(model):
+    return (db.session.execute(db.select(db.func.max(model.id))).scalar() or 0) + 1
+
+def bulk_insert(model, rows, batch_size):
+    """executemany a stream of row dicts in batches; returns the number of rows written"""
+    count = 0
+    with db.engine.begin() as connection:
+        for batch in _batched(rows, batch_size):
+            connection.execute(db.insert(model), batch)
+            count += len(batch)
+    return count
+
+class MarketplaceSeeder:
+    """Generates rows for each table from one seeded random stream"""
+
+    def __init__(self, seed=42, scale=1.0, today=None):
+        self.rng = random.Random(seed)
+        self.today = today or date.today()
+        self.now = datetime.combine(self.today, clock(12, 0))
+        self.counts = {name: max(1, int(volume * scale)) for name, volume in VOLUMES.items()}
+        self.password_hash = hash_password(SEED_PASSWORD, app.config['PASSWORD_HASH_ALGORITHM'], app.config['PASSWORD_HASH_COST'])
+        self.cuisines = _weighted(CUISINES)
+        self.areas = _weighted(AREAS)
+        self.occasions = _weighted(OCCASIONS)
+        self.chefs = []  # [user_id, profile_id, (base, teaching, travel), cuisines, [(menu_id, menu_price)]]
+        self.completed = []  # (booking_id, client_id, chef_user_id, event_date)
+
+    def pick(self, weighted, k=1):
+        values, cum_weights = weighted
+        return self.rng.choices(values, cum_weights=cum_weights, k=k)
+
+    def person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def past(self, max_days):
+        return self.now - timedelta(days=self.rng.uniform(0, max_days))
+
+    def users(self, first_id, count, role):
+        for user_id in range(first_id, first_id + count):
+            first_name, last_name = self.person()
+            yield {
+                'id': user_id,
+                'email': f"seed-{role}-{user_id}@example.com",
+                'password_hash': self.password_hash,
+                'first_name': first_name,
+                'last_name': last_name,
+                'phone': f"604-555-{user_id % 10000:04d}",
+                'role': role,
+                'is_verified': self.rng.random() < 0.8,
+                'created_at': self.past(730),
+                'unread_messages': 0,
+            }
+
+    def chef_profiles(self, first_id, first_user_id, count):
+        for offset in range(count):
+            cuisines = sorted(set(self.pick(self.cuisines, k=self.rng.choice([1, 1, 2, 3]))))
+            areas = sorted(set(self.pick(self.areas, k=self.rng.choice([1, 2, 2, 3]))))
+            base_price = round(min(max(self.rng.lognormvariate(4.1, 0.35), 25), 300))
+            teaching_price = round(base_price * self.rng.uniform(0.15, 0.4))
+            travel_fee = self.rng.choice([0, 0, 10, 15, 20, 25])
+            pricing = (base_price, teaching_price, travel_fee)
+            self.chefs.append([first_user_id + offset, first_id + offset, pricing, cuisines, []])
+            yield {
+                'id': first_id + offset,
+                'user_id': first_user_id + offset,
+                'bio': f"Home chef cooking {' and '.join(c.title() for c in cuisines)} food across {', '.join(areas)}.",
+                'specialties': [cuisine.title() for cuisine in cuisines],
+                'cuisine_types': cuisines,
+                'experience_years': self.rng.randint(1, 30),
+                'service_areas': [area.lower() for area in areas],  # Stored lowercase, as the model validator does
+                'base_price_per_person': base_price,
+                'teaching_price_per_person': teaching_price,
+                'min_guests': self.rng.choice([1, 2, 2, 4]),
+                'max_guests': self.rng.choice([8, 12, 20, 20, 30]),
+                'travel_fee': travel_fee,
+                'is_available': self.rng.random() < 0.9,
+                'offers_teaching': self.rng.random() < 0.6,
+                'rating': 0,
+                'total_reviews': 0,
+                'response_time_hours': self.rng.choice([4, 12, 24, 24, 48]),
+                'pricing_version': 1,
+                'created_at': self.past(730),
+            }
+
+    def menus(self, first_id):
+        menu_id = first_id
+        for chef in self.chefs:
+            base_price, cuisines = chef[2][0], chef[3]
+            for number in range(MENUS_PER_CHEF):
+                price = round(base_price * self.rng.uniform(0.9, 1.6))
+                chef[4].append((menu_id, price))
+                yield {
+                    'id': menu_id,
+                    'chef_id': chef[1],
+                    'name': f"{self.rng.choice(cuisines).title()} Menu {number + 1}",
+                    'description': 'Seasonal multi-course menu',
+                    'price_per_person': price,
+                    'course_count': ITEMS_PER_MENU,
+                    'prep_time_hours': self.rng.randint(1, 4),
+                    'dietary_tags': self.rng.sample(DIETARY_TAGS, self.rng.randint(0, 2)),
+                    'ingredients': self.rng.sample(INGREDIENTS, self.rng.randint(4, 8)),
+                    'is_featured': number == 0,
+                    'created_at': self.past(365),
+                }
+                menu_id += 1
+
+    def menu_items(self, first_id):
+        item_id = first_id
+        for chef in self.chefs:
+            for menu_id, _ in chef[4]:
+                for order, course in enumerate(COURSES[:ITEMS_PER_MENU]):
+                    yield {
+                        'id': item_id,
+                        'menu_id': menu_id,
+                        'course_type': course,
+                        'name': f"{course.title()} {order + 1}",
+                        'description': None,
+                        'order': order,
+                    }
+                    item_id += 1
+
+    def availability(self, first_id):
+        slot_id = first_id
+        for chef in self.chefs:
+            for offset in sorted(self.rng.sample(range(1, 61), AVAILABILITY_DAYS)):
+                start, end = self.rng.choice([(clock(11, 0), clock(15, 0)), (clock(17, 0), clock(22, 0))])
+                yield {
+                    'id': slot_id,
+                    'chef_id': chef[1],
+                    'date': self.today + timedelta(days=offset),
+                    'start_time': start,
+                    'end_time': end,
+                    'is_available': True,
+                    'max_bookings': self.rng.choice([1, 1, 2]),
+                    'current_bookings': 0,
+                }
+                slot_id += 1
+
+    def booking_status(self, event_date):
+        roll = self.rng.random()
+        if event_date < self.today:
+            status = 'completed' if roll < 0.75 else 'cancelled' if roll < 0.85 else 'expired'
+        else:
+            status = 'pending' if roll < 0.35 else 'confirmed' if roll < 0.9 else 'cancelled'
+        if status in ('completed', 'confirmed'):
+            payment_status = 'paid'
+        elif status == 'cancelled' and self.rng.random() < 0.5:
+            payment_status = 'refunded'
+        else:
+            payment_status = 'pending'
+        return status, payment_status
+
+    def bookings(self, first_id, first_client_id, client_count):
+        # Popularity is heavy-tailed: a few chefs take a large share of bookings
+        popularity = list(itertools.accumulate(self.rng.paretovariate(1.2) for _ in self.chefs))
+        occasions_values, occasion_weights = self.occasions
+        for booking_id in range(first_id, first_id + self.counts['bookings']):
+            user_id, _, pricing, cuisines, menus = self.rng.choices(self.chefs, cum_weights=popularity)[0]
+            client_id = first_client_id + self.rng.randrange(client_count)
+            menu_id, menu_price = self.rng.choice(menus)
+            created_at = self.past(365)
+            event_date = (created_at + timedelta(days=self.rng.randint(3, 60))).date()
+            guest_count = min(max(int(self.rng.gauss(6, 3)), 1), 30)
+            service_type = 'cooking_and_teaching' if self.rng.random() < 0.25 else 'cooking_only'
+            quote = compute_quote(pricing[0], pricing[1], pricing[2], guest_count, service_type,
+                                  menu_price if self.rng.random() < 0.5 else None)
+            status, payment_status = self.booking_status(event_date)
+            if status == 'completed':
+                self.completed.append((booking_id, client_id, user_id, event_date))
+            yield {
+                'id': booking_id,
+                'client_id': client_id,
+                'chef_id': user_id,
+                'menu_id': menu_id,
+                'event_date': event_date,
+                'event_time': clock(self.rng.choice([12, 18, 18, 19, 19, 20]), 0),
+                'duration_hours': self.rng.choice([2, 3, 3, 4]),
+                'guest_count': guest_count,
+                'location_address': f"{self.rng.randint(100, 9999)} {self.rng.choice(AREAS)[0]} Street, Burnaby, BC",
+                'service_type': service_type,
+                'cuisine_preference': self.rng.choice(cuisines) if self.rng.random() < 0.8 else None,
+                'occasion_type': self.rng.choices(occasions_values, cum_weights=occasion_weights)[0],
+                'dietary_restrictions': None,
+                'special_requests': None,
+                'total_price': quote['total'],
+                'service_fee': quote['service_fee'],
+                'platform_fee': quote['platform_fee'],
+                'status': status,
+                'payment_status': payment_status,
+                'stripe_payment_intent_id': None,
+                'created_at': created_at,
+                'updated_at': created_at,
+            }
+
+    def reviews(self, first_id):
+        ratings, weights = REVIEW_RATINGS
+        review_id = first_id
+        for booking_id, client_id, chef_user_id, event_date in self.completed:
+            if self.rng.random() >= REVIEW_RATE:
+                continue
+            rating = self.rng.choices(ratings, weights=weights)[0]
+            def near():
+                return min(max(rating + self.rng.choice([-1, 0, 0, 0, 1]), 1), 5)
+            yield {
+                'id': review_id,
+                'client_id': client_id,
+                'chef_id': chef_user_id,
+                'booking_id': booking_id,
+                'rating': rating,
+                'food_quality': near(),
+                'professionalism': near(),
+                'cleanliness': near(),
+                'communication': near(),
+                'value_for_money': near(),
+                'comment': None,
+                'photos': None,
+                'is_verified': True,
+                'created_at': datetime.combine(event_date, clock(21, 0)) + timedelta(days=self.rng.randint(0, 7)),
+            }
+            review_id += 1
+
+def refresh_chef_ratings(first_profile_id):
+    """Set rating and total_reviews on seeded chefs from their reviews in one UPDATE ... FROM"""
+    reviews = db.select(Review.chef_id, db.func.round(db.func.avg(Review.rating), 2).label('rating'),
+                        db.func.count(Review.id).label('total'))\
+        .group_by(Review.chef_id).subquery()
+    db.session.execute(
+        db.update(ChefProfile)
+        .where(ChefProfile.user_id == reviews.c.chef_id, ChefProfile.id >= first_profile_id)
+        .values(rating=reviews.c.rating, total_reviews=reviews.c.total),
+        execution_options={'synchronize_session': False}
+    )
+
+def reset_sequences(models):
+    """Explicit ids bypass PostgreSQL sequences; move them past the seeded rows"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__table__.name
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT MAX(id) FROM \"{table}\"))"
+        ))
+
+def seed_marketplace(seed=42, scale=1.0, today=None, batch_size=10000, log=print):
+    """Insert a generated marketplace into the current database; returns row counts per table"""
+    seeder = MarketplaceSeeder(seed, scale, today)
+    db.create_all()
+    first = {model: _next_id(model) for model in (User, ChefProfile, Menu, MenuItem, ChefAvailability, Booking, Review)}
+    client_count, chef_count = seeder.counts['clients'], seeder.counts['chefs']
+    first_chef_user = first[User] + client_count
+
+    steps = [
+        ('clients', User, lambda: seeder.users(first[User], client_count, 'client')),
+        ('chefs', User, lambda: seeder.users(first_chef_user, chef_count, 'chef')),
+        ('chef_profiles', ChefProfile, lambda: seeder.chef_profiles(first[ChefProfile], first_chef_user, chef_count)),
+        ('menus', Menu, lambda: seeder.menus(first[Menu])),
+        ('menu_items', MenuItem, lambda: seeder.menu_items(first[MenuItem])),
+        ('availability', ChefAvailability, lambda: seeder.availability(first[ChefAvailability])),
+        ('bookings', Booking, lambda: seeder.bookings(first[Booking], first[User], client_count)),
+        ('reviews', Review, lambda: seeder.reviews(first[Review])),
+    ]
+    counts = {}
+    started = time.perf_counter()
+    for name, model, rows in steps:
+        step_started = time.perf_counter()
+        counts[name] = bulk_insert(model, rows(), batch_size)
+        log(f"{name}: {counts[name]} rows in {time.perf_counter() - step_started:.1f}s")
+
+    refresh_chef_ratings(first[ChefProfile])
+    rebuild_dietary_index()  # Bulk inserts bypass the validator and hooks behind masks, the index and cards
+    refresh_chef_cards()
+    release_availability(seeder.today)
+    reset_sequences(first)
+    db.session.commit()
+    log(f"Seeded {sum(counts.values())} rows in {time.perf_counter() - started:.1f}s")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-insert a reproducible marketplace dataset')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier on the default volumes (1.0 is about 1M rows)')
+    parser.add_argument('--today', type=date.fromisoformat, help='Anchor date for generated dates (default: today)')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Rows per executemany batch (default: 10000)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed_marketplace(args.seed, args.scale, args.today, args.batch_size)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,12 @@
 """
 Startup script for Render deployment
-This ensures database tables are created on startup
+This ensures database tables are created on startup, then replaces itself with
+gunicorn using gunicorn.conf.py. Pass --dev to run Flask's development server.
 """
 
 import os
-from app import app, db
+import sys
+from app import app, db, warm_up
 
 def main():
     """Main startup function"""
@@ -29,9 +31,17 @@ def main():
             import traceback
             traceback.print_exc()
     
-    # Start the Flask app
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    if '--dev' in sys.argv[1:]:
+        warm_up()
+        app.run(host='0.0.0.0', port=port, debug=False)
+        return
+    
+    # Serve with gunicorn; the development server is single-process and not meant for production
+    os.environ['PORT'] = str(port)
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(here)
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', os.path.join(here, 'gunicorn.conf.py')])
 
 if __name__ == '__main__':
     main()
@@ -103,14 +103,28 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Booking form enhancements
     const bookingForm = document.getElementById('bookingForm');
-    if (bookingForm) {
+    if (bookingForm && bookingForm.dataset.quoteUrl) {
         const guestCountInput = bookingForm.querySelector('input[name="guest_count"]');
-        const priceDisplay = document.getElementById('priceDisplay');
+        const serviceTypeInput = bookingForm.querySelector('select[name="service_type"]');
+        const menuInput = bookingForm.querySelector('select[name="menu_id"]');
+        let quoteTimeout;
+        const refreshQuote = function() {
+            clearTimeout(quoteTimeout);
+            quoteTimeout = setTimeout(() => {
+                updatePriceDisplay(guestCountInput.value, serviceTypeInput ? serviceTypeInput.value : 'cooking_only',
+                                   menuInput ? menuInput.value : '');
+            }, 200);
+        };
         
-        if (guestCountInput && priceDisplay) {
-            guestCountInput.addEventListener('input', function() {
-                updatePriceDisplay(this.value);
-            });
+        if (guestCountInput) {
+            guestCountInput.addEventListener('input', refreshQuote);
+            if (serviceTypeInput) {
+                serviceTypeInput.addEventListener('change', refreshQuote);
+            }
+            if (menuInput) {
+                menuInput.addEventListener('change', refreshQuote);
+            }
+            refreshQuote();
         }
     }
 
@@ -184,11 +198,15 @@ document.addEventListener('DOMContentLoaded', function() {
         const notification = document.createElement('div');
         notification.className = `alert alert-${type} alert-dismissible fade show position-fixed`;
         notification.style.cssText = 'top: 20px; right: 20px; z-index: 9999; min-width: 300px;';
-        notification.innerHTML = `
-            ${message}
-            <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
-        `;
-        
+        // Messages can carry user-supplied text (e.g. sender names), so never parse them as HTML
+        notification.appendChild(document.createTextNode(message));
+
+        const closeButton = document.createElement('button');
+        closeButton.type = 'button';
+        closeButton.className = 'btn-close';
+        closeButton.setAttribute('data-bs-dismiss', 'alert');
+        notification.appendChild(closeButton);
+
         document.body.appendChild(notification);
         
         setTimeout(() => {
@@ -225,33 +243,26 @@ document.addEventListener('DOMContentLoaded', function() {
         input.max = maxDate.toISOString().split('T')[0];
     });
 
-    // Price calculator
-    window.calculatePrice = function(basePrice, guestCount, travelFee = 0) {
-        const subtotal = basePrice * guestCount;
-        const serviceFee = subtotal * 0.1; // 10%
-        const platformFee = subtotal * 0.15; // 15%
-        const total = subtotal + travelFee + serviceFee + platformFee;
-        
-        return {
-            subtotal: subtotal,
-            travelFee: travelFee,
-            serviceFee: serviceFee,
-            platformFee: platformFee,
-            total: total
-        };
-    };
-
-    // Update price display
-    window.updatePriceDisplay = function(guestCount) {
-        const basePrice = parseFloat(document.getElementById('basePrice').textContent) || 0;
-        const travelFee = parseFloat(document.getElementById('travelFee').textContent) || 0;
-        
-        const pricing = calculatePrice(basePrice, guestCount, travelFee);
+    // Update price display from the server-side quote (exact Decimal arithmetic)
+    window.updatePriceDisplay = function(guestCount, serviceType = 'cooking_only', menuId = '') {
+        const bookingForm = document.getElementById('bookingForm');
+        const guests = parseInt(guestCount);
+        if (!bookingForm || !guests) return;
         
-        document.getElementById('subtotal').textContent = pricing.subtotal.toFixed(2);
-        document.getElementById('serviceFee').textContent = pricing.serviceFee.toFixed(2);
-        document.getElementById('platformFee').textContent = pricing.platformFee.toFixed(2);
-        document.getElementById('totalPrice').textContent = pricing.total.toFixed(2);
+        const params = new URLSearchParams({guests: guests, service_type: serviceType});
+        if (parseInt(menuId)) {
+            params.set('menu_id', menuId);
+        }
+        fetch(`${bookingForm.dataset.quoteUrl}?${params}`)
+            .then(response => response.ok ? response.json() : null)
+            .then(quote => {
+                if (!quote) return;
+                document.getElementById('basePrice').textContent = '$' + quote.base_price;
+                document.getElementById('travelFee').textContent = '$' + quote.travel_fee;
+                document.getElementById('serviceFee').textContent = '$' + quote.service_fee;
+                document.getElementById('platformFee').textContent = '$' + quote.platform_fee;
+                document.getElementById('totalPrice').textContent = '$' + quote.total;
+            });
     };
 
     // Star rating functions
@@ -314,6 +325,34 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 1000);
     };
 
+    // Live booking and message updates (server-sent events)
+    const eventsUrl = document.body.dataset.eventsUrl;
+    if (eventsUrl && 'EventSource' in window) {
+        const events = new EventSource(eventsUrl);
+        
+        events.addEventListener('booking_status', function(e) {
+            const data = JSON.parse(e.data);
+            if (window.location.pathname === `/booking/${data.booking_id}`) {
+                window.location.reload();
+            } else {
+                showNotification(`Booking #${data.booking_id} is now ${data.status}`, 'info');
+            }
+        });
+        
+        events.addEventListener('new_message', function(e) {
+            const data = JSON.parse(e.data);
+            if (window.location.pathname === `/booking/${data.booking_id}`) {
+                window.location.reload();
+                return;
+            }
+            const badge = document.getElementById('unreadMessagesBadge');
+            if (badge) {
+                badge.textContent = (parseInt(badge.textContent) || 0) + 1;
+            }
+            showNotification(`New message from ${data.sender_name}`, 'info');
+        });
+    }
+
     // Initialize animations
     const observerOptions = {
         threshold: 0.1,
@@ -357,6 +396,64 @@ window.formatTime = function(timeString) {
     });
 };
 
+// Dashboard booking lists: swap the "Load more" button for the next server-rendered page
+window.loadMoreBookings = function(button) {
+    button.disabled = true;
+    fetch(button.dataset.url, {credentials: 'same-origin'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to load bookings');
+            }
+            return response.text();
+        })
+        .then(html => {
+            const wrapper = button.parentElement;
+            wrapper.insertAdjacentHTML('afterend', html);
+            wrapper.remove();
+        })
+        .catch(() => {
+            button.disabled = false;
+        });
+};
+
+// Direct photo uploads: send the file straight to storage through a signed URL,
+// then submit only the returned token. On any failure the file stays selected
+// and goes up with the form as before.
+document.addEventListener('change', function(e) {
+    const input = e.target;
+    if (!input.dataset || !input.dataset.directUpload || !input.files.length) {
+        return;
+    }
+    const file = input.files[0];
+    const tokenField = document.getElementById(input.dataset.uploadField);
+    const submit = input.form.querySelector('[type="submit"]');
+    tokenField.value = '';
+    if (submit) {
+        submit.disabled = true;
+    }
+    fetch('/uploads/sign', {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({folder: input.dataset.directUpload, filename: file.name, content_type: file.type, size: file.size})
+    })
+        .then(response => response.ok ? response.json() : Promise.reject(new Error('Upload not allowed')))
+        .then(target => fetch(target.url, {method: target.method, headers: target.headers, body: file})
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Upload failed');
+                }
+                tokenField.value = target.token;
+                input.value = '';
+            }))
+        .catch(error => console.warn('Direct upload skipped:', error.message))
+        .finally(() => {
+            if (submit) {
+                submit.disabled = false;
+            }
+        });
+});
+
 // Error handling
 window.addEventListener('error', function(e) {
     console.error('JavaScript error:', e.error);
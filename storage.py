@@ -0,0 +1,191 @@
+"""
+Upload storage
+Uploaded photos are stored under keys like "menus/<filename>" in either the
+local upload folder or an S3-compatible bucket (AWS S3, MinIO, R2, ...), so
+any app node can serve a photo another node received. With S3 the browser can
+PUT a photo straight to the bucket through a presigned URL, bypassing the app.
+
+    STORAGE_URL=file://static/uploads              (default)
+    STORAGE_URL=s3://bucket/optional/prefix        (+ S3_ENDPOINT_URL, S3_REGION, keys)
+
+Requests to S3 are signed with AWS Signature Version 4 using only hmac and
+requests; the same helpers verify signatures in mock_s3.py.
+"""
+
+import hashlib
+import hmac
+import os
+import shutil
+from datetime import datetime
+from urllib.parse import quote, urlsplit, parse_qsl
+import requests
+
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+
+class StorageError(Exception):
+    """Raised when the storage backend rejects or fails a request"""
+
+def _uri_encode(value, safe='-_.~'):
+    return quote(value, safe=safe)
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+def signing_key(secret_key, date_stamp, region, service='s3'):
+    key = _hmac(('AWS4' + secret_key).encode(), date_stamp)
+    key = _hmac(key, region)
+    key = _hmac(key, service)
+    return _hmac(key, 'aws4_request')
+
+def canonical_request(method, url, headers, signed_headers, payload_hash, query=None):
+    """SigV4 canonical request; headers maps lower-case names to values, query overrides the URL's"""
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True) if query is None else list(query.items())
+    canonical_query = '&'.join(f'{_uri_encode(k)}={_uri_encode(v)}' for k, v in sorted(params))
+    canonical_headers = ''.join(f'{name}:{" ".join(str(headers[name]).split())}\n' for name in signed_headers)
+    return '\n'.join([method, _uri_encode(parts.path or '/', safe='/-_.~%'), canonical_query,
+                      canonical_headers, ';'.join(signed_headers), payload_hash])
+
+def string_to_sign(amz_date, scope, request):
+    return '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(request.encode()).hexdigest()])
+
+def signature(secret_key, amz_date, region, request, service='s3'):
+    scope = f'{amz_date[:8]}/{region}/{service}/aws4_request'
+    key = signing_key(secret_key, amz_date[:8], region, service)
+    return hmac.new(key, string_to_sign(amz_date, scope, request).encode(), hashlib.sha256).hexdigest()
+
+def presign_url(method, url, access_key, secret_key, region, expires=900, headers=None, now=None, service='s3'):
+    """Query-string signed URL; headers (e.g. content-type) must then be sent exactly as signed"""
+    amz_date = (now or datetime.utcnow()).strftime('%Y%m%dT%H%M%SZ')
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    headers['host'] = urlsplit(url).netloc
+    signed_headers = sorted(headers)
+    query = dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+    query.update({
+        'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+        'X-Amz-Credential': f'{access_key}/{amz_date[:8]}/{region}/{service}/aws4_request',
+        'X-Amz-Date': amz_date,
+        'X-Amz-Expires': str(int(expires)),
+        'X-Amz-SignedHeaders': ';'.join(signed_headers),
+    })
+    request = canonical_request(method, url, headers, signed_headers, UNSIGNED_PAYLOAD, query)
+    query['X-Amz-Signature'] = signature(secret_key, amz_date, region, request, service)
+    base = url.split('?', 1)[0]
+    return base + '?' + '&'.join(f'{_uri_encode(k)}={_uri_encode(v)}' for k, v in query.items())
+
+class LocalStorage:
+    """Files under a local directory, served by Flask's static route"""
+
+    def __init__(self, root, base_url='/static/uploads'):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise StorageError(f'Invalid key {key!r}')
+        return path
+
+    def save(self, key, fileobj, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(fileobj, out)
+        return key
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return f'{self.base_url}/{quote(key)}'
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, addressed path-style ({endpoint}/{bucket}/{key})"""
+
+    def __init__(self, bucket, prefix='', endpoint_url='https://s3.amazonaws.com', region='us-east-1',
+                 access_key=None, secret_key=None, public_url=None, timeout=10):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.public_url = (public_url or f'{self.endpoint_url}/{bucket}').rstrip('/')
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def _object_key(self, key):
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def object_url(self, key):
+        return f'{self.endpoint_url}/{self.bucket}/{_uri_encode(self._object_key(key), safe="/-_.~")}'
+
+    def _request(self, method, key, data=b'', headers=None):
+        url = self.object_url(key)
+        amz_date = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        payload_hash = hashlib.sha256(data).hexdigest()
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        headers.update({'host': urlsplit(url).netloc, 'x-amz-date': amz_date, 'x-amz-content-sha256': payload_hash})
+        signed_headers = sorted(headers)
+        request = canonical_request(method, url, headers, signed_headers, payload_hash)
+        headers['authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request, '
+            f'SignedHeaders={";".join(signed_headers)}, '
+            f'Signature={signature(self.secret_key, amz_date, self.region, request)}'
+        )
+        del headers['host']
+        try:
+            response = self.http.request(method, url, data=data, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(f'{method} {key} failed: {e}') from e
+        if response.status_code >= 300 and not (method == 'DELETE' and response.status_code == 404):
+            raise StorageError(f'{method} {key} returned {response.status_code}: {response.text[:200]}')
+        return response
+
+    def save(self, key, fileobj, content_type=None):
+        self._request('PUT', key, fileobj.read(), {'content-type': content_type or 'application/octet-stream'})
+        return key
+
+    def open(self, key):
+        from io import BytesIO
+        return BytesIO(self._request('GET', key).content)
+
+    def exists(self, key):
+        try:
+            self._request('HEAD', key)
+        except StorageError:
+            return False
+        return True
+
+    def delete(self, key):
+        self._request('DELETE', key)
+
+    def url(self, key):
+        return f'{self.public_url}/{_uri_encode(self._object_key(key), safe="/-_.~")}'
+
+    def presign_upload(self, key, content_type, content_length, expires=900):
+        """A URL the browser can PUT the file to directly; type and size are signed, so the bucket rejects others"""
+        headers = {'content-type': content_type, 'content-length': str(content_length)}
+        url = presign_url('PUT', self.object_url(key), self.access_key, self.secret_key, self.region,
+                          expires=expires, headers=headers)
+        return {'method': 'PUT', 'url': url, 'headers': {'Content-Type': content_type}}
+
+def create_storage(url, base_url='/static/uploads', **s3_options):
+    """Storage backend for a file:// or s3:// URL"""
+    parts = urlsplit(url or 'file://static/uploads')
+    if parts.scheme == 'file':
+        return LocalStorage((parts.netloc + parts.path) or 'static/uploads', base_url)
+    if parts.scheme == 's3':
+        if not parts.netloc:
+            raise ValueError('STORAGE_URL must name a bucket, e.g. s3://my-bucket')
+        return S3Storage(parts.netloc, parts.path, **{k: v for k, v in s3_options.items() if v is not None})
+    raise ValueError(f"Unsupported STORAGE_URL {url!r}; use file:// or s3://")
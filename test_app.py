@@ -4,6 +4,10 @@ Simple test script to verify the Chef Marketplace application works correctly.
 
 import os
 import sys
+from datetime import datetime, timedelta
+
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')  # Hash on the test thread; the pool is tested explicitly
+
 from app import app, db, User, ChefProfile, Booking, Review
 
 def test_database_creation():
@@ -154,6 +158,1720 @@ def test_forms():
         assert booking_form.location_address is not None
         print("Booking form created successfully")
 
+def test_booking_lifecycle():
+    """Test booking state machine and scheduled bulk transitions"""
+    print("\nTesting booking lifecycle...")
+    
+    from datetime import date, time
+    from app import ChefAvailability, InvalidBookingTransition, transition_booking, run_booking_transitions
+    
+    with app.app_context():
+        db.create_all()
+        User.query.filter(User.email.in_(['lifecycle_client@example.com', 'lifecycle_chef@example.com'])).delete()
+        db.session.commit()
+        
+        client_user = User(email='lifecycle_client@example.com', first_name='Life', last_name='Client', role='client')
+        chef_user = User(email='lifecycle_chef@example.com', first_name='Life', last_name='Chef', role='chef')
+        db.session.add_all([client_user, chef_user])
+        db.session.commit()
+        
+        chef_profile = ChefProfile(user_id=chef_user.id, base_price_per_person=50, response_time_hours=24)
+        db.session.add(chef_profile)
+        db.session.commit()
+        
+        future = date.today() + timedelta(days=10)
+        slot = ChefAvailability(chef_id=chef_profile.id, date=future, start_time=time(17, 0), end_time=time(22, 0), current_bookings=1)
+        
+        def make_booking(status, event_date, created_at=None):
+            return Booking(client_id=client_user.id, chef_id=chef_user.id, menu_id=1,
+                           event_date=event_date, event_time=time(19, 0), guest_count=4,
+                           location_address='123 Test Street, Burnaby', total_price=300,
+                           service_fee=30, platform_fee=45, status=status,
+                           created_at=created_at or datetime.utcnow())
+        
+        past_confirmed = make_booking('confirmed', date.today() - timedelta(days=1))
+        stale_pending = make_booking('pending', future, datetime.utcnow() - timedelta(hours=48))
+        fresh_pending = make_booking('pending', future)
+        cancelled = make_booking('cancelled', future)
+        db.session.add_all([slot, past_confirmed, stale_pending, fresh_pending, cancelled])
+        db.session.commit()
+        
+        try:
+            transition_booking(cancelled, 'confirmed')
+            assert False, 'cancelled booking should not be confirmable'
+        except InvalidBookingTransition:
+            pass
+        
+        # Pinned to three days ago, yesterday's event is still ahead and nothing is stale yet
+        run_booking_transitions(now=datetime.utcnow() - timedelta(days=3))
+        for booking in (past_confirmed, stale_pending):
+            db.session.refresh(booking)
+        assert past_confirmed.status == 'confirmed' and stale_pending.status == 'pending'
+        
+        result = run_booking_transitions()
+        assert result['completed'] >= 1
+        assert result['expired'] >= 1
+        
+        for booking in (past_confirmed, stale_pending, fresh_pending, cancelled):
+            db.session.refresh(booking)
+        db.session.refresh(slot)
+        assert past_confirmed.status == 'completed'
+        assert stale_pending.status == 'expired'
+        assert fresh_pending.status == 'pending'
+        assert cancelled.status == 'cancelled'
+        assert slot.current_bookings == 0
+        print("Scheduled booking transitions applied successfully")
+        
+        for obj in (past_confirmed, stale_pending, fresh_pending, cancelled, slot, chef_profile, chef_user, client_user):
+            db.session.delete(obj)
+        db.session.commit()
+
+def test_messaging():
+    """Test booking threads, keyset pagination and unread counters"""
+    print("\nTesting messaging...")
+    
+    from datetime import date, time
+    from app import send_booking_message, mark_thread_read, get_message_page, reconcile_unread_counters
+    
+    with app.app_context():
+        db.create_all()
+        User.query.filter(User.email.in_(['msg_client@example.com', 'msg_chef@example.com'])).delete()
+        db.session.commit()
+        
+        client_user = User(email='msg_client@example.com', first_name='Msg', last_name='Client', role='client')
+        chef_user = User(email='msg_chef@example.com', first_name='Msg', last_name='Chef', role='chef')
+        db.session.add_all([client_user, chef_user])
+        db.session.commit()
+        
+        booking = Booking(client_id=client_user.id, chef_id=chef_user.id, menu_id=1,
+                          event_date=date.today() + timedelta(days=5), event_time=time(19, 0),
+                          guest_count=2, location_address='123 Test Street, Burnaby',
+                          total_price=200, service_fee=20, platform_fee=30)
+        db.session.add(booking)
+        db.session.commit()
+        
+        for i in range(5):
+            send_booking_message(booking, client_user, f'Hello {i}')
+        send_booking_message(booking, chef_user, 'Hi there')
+        db.session.commit()
+        
+        assert chef_user.unread_messages == 5
+        assert client_user.unread_messages == 1
+        
+        page, next_before = get_message_page(booking.id, limit=4)
+        assert [m.content for m in page] == ['Hello 2', 'Hello 3', 'Hello 4', 'Hi there']
+        older, next_before = get_message_page(booking.id, before_id=next_before, limit=4)
+        assert [m.content for m in older] == ['Hello 0', 'Hello 1']
+        assert next_before is None
+        print("Keyset message pagination works")
+        
+        assert mark_thread_read(booking, chef_user) == 5
+        db.session.commit()
+        assert chef_user.unread_messages == 0
+        assert client_user.unread_messages == 1
+        
+        # Drift is repaired by the reconcile job
+        db.session.execute(db.update(User).where(User.id == client_user.id).values(unread_messages=7))
+        db.session.commit()
+        reconcile_unread_counters()
+        assert client_user.unread_messages == 1
+        print("Unread counters maintained successfully")
+        
+        db.session.delete(booking)
+        db.session.delete(chef_user)
+        db.session.delete(client_user)
+        db.session.commit()
+
+def test_event_stream():
+    """Test the in-process event bus and the /events SSE endpoint"""
+    print("\nTesting event stream...")
+    
+    from app import InMemoryEventBus, publish_user_event
+    
+    bus = InMemoryEventBus()
+    subscription = bus.subscribe('user:1')
+    bus.publish('user:1', {'type': 'booking_status', 'data': {'booking_id': 1}})
+    bus.publish('user:2', {'type': 'booking_status', 'data': {'booking_id': 2}})
+    assert subscription.get(timeout=0.1)['data']['booking_id'] == 1
+    assert subscription.get(timeout=0.01) is None
+    subscription.close()
+    print("In-memory event bus delivers per-channel events")
+    
+    with app.app_context():
+        db.create_all()
+        User.query.filter_by(email='events@example.com').delete()
+        user = User(email='events@example.com', first_name='Event', last_name='User', role='client')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        response = client.get('/events')
+        assert response.mimetype == 'text/event-stream'
+        stream = iter(response.response)
+        assert next(stream).startswith(b'retry:')
+        publish_user_event(user_id, 'booking_status', {'booking_id': 42, 'status': 'confirmed'})
+        chunk = next(stream)
+        assert chunk.startswith(b'event: booking_status')
+        assert b'"booking_id": 42' in chunk
+        response.close()
+    print("Event stream delivers booking updates")
+    
+    with app.app_context():
+        User.query.filter_by(email='events@example.com').delete()
+        db.session.commit()
+
+def test_email_outbox():
+    """Test outbox batching over one SMTP connection and retry backoff"""
+    print("\nTesting email outbox...")
+    
+    from debug_smtp import DebugSMTPServer
+    from app import EmailOutbox, mail, queue_email, send_pending_emails
+    
+    server = DebugSMTPServer().start()
+    saved_config = {key: app.config[key] for key in ('MAIL_SERVER', 'MAIL_PORT', 'MAIL_USE_TLS', 'MAIL_SUPPRESS_SEND')}
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_USE_TLS=False, MAIL_SUPPRESS_SEND=False)
+    mail.init_app(app)
+    
+    try:
+        with app.app_context():
+            db.create_all()
+            EmailOutbox.query.delete()
+            context = dict(recipient_name='Test', other_name='Chef Test', event_date='December 25, 2024',
+                           event_time='07:00 PM', guest_count=4, total_price='300.00',
+                           booking_url='http://localhost/booking/1')
+            for i in range(3):
+                queue_email(f'outbox{i}@example.com', 'Your booking is confirmed', 'booking_confirmed', **context)
+            db.session.commit()
+            
+            assert send_pending_emails() == {'sent': 3, 'retried': 0, 'failed': 0}
+            assert len(server.messages) == 3
+            assert server.connections == 1
+            assert 'Chef Test' in server.messages[0]['message'].get_body(('plain',)).get_content()
+            print("Outbox batch delivered over a single SMTP connection")
+            
+            # Unreachable server: the email stays pending with a backoff
+            app.config['MAIL_PORT'] = 1
+            mail.init_app(app)
+            email = queue_email('retry@example.com', 'Retry', 'booking_confirmed', **context)
+            db.session.commit()
+            assert send_pending_emails() == {'sent': 0, 'retried': 1, 'failed': 0}
+            db.session.refresh(email)
+            assert email.attempts == 1 and email.next_attempt_at > datetime.utcnow()
+            assert send_pending_emails() == {'sent': 0, 'retried': 0, 'failed': 0}
+            print("Failed delivery scheduled for retry")
+            
+            EmailOutbox.query.delete()
+            db.session.commit()
+    finally:
+        app.config.update(saved_config)
+        mail.init_app(app)
+        server.stop()
+
+def test_stripe_payments():
+    """Test PaymentIntent idempotency and queued webhook processing against the mock Stripe"""
+    print("\nTesting Stripe payments...")
+    
+    import json
+    import stripe
+    from datetime import date, time
+    from mock_stripe import MockStripeServer, sign_webhook_payload
+    from app import StripeEvent, process_stripe_events
+    
+    server = MockStripeServer().start()
+    saved_api_base, saved_secret = stripe.api_base, app.config['STRIPE_WEBHOOK_SECRET']
+    stripe.api_base = server.url
+    app.config['STRIPE_WEBHOOK_SECRET'] = 'whsec_test'
+    
+    try:
+        with app.app_context():
+            db.create_all()
+            User.query.filter(User.email.in_(['pay_client@example.com', 'pay_chef@example.com'])).delete()
+            client_user = User(email='pay_client@example.com', first_name='Pay', last_name='Client', role='client')
+            chef_user = User(email='pay_chef@example.com', first_name='Pay', last_name='Chef', role='chef')
+            db.session.add_all([client_user, chef_user])
+            db.session.commit()
+            booking = Booking(client_id=client_user.id, chef_id=chef_user.id, menu_id=1,
+                              event_date=date.today() + timedelta(days=7), event_time=time(19, 0),
+                              guest_count=4, location_address='123 Test Street, Burnaby',
+                              total_price=312.50, service_fee=25, platform_fee=37.50, status='confirmed')
+            db.session.add(booking)
+            db.session.commit()
+            booking_id, client_id = booking.id, client_user.id
+        
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(client_id)
+            first = client.post(f'/booking/{booking_id}/pay').get_json()
+            second = client.post(f'/booking/{booking_id}/pay').get_json()
+            assert first['client_secret'] == second['client_secret']
+            creates = [r for r in server.requests if r[0] == 'POST']
+            assert len(creates) == 1
+            assert creates[0][3]['amount'] == '31250'
+            assert creates[0][2]['Idempotency-Key'] == f'booking-{booking_id}-payment-intent'
+            print("PaymentIntent created once with an idempotency key")
+            
+            intent = next(iter(server.payment_intents.values()))
+            payload = json.dumps({
+                'id': 'evt_test_paid', 'object': 'event', 'type': 'payment_intent.succeeded',
+                'data': {'object': dict(intent, status='succeeded')}
+            })
+            headers = {'Stripe-Signature': sign_webhook_payload(payload, 'whsec_test'), 'Content-Type': 'application/json'}
+            assert client.post('/stripe/webhook', data=payload, headers=headers).status_code == 200
+            assert client.post('/stripe/webhook', data=payload, headers=headers).status_code == 200
+            bad_headers = {'Stripe-Signature': sign_webhook_payload(payload, 'whsec_wrong')}
+            assert client.post('/stripe/webhook', data=payload, headers=bad_headers).status_code == 400
+        
+        with app.app_context():
+            assert StripeEvent.query.filter_by(id='evt_test_paid').count() == 1
+            assert process_stripe_events() == {'processed': 1, 'failed': 0}
+            assert process_stripe_events() == {'processed': 0, 'failed': 0}
+            booking = db.session.get(Booking, booking_id)
+            assert booking.payment_status == 'paid'
+            print("Webhook events queued once and applied idempotently")
+            
+            # A charge event without a payment intent matches no booking, not every one lacking an intent
+            unlinked = Booking(client_id=client_id, chef_id=booking.chef_id, event_date=date.today() + timedelta(days=8),
+                               event_time=time(19, 0), guest_count=2, location_address='123 Test Street, Burnaby',
+                               total_price=100, service_fee=10, platform_fee=15, status='confirmed', payment_status='paid')
+            db.session.add(unlinked)
+            db.session.commit()
+            unlinked_id = unlinked.id
+        
+        with app.test_client() as client:
+            payload = json.dumps({
+                'id': 'evt_test_refund_no_intent', 'object': 'event', 'type': 'charge.refunded',
+                'data': {'object': {'id': 'ch_test', 'object': 'charge', 'payment_intent': None, 'metadata': {}}}
+            })
+            headers = {'Stripe-Signature': sign_webhook_payload(payload, 'whsec_test'), 'Content-Type': 'application/json'}
+            assert client.post('/stripe/webhook', data=payload, headers=headers).status_code == 200
+        
+        with app.app_context():
+            assert process_stripe_events() == {'processed': 1, 'failed': 0}
+            assert db.session.get(Booking, unlinked_id).payment_status == 'paid'
+            assert db.session.get(Booking, booking_id).payment_status == 'paid'
+            print("Charge events without a payment intent leave bookings alone")
+            
+            booking = db.session.get(Booking, booking_id)
+            StripeEvent.query.filter(StripeEvent.id.in_(['evt_test_paid', 'evt_test_refund_no_intent'])).delete()
+            db.session.delete(db.session.get(Booking, unlinked_id))
+            db.session.delete(booking)
+            User.query.filter(User.email.in_(['pay_client@example.com', 'pay_chef@example.com'])).delete()
+            db.session.commit()
+    finally:
+        stripe.api_base = saved_api_base
+        app.config['STRIPE_WEBHOOK_SECRET'] = saved_secret
+        server.stop()
+
+def test_pricing():
+    """Test Decimal pricing, batch quotes and per-version caching"""
+    print("\nTesting pricing...")
+    
+    from decimal import Decimal
+    from app import Menu, quote_prices, quote_booking, bump_pricing_version
+    
+    with app.app_context():
+        db.create_all()
+        User.query.filter_by(email='pricing_chef@example.com').delete()
+        chef_user = User(email='pricing_chef@example.com', first_name='Price', last_name='Chef', role='chef')
+        db.session.add(chef_user)
+        db.session.commit()
+        chef_profile = ChefProfile(user_id=chef_user.id, bio='Pricing test chef', service_areas='Metrotown', base_price_per_person=Decimal('33.33'),
+                                   teaching_price_per_person=Decimal('10.00'), travel_fee=Decimal('15.00'))
+        db.session.add(chef_profile)
+        db.session.commit()
+        menu = Menu(chef_id=chef_profile.id, name='Tasting Menu', price_per_person=Decimal('80.00'))
+        db.session.add(menu)
+        db.session.commit()
+        
+        quote = quote_booking(chef_profile, 3)
+        assert quote['base_price'] == Decimal('99.99')
+        assert quote['service_fee'] == Decimal('10.00')
+        assert quote['platform_fee'] == Decimal('15.00')
+        assert quote['total'] == Decimal('139.99')
+        
+        teaching, with_menu = quote_prices([
+            (chef_profile, 2, 'cooking_and_teaching', None),
+            (chef_profile, 2, 'cooking_only', menu.id)
+        ])
+        assert teaching['base_price'] == Decimal('86.66')
+        assert with_menu['base_price'] == Decimal('160.00')
+        print("Decimal batch quotes calculated correctly")
+        
+        chef_profile.base_price_per_person = Decimal('40.00')
+        assert quote_booking(chef_profile, 3)['base_price'] == Decimal('99.99')  # Same version: cached
+        bump_pricing_version(chef_profile)
+        db.session.commit()
+        assert quote_booking(chef_profile, 3)['base_price'] == Decimal('120.00')
+        print("Quote cache invalidated by pricing version")
+        chef_id = chef_profile.id
+    
+    with app.test_client() as client:
+        response = client.get(f'/chef/{chef_id}/quote?guests=3&service_type=cooking_only')
+        assert response.get_json()['total'] == '165.00'
+        assert client.get(f'/chef/{chef_id}/quote?guests=0').status_code == 400
+        assert client.get('/chefs?guests=3').status_code == 200
+        print("Quote endpoint returns exact amounts")
+    
+    with app.app_context():
+        chef_profile = db.session.get(ChefProfile, chef_id)
+        chef_profile.offers_teaching = False
+        db.session.commit()
+        teaching, cooking = quote_prices([(chef_profile, 3, 'cooking_and_teaching', None), (chef_profile, 3, 'cooking_only', None)])
+        assert teaching == cooking
+    with app.test_client() as client:
+        response = client.get(f'/chef/{chef_id}/quote?guests=3&service_type=cooking_and_teaching')
+        assert response.status_code == 400
+        print("Teaching is not priced for chefs who do not offer it")
+    
+    with app.app_context():
+        chef_user = User.query.filter_by(email='pricing_chef@example.com').first()
+        db.session.delete(chef_user)
+        db.session.commit()
+
+def test_booking_rollups():
+    """Test rollup backfill, incremental refresh and the admin reports page"""
+    print("\nTesting booking rollups...")
+    
+    from datetime import date, time
+    from decimal import Decimal
+    from app import BookingRollup, JobState, rebuild_booking_rollups, refresh_booking_rollups
+    
+    emails = ['rollup_client@example.com', 'rollup_chef@example.com', 'rollup_admin@example.com']
+    with app.app_context():
+        db.create_all()
+        User.query.filter(User.email.in_(emails)).delete()
+        db.session.commit()
+        
+        client_user = User(email=emails[0], first_name='Roll', last_name='Client', role='client')
+        chef_user = User(email=emails[1], first_name='Roll', last_name='Chef', role='chef')
+        admin_user = User(email=emails[2], first_name='Roll', last_name='Admin', role='admin')
+        db.session.add_all([client_user, chef_user, admin_user])
+        db.session.commit()
+        
+        report_day = date(2001, 1, 1)
+        def make_booking(status, cuisine):
+            return Booking(client_id=client_user.id, chef_id=chef_user.id, menu_id=1,
+                           event_date=report_day, event_time=time(19, 0), guest_count=4,
+                           location_address='123 Test Street, Burnaby', total_price=300,
+                           service_fee=30, platform_fee=45, status=status, cuisine_preference=cuisine,
+                           created_at=datetime(2001, 1, 1, 12, 0))
+        bookings = [make_booking('confirmed', 'Persian'), make_booking('completed', 'Persian'), make_booking('pending', None)]
+        db.session.add_all(bookings)
+        db.session.commit()
+        
+        rebuild_booking_rollups(report_day, report_day)
+        rollups = {(r.dimension, r.dimension_value): r for r in BookingRollup.query.filter_by(day=report_day)}
+        assert rollups[('all', '')].bookings == 3
+        assert rollups[('all', '')].confirmed_bookings == 2
+        assert rollups[('all', '')].gmv == Decimal('600.00')
+        assert rollups[('all', '')].platform_fee == Decimal('90.00')
+        assert rollups[('cuisine', 'Persian')].bookings == 2
+        assert rollups[('cuisine', 'unspecified')].gmv == Decimal('0.00')
+        assert rollups[('chef', str(chef_user.id))].service_fee == Decimal('60.00')
+        print("Rollups rebuilt from raw bookings")
+        
+        db.session.merge(JobState(name='booking_rollups', last_run_at=datetime.utcnow() - timedelta(seconds=1)))
+        bookings[2].status = 'confirmed'
+        db.session.commit()
+        refresh_booking_rollups()
+        total = BookingRollup.query.filter_by(day=report_day, dimension='all').one()
+        assert total.confirmed_bookings == 3
+        assert total.gmv == Decimal('900.00')
+        print("Incremental refresh picked up changed bookings")
+        admin_id = admin_user.id
+    
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin_id)
+        assert client.get('/admin/reports?days=7').status_code == 200
+        assert client.get('/admin/dashboard').status_code == 200
+        print("Admin reports page renders from rollups")
+    
+    with app.app_context():
+        BookingRollup.query.filter_by(day=report_day).delete()
+        Booking.query.filter(Booking.created_at == datetime(2001, 1, 1, 12, 0)).delete()
+        User.query.filter(User.email.in_(emails)).delete()
+        db.session.commit()
+
+def test_data_export():
+    """Test streaming CSV and Parquet exports"""
+    print("\nTesting data export...")
+    
+    import csv
+    import io
+    import json
+    from datetime import date, time
+    from app import ChefCard, iter_export_csv, iter_export_parquet
+    
+    emails = ['export_client@example.com', 'export_chef@example.com', 'export_admin@example.com']
+    
+    def clean_up():
+        Booking.query.filter_by(occasion_type='export-test').delete()
+        for user in User.query.filter(User.email.in_(emails)).all():
+            ChefCard.query.filter_by(user_id=user.id).delete()
+            ChefProfile.query.filter_by(user_id=user.id).delete()
+            db.session.delete(user)
+        db.session.commit()
+    
+    with app.app_context():
+        db.create_all()
+        clean_up()
+        
+        client_user = User(email=emails[0], first_name='Export', last_name='Client', role='client')
+        chef_user = User(email=emails[1], first_name='Export', last_name='Chef', role='chef')
+        admin_user = User(email=emails[2], first_name='Export', last_name='Admin', role='admin')
+        db.session.add_all([client_user, chef_user, admin_user])
+        db.session.commit()
+        db.session.add(ChefProfile(user_id=chef_user.id, base_price_per_person=50, service_areas=['metrotown', 'brentwood']))
+        db.session.commit()
+        
+        bookings = [Booking(client_id=client_user.id, chef_id=chef_user.id, menu_id=1,
+                            event_date=date.today(), event_time=time(19, 0), guest_count=4,
+                            location_address='123 Test Street, Burnaby', total_price=300,
+                            service_fee=30, platform_fee=45, occasion_type='export-test')
+                    for _ in range(5)]
+        db.session.add_all(bookings)
+        db.session.commit()
+        
+        chunks = list(iter_export_csv('bookings', chunk_size=2))
+        rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+        exported = [row for row in rows if row['occasion_type'] == 'export-test']
+        assert len(exported) == 5
+        assert exported[0]['total_price'] == '300.00'
+        assert len(chunks) >= 4  # Header plus at least three chunks of two rows
+        chefs = list(csv.DictReader(io.StringIO(''.join(iter_export_csv('chefs')))))
+        exported_chef = next(row for row in chefs if row['user_id'] == str(chef_user.id))
+        assert json.loads(exported_chef['service_areas']) == ['metrotown', 'brentwood']
+        print("CSV export streams in chunks")
+        
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            pq = None
+        if pq:
+            table = pq.read_table(io.BytesIO(b''.join(iter_export_parquet('bookings', chunk_size=2))))
+            assert table.num_rows == len(rows)
+            assert table.schema.field('total_price').type.scale == 2
+            chefs = pq.read_table(io.BytesIO(b''.join(iter_export_parquet('chefs')))).to_pylist()
+            exported_chef = next(row for row in chefs if row['user_id'] == chef_user.id)
+            assert exported_chef['service_areas'] == ['metrotown', 'brentwood']
+            print("Parquet export written in row groups")
+        admin_id = admin_user.id
+    
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin_id)
+        response = client.get('/admin/export/bookings')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert b'export-test' in response.data
+        assert client.get('/admin/export/reviews').status_code == 200
+        assert client.get('/admin/export/chefs').status_code == 200
+        assert client.get('/admin/export/users').status_code == 404
+        print("Admin export endpoint streams CSV")
+    
+    with app.app_context():
+        clean_up()
+
+def test_seed_data():
+    """Test that the seeding generator is deterministic for a given seed"""
+    print("\nTesting seed data generation...")
+    
+    from datetime import date
+    from seed_data import MarketplaceSeeder
+    
+    def generate(seed):
+        seeder = MarketplaceSeeder(seed=seed, scale=0.001, today=date(2025, 1, 1))
+        rows = list(seeder.users(1, 100, 'client'))
+        rows += list(seeder.chef_profiles(1, 101, 10))
+        rows += list(seeder.menus(1))
+        rows += list(seeder.bookings(1, 1, 100))
+        rows += list(seeder.reviews(1))
+        for row in rows:
+            row.pop('password_hash', None)  # Salted, so differs between runs
+        return rows
+    
+    with app.app_context():
+        first, second, other = generate(7), generate(7), generate(8)
+    assert first == second
+    assert first != other
+    bookings = [row for row in first if 'guest_count' in row]
+    assert len(bookings) == 450
+    assert all(row['total_price'] > 0 for row in bookings)
+    print("Seeded rows are reproducible")
+
+def test_benchmark_comparison():
+    """Test that benchmark comparisons flag latency and SQL regressions"""
+    print("\nTesting benchmark comparison...")
+    
+    from benchmark import compare_results
+    
+    def result(p95_ms, sql_queries, errors=0):
+        return {'p95_ms': p95_ms, 'sql_queries': sql_queries, 'errors': errors}
+    
+    baseline = {'routes': {'index': result(10.0, 2), 'chef_detail': result(20.0, 5)}}
+    assert compare_results(baseline, {'routes': {'index': result(11.0, 2), 'chef_detail': result(21.0, 5)}}) == []
+    regressions = compare_results(baseline, {'routes': {'index': result(15.0, 2), 'chef_detail': result(20.0, 9)}})
+    assert len(regressions) == 2
+    assert regressions[0].startswith('index: p95_ms')
+    assert regressions[1].startswith('chef_detail: SQL statements 5 -> 9')
+    print("Benchmark regressions detected against baseline")
+
+def test_rate_limiting():
+    """Test token-bucket login throttling per IP and per account, and /metrics"""
+    print("\nTesting rate limiting...")
+    
+    from app import rate_limit_store
+    
+    limits = dict(app.config['RATELIMITS'])
+    app.config['RATELIMITS'].update({'login_ip': '3/minute', 'login_account': '2/minute'})
+    rate_limit_store.reset()
+    try:
+        with app.test_client() as client:
+            def attempt(email, ip):
+                return client.post('/login', data={'email': email, 'password': 'wrong'},
+                                   environ_base={'REMOTE_ADDR': ip})
+            
+            assert attempt('victim@example.com', '10.0.0.1').status_code == 200
+            assert attempt('victim@example.com', '10.0.0.2').status_code == 200
+            response = attempt('victim@example.com', '10.0.0.3')  # Third try on one account, fresh IP
+            assert response.status_code == 429
+            assert int(response.headers['Retry-After']) >= 1
+            print("Per-account login limit applies across IPs")
+            
+            assert attempt('other1@example.com', '10.0.0.9').status_code == 200
+            assert attempt('other2@example.com', '10.0.0.9').status_code == 200
+            assert attempt('other3@example.com', '10.0.0.9').status_code == 200
+            assert attempt('other4@example.com', '10.0.0.9').status_code == 429
+            assert client.get('/login', environ_base={'REMOTE_ADDR': '10.0.0.9'}).status_code == 200
+            print("Per-IP login limit rejects before form handling")
+        
+        with app.app_context():
+            User.query.filter_by(email='metrics_admin@example.com').delete()
+            admin = User(email='metrics_admin@example.com', first_name='Metrics', last_name='Admin', role='admin')
+            db.session.add(admin)
+            db.session.commit()
+            admin_id = admin.id
+        with app.test_client() as client:
+            assert client.get('/metrics').status_code == 403
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(admin_id)
+            body = client.get('/metrics').get_data(as_text=True)
+            assert 'hometaste_rate_limit_requests_total{limit="login_account",outcome="rejected"}' in body
+            print("Limiter metrics exported")
+        with app.app_context():
+            User.query.filter_by(email='metrics_admin@example.com').delete()
+            db.session.commit()
+    finally:
+        app.config['RATELIMITS'] = limits
+        rate_limit_store.reset()
+
+def test_password_hashing():
+    """Test configurable hashing, rehash on login and the bounded hash queue"""
+    print("\nTesting password hashing...")
+    
+    from app import password_hasher
+    from passwords import PasswordHasher, PasswordHasherBusy, hash_password, hash_parameters
+    
+    legacy = hash_password('secret123', 'pbkdf2', 1000)
+    assert hash_parameters(legacy) == ('pbkdf2', 1000)
+    assert password_hasher.needs_rehash(legacy)
+    with app.app_context():
+        User.query.filter_by(email='rehash@example.com').delete()
+        db.session.add(User(email='rehash@example.com', first_name='Re', last_name='Hash', password_hash=legacy))
+        db.session.commit()
+    app.config['WTF_CSRF_ENABLED'] = False
+    try:
+        with app.test_client() as client:
+            response = client.post('/login', data={'email': 'rehash@example.com', 'password': 'secret123'})
+            assert response.status_code == 302
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = True
+    with app.app_context():
+        user = User.query.filter_by(email='rehash@example.com').first()
+        assert hash_parameters(user.password_hash) == (password_hasher.algorithm, password_hasher.cost)
+        assert user.check_password('secret123')
+        db.session.delete(user)
+        db.session.commit()
+    print("Outdated hash upgraded on login")
+    
+    bcrypt_hasher = PasswordHasher('bcrypt', 4)
+    hashed = bcrypt_hasher.hash('secret123')
+    assert bcrypt_hasher.verify(hashed, 'secret123') and not bcrypt_hasher.verify(hashed, 'wrong')
+    assert password_hasher.verify(hashed, 'secret123')  # Any algorithm verifies regardless of config
+    assert not bcrypt_hasher.needs_rehash(hashed)
+    print("bcrypt hashes verify")
+    
+    pooled = PasswordHasher('pbkdf2', 1000, workers=1)
+    assert pooled.verify(pooled.hash('secret123'), 'secret123')
+    print("Process pool hashing works")
+    
+    busy = PasswordHasher('pbkdf2', 1000, max_pending=1)
+    busy._slots.acquire()
+    try:
+        busy.hash('secret123')
+        assert False, "Expected PasswordHasherBusy"
+    except PasswordHasherBusy:
+        pass
+    finally:
+        busy._slots.release()
+    print("Full hash queue rejected")
+    
+    # A hash we stopped waiting for keeps its slot until the pool finishes it
+    slow = PasswordHasher('pbkdf2', 2000000, workers=1, max_pending=1, timeout=0.01)
+    for expected in ('timed out', 'queued'):
+        try:
+            slow.hash('secret123')
+            assert False, "Expected PasswordHasherBusy"
+        except PasswordHasherBusy as e:
+            assert expected in str(e)
+    slow._executor().shutdown(wait=True)
+    assert slow._slots.acquire(blocking=False)
+    slow._slots.release()
+    print("Timed-out hashes stay counted until they finish")
+
+def test_dashboard_pagination():
+    """Test keyset-paged dashboard booking lists, counts and load-more fragments"""
+    print("\nTesting dashboard pagination...")
+    
+    from datetime import date, time
+    from app import get_booking_page, get_booking_counts
+    
+    emails = ['paged_client@example.com', 'paged_chef@example.com']
+    with app.app_context():
+        for user in User.query.filter(User.email.in_(emails)).all():
+            Booking.query.filter(db.or_(Booking.client_id == user.id, Booking.chef_id == user.id)).delete()
+            ChefProfile.query.filter_by(user_id=user.id).delete()
+            db.session.delete(user)
+        db.session.commit()
+        
+        client_user = User(email=emails[0], first_name='Paged', last_name='Client', role='client')
+        chef_user = User(email=emails[1], first_name='Paged', last_name='Chef', role='chef')
+        db.session.add_all([client_user, chef_user])
+        db.session.commit()
+        db.session.add(ChefProfile(user_id=chef_user.id, base_price_per_person=50))
+        
+        # Several bookings share an event date so pages must break ties on id
+        today = date.today()
+        created = datetime.utcnow()
+        for i in range(30):
+            for status, event_date in (('confirmed', today + timedelta(days=i // 4)),
+                                       ('pending', today + timedelta(days=20)),
+                                       ('completed', today - timedelta(days=1 + i // 4))):
+                db.session.add(Booking(client_id=client_user.id, chef_id=chef_user.id, menu_id=1,
+                                       event_date=event_date, event_time=time(19, 0), guest_count=4,
+                                       location_address='123 Test Street, Burnaby', total_price=300,
+                                       service_fee=30, platform_fee=45, status=status,
+                                       created_at=created - timedelta(minutes=i // 3)))
+        db.session.add(Booking(client_id=client_user.id, chef_id=chef_user.id, menu_id=1,
+                               event_date=today - timedelta(days=3), event_time=time(19, 0), guest_count=4,
+                               location_address='123 Test Street, Burnaby', total_price=300,
+                               service_fee=30, platform_fee=45, status='confirmed'))
+        db.session.commit()
+        
+        assert get_booking_counts(client_user) == {'upcoming': 30, 'pending': 30, 'past': 30}
+        
+        for user, list_name, key in ((client_user, 'upcoming', lambda b: (b.event_date, b.id)),
+                                     (chef_user, 'pending', lambda b: (-b.created_at.timestamp(), -b.id)),
+                                     (client_user, 'past', lambda b: (-b.event_date.toordinal(), -b.id))):
+            seen, after = [], None
+            while True:
+                page, after = get_booking_page(user, list_name, after=after, limit=7)
+                assert len(page) <= 7
+                seen.extend(page)
+                if not after:
+                    break
+            assert len(seen) == 30 and len({b.id for b in seen}) == 30
+            assert [key(b) for b in seen] == sorted(key(b) for b in seen)
+        print("Keyset pages cover each list exactly once in order")
+        client_id, chef_id = client_user.id, chef_user.id
+    
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(chef_id)
+        response = client.get('/chef/dashboard')
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        assert html.count('Pending</span>') == app.config['DASHBOARD_PAGE_SIZE']
+        assert 'loadMoreBookings' in html
+        
+        response = client.get('/dashboard/bookings/pending')
+        assert response.status_code == 200
+        assert '<html' not in response.get_data(as_text=True)
+        assert client.get('/dashboard/bookings/pending?after=garbage').status_code == 400
+        assert client.get('/dashboard/bookings/everything').status_code == 404
+    
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(client_id)
+        html = client.get('/client/dashboard').get_data(as_text=True)
+        assert 'Write Review' in html and '>30</h4>' in html
+    print("Dashboards render one page with summary counts and load-more fragments")
+    
+    with app.app_context():
+        Booking.query.filter(Booking.client_id == client_id).delete()
+        ChefProfile.query.filter_by(user_id=chef_id).delete()
+        User.query.filter(User.id.in_([client_id, chef_id])).delete()
+        db.session.commit()
+
+def test_menu_catalog():
+    """Test menu management, the fixed-query catalog loader and its cache invalidation"""
+    print("\nTesting menu catalog...")
+    
+    from datetime import date
+    from decimal import Decimal
+    from sqlalchemy import event
+    from app import Menu, MenuItem, MenuPhoto, get_menu_catalog, load_menu_catalogs
+    
+    emails = ['menu_chef@example.com', 'menu_client@example.com']
+    with app.app_context():
+        for user in User.query.filter(User.email.in_(emails)).all():
+            Booking.query.filter(db.or_(Booking.client_id == user.id, Booking.chef_id == user.id)).delete()
+            for profile in ChefProfile.query.filter_by(user_id=user.id).all():
+                db.session.delete(profile)
+            db.session.delete(user)
+        db.session.commit()
+        
+        chef_user = User(email=emails[0], first_name='Menu', last_name='Chef', role='chef')
+        client_user = User(email=emails[1], first_name='Menu', last_name='Client', role='client')
+        db.session.add_all([chef_user, client_user])
+        db.session.commit()
+        chef_profile = ChefProfile(user_id=chef_user.id, base_price_per_person=50, travel_fee=0, min_guests=1, max_guests=20)
+        db.session.add(chef_profile)
+        db.session.commit()
+        chef_user_id, client_id, profile_id = chef_user.id, client_user.id, chef_profile.id
+    
+    app.config['WTF_CSRF_ENABLED'] = False
+    try:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(chef_user_id)
+            for name in ('Persian Feast', 'Tasting Menu', 'Brunch'):
+                response = client.post('/chef/menus/new', data={
+                    'name': name, 'description': f'{name} for friends', 'price_per_person': '80',
+                    'course_count': 3, 'prep_time_hours': 2, 'dietary_tags': ['halal', 'nut-free']
+                })
+                assert response.status_code == 302
+            with app.app_context():
+                menu_ids = [menu.id for menu in Menu.query.filter_by(chef_id=profile_id).order_by(Menu.id)]
+            for menu_id in menu_ids:
+                for order, (course, dish) in enumerate([('dessert', 'Saffron ice cream'), ('main', 'Tahdig'), ('appetizer', 'Kashk')][::-1]):
+                    client.post(f'/chef/menus/{menu_id}/items', data={'course_type': course, 'name': dish, 'order': order})
+            with app.app_context():
+                db.session.add_all([MenuPhoto(menu_id=menu_ids[0], photo_url='first.jpg'),
+                                    MenuPhoto(menu_id=menu_ids[0], photo_url='cover.jpg')])
+                db.session.commit()
+                cover_id = MenuPhoto.query.filter_by(photo_url='cover.jpg', menu_id=menu_ids[0]).first().id
+            assert client.post(f'/chef/menus/{menu_ids[0]}/photos/{cover_id}/primary').status_code == 302
+            
+            # Another chef cannot edit these menus
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(client_id)
+            client.post(f'/chef/menus/{menu_ids[0]}/items', data={'course_type': 'main', 'name': 'Intruder'})
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = True
+    
+    with app.app_context():
+        queries = []
+        listener = lambda *args: queries.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            catalogs = load_menu_catalogs([profile_id])
+            assert len(queries) == 3, queries
+            
+            chef_profile = db.session.get(ChefProfile, profile_id)
+            first = get_menu_catalog(chef_profile)
+            queries.clear()
+            assert get_menu_catalog(chef_profile) is first and not queries
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        
+        assert catalogs[profile_id] == first
+        assert [menu['name'] for menu in first] == ['Brunch', 'Persian Feast', 'Tasting Menu']
+        feast = next(menu for menu in first if menu['name'] == 'Persian Feast')
+        assert [item['name'] for item in feast['dishes']] == ['Kashk', 'Tahdig', 'Saffron ice cream']
+        assert feast['photo']['url'] == 'cover.jpg'
+        assert feast['dietary_tags'] == ['halal', 'nut-free']
+        assert 'Intruder' not in [item['name'] for menu in first for item in menu['dishes']]
+        print("Catalog assembled in three queries and served from cache")
+        
+        item = MenuItem.query.filter_by(menu_id=menu_ids[0], name='Tahdig').first()
+        item_id = item.id
+    
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(chef_user_id)
+        assert client.post(f'/chef/menus/{menu_ids[0]}/items/{item_id}/delete').status_code == 302
+        assert client.get('/chef/menus').status_code == 200
+        assert client.get(f'/chef/menus/{menu_ids[0]}/edit').status_code == 200
+    with app.app_context():
+        feast = next(menu for menu in get_menu_catalog(db.session.get(ChefProfile, profile_id)) if menu['id'] == menu_ids[0])
+        assert [item['name'] for item in feast['dishes']] == ['Kashk', 'Saffron ice cream']
+    print("Menu edits invalidate the cached catalog")
+    
+    with app.test_client() as client:
+        html = client.get(f'/chef/{profile_id}').get_data(as_text=True)
+        assert 'Saffron ice cream' in html and 'cover.jpg' in html
+        
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(client_id)
+        app.config['WTF_CSRF_ENABLED'] = False
+        try:
+            response = client.post(f'/chef/{profile_id}/book', data={
+                'event_date': (date.today() + timedelta(days=14)).isoformat(), 'event_time': '19:00',
+                'guest_count': 2, 'menu_id': menu_ids[1], 'location_address': '123 Test Street, Burnaby',
+                'service_type': 'cooking_only', 'occasion_type': 'dinner_party'
+            })
+        finally:
+            app.config['WTF_CSRF_ENABLED'] = True
+        assert response.status_code == 302
+    with app.app_context():
+        booking = Booking.query.filter_by(client_id=client_id).one()
+        assert booking.menu_id == menu_ids[1]
+        assert booking.total_price == Decimal('200.00')  # 2 x $80 menu + 10% service + 15% platform
+        print("Bookings record the chosen menu and its price")
+        
+        db.session.delete(booking)
+        db.session.delete(db.session.get(ChefProfile, profile_id))
+        User.query.filter(User.id.in_([chef_user_id, client_id])).delete()
+        db.session.commit()
+
+def test_chef_cards():
+    """Test the chef_card read model stays in step with profile, user and menu writes"""
+    print("\nTesting chef cards...")
+    
+    from decimal import Decimal
+    from sqlalchemy import event
+    from app import ChefCard, Menu, rebuild_chef_cards
+    
+    with app.app_context():
+        User.query.filter_by(email='card_chef@example.com').delete()
+        db.session.commit()
+        
+        chef_user = User(email='card_chef@example.com', first_name='Card', last_name='Chef', role='chef')
+        db.session.add(chef_user)
+        db.session.flush()
+        chef_profile = ChefProfile(user_id=chef_user.id, bio='Slow-cooked stews ' * 20, specialties='Persian, Stews, ,Rice',
+                                   service_areas='Metrotown', base_price_per_person=Decimal('45.00'), is_available=True)
+        db.session.add(chef_profile)
+        db.session.commit()
+        profile_id, chef_user_id = chef_profile.id, chef_user.id
+        
+        card = db.session.get(ChefCard, profile_id)
+        assert (card.first_name, card.last_name) == ('Card', 'Chef')
+        assert len(card.bio_excerpt) == 200
+        assert card.specialties == ['Persian', 'Stews', 'Rice']
+        assert card.menu_count == 0 and card.min_menu_price is None
+        
+        chef_user.first_name = 'Renamed'
+        chef_profile.rating = Decimal('4.50')
+        db.session.add_all([Menu(chef_id=profile_id, name='Stew night', price_per_person=Decimal('60.00')),
+                            Menu(chef_id=profile_id, name='Rice feast', price_per_person=Decimal('55.00'))])
+        db.session.commit()
+        db.session.expire_all()
+        card = db.session.get(ChefCard, profile_id)
+        assert card.first_name == 'Renamed' and card.rating == Decimal('4.50')
+        assert card.menu_count == 2 and card.min_menu_price == Decimal('55.00')
+        print("Cards refreshed from profile, user and menu writes")
+        
+        before = {c.id: (c.first_name, c.rating, c.menu_count) for c in ChefCard.query}
+        rebuild_chef_cards()
+        assert {c.id: (c.first_name, c.rating, c.menu_count) for c in ChefCard.query} == before
+        print("Incremental cards match a full rebuild")
+    
+    with app.test_client() as client:
+        with app.app_context():
+            statements = []
+            listener = lambda *args: statements.append(args[2].lower())
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                html = client.get('/chefs?sort=price_low').get_data(as_text=True)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        assert 'Renamed Chef' in html and '2 menus from $55.00/person' in html
+        browse_queries = [sql for sql in statements if 'chef_card' in sql]
+        assert browse_queries and not any('chef_profile' in sql for sql in browse_queries)
+        assert 'Renamed Chef' in client.get('/').get_data(as_text=True)
+    print("Browse and home pages render from chef_card alone")
+    
+    with app.app_context():
+        db.session.delete(db.session.get(User, chef_user_id))
+        db.session.commit()
+        assert db.session.get(ChefCard, profile_id) is None
+        print("Deleting the chef removes the card")
+
+def test_read_replicas():
+    """Test read-only views use a replica, writes stay on the primary and dead replicas are skipped"""
+    print("\nTesting read replica routing...")
+    
+    import tempfile
+    import time
+    from flask import g, session
+    from app import ChefCard
+    from replicas import RoutingSession
+    
+    replica_dir = tempfile.mkdtemp()
+    replica_url = f"sqlite:///{os.path.join(replica_dir, 'replica.db')}"
+    pool = RoutingSession.replicas
+    pool.configure([replica_url])
+    try:
+        with app.app_context():
+            db.metadata.create_all(pool.engines[0])
+            with pool.engines[0].begin() as conn:
+                conn.execute(db.insert(ChefCard).values(
+                    id=999999, user_id=999999, first_name='Replica', last_name='Only', bio_excerpt='', specialties=[],
+                    cuisine_types=[], service_areas=[], pricing_version=1, rating=5, total_reviews=0,
+                    offers_teaching=False, is_available=True, menu_count=0, refreshed_at=datetime.utcnow()))
+        
+        with app.test_client() as client:
+            assert 'Replica Only' in client.get('/chefs').get_data(as_text=True)
+            with client.session_transaction() as sess:
+                sess['_primary_until'] = time.time() + 60
+            assert 'Replica Only' not in client.get('/chefs').get_data(as_text=True)
+        with app.test_request_context('/'):
+            db.session.info['wrote'] = True
+            app.process_response(app.response_class())
+            assert session['_primary_until'] > time.time()
+        print("Read-only views read the replica unless the client just wrote")
+        
+        with app.test_request_context('/'):
+            g.use_replica = True
+            replica_name = lambda: db.session.execute(db.select(ChefCard.first_name).where(ChefCard.id == 999999)).scalar()
+            assert replica_name() == 'Replica'
+            User.query.filter_by(email='replica_writer@example.com').delete()
+            db.session.add(User(email='replica_writer@example.com', first_name='Replica', last_name='Writer'))
+            db.session.flush()
+            assert replica_name() is None  # Read-after-write goes to the primary
+            assert User.query.filter_by(email='replica_writer@example.com').count() == 1
+            db.session.rollback()
+        print("Reads after a write in the same request use the primary")
+        
+        pool.configure([f"sqlite:///{os.path.join(replica_dir, 'missing', 'replica.db')}"])
+        with app.test_client() as client:
+            response = client.get('/chefs')
+            assert response.status_code == 200 and 'Replica Only' not in response.get_data(as_text=True)
+        print("Unreachable replica falls back to the primary")
+    finally:
+        pool.configure([])
+
+def test_upload_storage():
+    """Test S3 storage against the mock bucket, signed direct uploads and photo URLs"""
+    print("\nTesting upload storage...")
+    
+    import io
+    import requests
+    from PIL import Image
+    import app as hometaste
+    from app import Menu, MenuPhoto
+    from mock_s3 import MockS3Server
+    from storage import S3Storage, StorageError
+    
+    def png(size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, 'PNG')
+        return buffer.getvalue()
+    
+    server = MockS3Server().start()
+    storage = S3Storage('uploads', endpoint_url=server.url, access_key='mock', secret_key='mock-secret')
+    try:
+        storage.save('menus/a b.png', io.BytesIO(b'photo'), 'image/png')
+        assert storage.exists('menus/a b.png') and storage.open('menus/a b.png').read() == b'photo'
+        assert requests.get(storage.url('menus/a b.png')).content == b'photo'
+        storage.delete('menus/a b.png')
+        assert not storage.exists('menus/a b.png')
+        forged = S3Storage('uploads', endpoint_url=server.url, access_key='mock', secret_key='wrong')
+        try:
+            forged.save('menus/forged.png', io.BytesIO(b'x'), 'image/png')
+            assert False, 'Bad signature accepted'
+        except StorageError:
+            pass
+        assert 'menus/forged.png' not in server.objects
+        print("Signed PUT/GET/DELETE work and forged signatures are refused")
+        
+        emails = ['upload_chef@example.com', 'upload_other@example.com']
+        with app.app_context():
+            for user in User.query.filter(User.email.in_(emails)).all():
+                for profile in ChefProfile.query.filter_by(user_id=user.id).all():
+                    db.session.delete(profile)
+                db.session.delete(user)
+            db.session.commit()
+            chef_user = User(email=emails[0], first_name='Upload', last_name='Chef', role='chef')
+            other_user = User(email=emails[1], first_name='Other', last_name='Chef', role='chef')
+            db.session.add_all([chef_user, other_user])
+            db.session.commit()
+            chef_profile = ChefProfile(user_id=chef_user.id, base_price_per_person=50, travel_fee=0, min_guests=1, max_guests=20)
+            db.session.add(chef_profile)
+            db.session.commit()
+            chef_user_id, other_user_id, profile_id = chef_user.id, other_user.id, chef_profile.id
+        
+        original_storage = hometaste.upload_storage
+        hometaste.upload_storage = storage
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['DIRECT_UPLOADS'] = True
+        try:
+            with app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['_user_id'] = str(chef_user_id)
+                client.post('/chef/menus/new', data={'name': 'Upload Menu', 'price_per_person': '60', 'course_count': 3, 'prep_time_hours': 2})
+                with app.app_context():
+                    menu_id = Menu.query.filter_by(chef_id=profile_id).first().id
+                
+                # Posted with the form: resized, then stored in the bucket
+                response = client.post(f'/chef/menus/{menu_id}/photos', content_type='multipart/form-data',
+                                       data={'photo': (io.BytesIO(png((1600, 1200))), 'dinner.png')})
+                assert response.status_code == 302
+                with app.app_context():
+                    posted = MenuPhoto.query.filter_by(menu_id=menu_id).one().photo_url
+                assert Image.open(io.BytesIO(server.objects[f'menus/{posted}'][0])).size == (800, 600)
+                
+                # Direct: the browser PUTs to the bucket, the form carries only the token
+                photo = png((400, 300))
+                target = client.post('/uploads/sign', json={'folder': 'menus', 'filename': 'direct.png',
+                                                            'content_type': 'image/png', 'size': len(photo)}).get_json()
+                assert target['url'].startswith(server.url)
+                assert requests.put(target['url'], data=photo + b'extra', headers=target['headers']).status_code == 403
+                assert requests.put(target['url'], data=photo, headers=target['headers']).status_code == 200
+                assert client.post('/uploads/sign', json={'folder': 'menus', 'filename': 'evil.exe',
+                                                          'content_type': 'image/png', 'size': 10}).status_code == 400
+                
+                with client.session_transaction() as sess:
+                    sess['_user_id'] = str(other_user_id)
+                client.post(f'/chef/menus/{menu_id}/photos', data={'photo_upload': target['token']})
+                with client.session_transaction() as sess:
+                    sess['_user_id'] = str(chef_user_id)
+                assert client.post(f'/chef/menus/{menu_id}/photos', data={'photo_upload': target['token']}).status_code == 302
+                
+                with app.app_context():
+                    photos = [photo.photo_url for photo in MenuPhoto.query.filter_by(menu_id=menu_id).order_by(MenuPhoto.id)]
+                assert len(photos) == 2 and server.objects[f'menus/{photos[1]}'][0] == photo
+                
+                # Direct uploads larger than the menu photo size are shrunk once the form arrives
+                photo = png((1600, 1200))
+                target = client.post('/uploads/sign', json={'folder': 'menus', 'filename': 'large.png',
+                                                            'content_type': 'image/png', 'size': len(photo)}).get_json()
+                assert requests.put(target['url'], data=photo, headers=target['headers']).status_code == 200
+                assert client.post(f'/chef/menus/{menu_id}/photos', data={'photo_upload': target['token']}).status_code == 302
+                with app.app_context():
+                    large = MenuPhoto.query.filter_by(menu_id=menu_id).order_by(MenuPhoto.id.desc()).first().photo_url
+                assert Image.open(io.BytesIO(server.objects[f'menus/{large}'][0])).size == (800, 600)
+                page = client.get(f'/chef/menus/{menu_id}/edit').get_data(as_text=True)
+                assert f'{server.url}/uploads/menus/{photos[1]}' in page
+                assert 'data-direct-upload="menus"' in page
+        finally:
+            hometaste.upload_storage = original_storage
+            app.config['WTF_CSRF_ENABLED'] = True
+            app.config['DIRECT_UPLOADS'] = False
+        print("Form and direct uploads land in the bucket and render bucket URLs")
+    finally:
+        server.stop()
+
+def test_server_sessions():
+    """Test server-side sessions keep only an id in the cookie and rotate it on login"""
+    print("\nTesting server-side sessions...")
+    
+    from app import ServerSession, ServerSideSessionInterface, DatabaseSessionStore
+    
+    with app.app_context():
+        User.query.filter_by(email='session_user@example.com').delete()
+        db.session.add(User(email='session_user@example.com', first_name='Session', last_name='User', role='client'))
+        db.session.commit()
+        user_id = User.query.filter_by(email='session_user@example.com').first().id
+    
+    cookie_interface = app.session_interface
+    app.session_interface = ServerSideSessionInterface(DatabaseSessionStore())
+    try:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['cart'] = 'tasting-menu'
+            anonymous_sid = client.get_cookie('session').value
+            assert 'tasting' not in anonymous_sid
+            
+            with client.session_transaction() as sess:
+                assert sess['cart'] == 'tasting-menu'
+                sess['_user_id'] = str(user_id)
+            sid = client.get_cookie('session').value
+            assert sid != anonymous_sid
+            with app.app_context():
+                assert db.session.get(ServerSession, anonymous_sid) is None
+                assert db.session.get(ServerSession, sid) is not None
+            assert client.get('/dashboard').status_code in (200, 302)
+            assert client.get('/dashboard/bookings/past').status_code == 200
+            
+            client.get('/logout')
+            with app.app_context():
+                assert db.session.get(ServerSession, sid) is None
+            assert client.get('/dashboard/bookings/past').status_code == 302  # Back to login
+        
+        with app.app_context():
+            db.session.add(ServerSession(id='expired', data='{}', expires_at=datetime.utcnow() - timedelta(minutes=1)))
+            db.session.commit()
+            assert app.session_interface.store.purge_expired() >= 1
+            assert db.session.get(ServerSession, 'expired') is None
+    finally:
+        app.session_interface = cookie_interface
+    print("Sessions are stored server-side, rotated on login and removed on logout")
+
+def test_gunicorn_config():
+    """Test gunicorn.conf.py sizes workers and picks the worker class from GUNICORN_MODE"""
+    print("\nTesting gunicorn config...")
+    
+    import runpy
+    
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    saved = {name: os.environ.get(name) for name in ('GUNICORN_MODE', 'WEB_CONCURRENCY', 'GUNICORN_WORKER_MEMORY_MB')}
+    try:
+        os.environ.pop('WEB_CONCURRENCY', None)
+        os.environ['GUNICORN_MODE'] = 'gthread'
+        config = runpy.run_path(config_path)
+        assert config['worker_class'] == 'gthread' and config['wsgi_app'] == 'app:app'
+        assert 1 <= config['workers'] <= 2 * config['_cpu_count']() + 1
+        assert config['threads'] == 4 and config['preload_app'] and config['max_requests_jitter'] > 0
+        
+        os.environ['GUNICORN_WORKER_MEMORY_MB'] = str(10 ** 9)  # More than any machine has
+        assert runpy.run_path(config_path)['workers'] == 1
+        os.environ['WEB_CONCURRENCY'] = '7'
+        assert runpy.run_path(config_path)['workers'] == 7
+        
+        os.environ['GUNICORN_MODE'] = 'fibers'
+        try:
+            runpy.run_path(config_path)
+            assert False, 'Unknown mode accepted'
+        except RuntimeError:
+            pass
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    print("Worker count follows CPUs, memory and WEB_CONCURRENCY")
+
+def test_warm_up():
+    """Test warm-up compiles every template and /readyz reports when it has finished"""
+    print("\nTesting warm-up and readiness...")
+    
+    import time
+    from jinja2 import TemplateSyntaxError
+    from app import warm_up, warmup_state
+    
+    saved = dict(warmup_state)
+    warmup_state.update(started=False, ready=False)
+    try:
+        with app.test_client() as client:
+            response = client.get('/readyz')
+            assert response.status_code == 503 and response.get_json()['status'] == 'warming'
+            deadline = time.monotonic() + 10
+            while client.get('/readyz').status_code != 200 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            ready = client.get('/readyz').get_json()
+        html_templates = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+        assert ready['status'] == 'ready' and ready['templates'] == len(html_templates)
+        cached = {key[1] for key in app.jinja_env.cache.keys()}
+        assert set(html_templates) <= cached
+        
+        # A failed warm-up is reported and retried by the next probe instead of leaving /readyz stuck
+        def broken_template(name, *args, **kwargs):
+            raise TemplateSyntaxError('unexpected end of template', 1, name=name)
+        
+        warmup_state.update(started=False, ready=False)
+        app.jinja_env.get_template = broken_template
+        try:
+            state = warm_up()
+            assert not state['ready'] and not state['started'] and 'TemplateSyntaxError' in state['error']
+            with app.test_client() as client:
+                response = client.get('/readyz')
+                assert response.status_code == 503 and 'TemplateSyntaxError' in response.get_json()['error']
+        finally:
+            del app.jinja_env.get_template
+        with app.test_client() as client:
+            deadline = time.monotonic() + 10
+            while client.get('/readyz').status_code != 200 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert client.get('/readyz').status_code == 200
+        assert 'error' not in warmup_state
+    finally:
+        warmup_state.update(saved)
+    print("Readiness turns 200 once every template is compiled, and retries after a failed warm-up")
+
+def test_ranking_scores():
+    """Test the stored ranking score favours well-evidenced ratings and stays in step with bookings"""
+    print("\nTesting ranking scores...")
+    
+    from datetime import date, time as dtime
+    from decimal import Decimal
+    from sqlalchemy import event
+    from app import ChefCard, complete_past_bookings, rebuild_ranking_scores, refresh_ranking_scores
+    
+    emails = ['rank_client@example.com', 'rank_one@example.com', 'rank_many@example.com']
+    
+    def clean_up():
+        for user in User.query.filter(User.email.in_(emails)).all():
+            Review.query.filter((Review.chef_id == user.id) | (Review.client_id == user.id)).delete()
+            Booking.query.filter((Booking.chef_id == user.id) | (Booking.client_id == user.id)).delete()
+            ChefCard.query.filter_by(user_id=user.id).delete()
+            ChefProfile.query.filter_by(user_id=user.id).delete()
+            db.session.delete(user)
+        db.session.commit()
+    
+    with app.app_context():
+        clean_up()
+        client, one, many = [User(email=email, first_name='Rank', last_name=str(i), role='chef' if i else 'client')
+                             for i, email in enumerate(emails)]
+        db.session.add_all([client, one, many])
+        db.session.flush()
+        profiles = [ChefProfile(user_id=chef.id, is_available=True, base_price_per_person=Decimal('40.00')) for chef in (one, many)]
+        db.session.add_all(profiles)
+        db.session.commit()
+        
+        def booking(chef, status, event_date=date(2024, 1, 1)):
+            return Booking(client_id=client.id, chef_id=chef.id, event_date=event_date, event_time=dtime(18, 0),
+                           guest_count=4, location_address='1 Test St', total_price=Decimal('100.00'),
+                           service_fee=Decimal('10.00'), platform_fee=Decimal('10.00'), status=status)
+        
+        def review(chef, rating):
+            reviewed = booking(chef, 'completed')
+            db.session.add(reviewed)
+            db.session.flush()
+            db.session.add(Review(client_id=client.id, chef_id=chef.id, booking_id=reviewed.id, rating=rating,
+                                  food_quality=rating, professionalism=rating, cleanliness=rating,
+                                  communication=rating, value_for_money=rating))
+        
+        review(one, 5)
+        for i in range(200):
+            review(many, 4 if i % 10 == 0 else 5)  # Averages 4.9
+        db.session.commit()
+        db.session.expire_all()
+        one_score, many_score = [db.session.get(ChefProfile, profile.id).ranking_score for profile in profiles]
+        assert many_score > one_score > 0
+        assert db.session.get(ChefCard, profiles[1].id).ranking_score == many_score
+        print("200 reviews at 4.9 outrank a single 5-star review")
+        
+        # A set-based transition bypasses the flush hook; the hourly job catches it
+        upcoming = booking(one, 'confirmed', event_date=date.today() + timedelta(days=1))
+        db.session.add(upcoming)
+        db.session.commit()
+        refresh_ranking_scores()
+        db.session.expire_all()
+        one_score = db.session.get(ChefProfile, profiles[0].id).ranking_score
+        complete_past_bookings(date.today() + timedelta(days=2))
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(ChefProfile, profiles[0].id).ranking_score == one_score
+        refresh_ranking_scores()
+        db.session.expire_all()
+        assert db.session.get(ChefProfile, profiles[0].id).ranking_score > one_score
+        
+        profile_ids = [profiles[0].id, profiles[1].id]
+        ranked = ChefProfile.query.filter(ChefProfile.id.in_(profile_ids))
+        scores = {profile.id: profile.ranking_score for profile in ranked}
+        rebuild_ranking_scores()
+        db.session.expire_all()
+        assert {profile.id: profile.ranking_score for profile in ranked} == scores
+        print("Incremental and nightly rescoring agree")
+        
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT * FROM chef_card WHERE is_available = 1 ORDER BY ranking_score DESC LIMIT 12"
+        )).all()
+        assert any('ix_chef_card_available_ranking' in row[-1] for row in plan)
+        assert not any('TEMP B-TREE' in row[-1] for row in plan)
+    
+    with app.test_client() as http:
+        with app.app_context():
+            statements = []
+            listener = lambda *args: statements.append(args[2].lower())
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                http.get('/chefs')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        assert any('order by chef_card.ranking_score desc' in sql for sql in statements)
+    print("Best match sorts on the ranking index")
+    
+    with app.app_context():
+        clean_up()
+
+def test_recommendations():
+    """Test the offline recommendation pipeline and the pages reading its lists"""
+    print("\nTesting recommendations...")
+    
+    import json
+    import numpy as np
+    from datetime import date, time as dtime
+    from decimal import Decimal
+    from app import ChefRecommendation, rebuild_recommendations, recommended_chefs
+    from recommendations import recommend_for_clients
+    
+    emails = ['rec_client@example.com', 'rec_persian1@example.com', 'rec_persian2@example.com', 'rec_indian@example.com']
+    with app.app_context():
+        User.query.filter(User.email.in_(emails)).delete()
+        db.session.commit()
+        client, persian1, persian2, indian = [User(email=email, first_name='Rec', last_name=email.split('@')[0][4:],
+                                                   role='chef' if i else 'client') for i, email in enumerate(emails)]
+        db.session.add_all([client, persian1, persian2, indian])
+        db.session.flush()
+        profiles = [ChefProfile(user_id=chef.id, is_available=True, base_price_per_person=Decimal('40.00'),
+                                cuisine_types=json.dumps([cuisine]))
+                    for chef, cuisine in ((persian1, 'persian'), (persian2, 'persian'), (indian, 'indian'))]
+        db.session.add_all(profiles)
+        db.session.flush()
+        
+        def reviewed_booking(chef, cuisine, rating):
+            booking = Booking(client_id=client.id, chef_id=chef.id, event_date=date(2024, 1, 1), event_time=dtime(18, 0),
+                              guest_count=4, location_address='1 Test St', total_price=Decimal('100.00'),
+                              service_fee=Decimal('10.00'), platform_fee=Decimal('10.00'), status='completed',
+                              cuisine_preference=cuisine, occasion_type='dinner_party')
+            db.session.add(booking)
+            db.session.flush()
+            db.session.add(Review(client_id=client.id, chef_id=chef.id, booking_id=booking.id, rating=rating,
+                                  food_quality=rating, professionalism=rating, cleanliness=rating,
+                                  communication=rating, value_for_money=rating))
+        
+        reviewed_booking(persian1, 'persian', 5)
+        reviewed_booking(indian, 'indian', 1)
+        db.session.commit()
+        client_id, profile_ids = client.id, [profile.id for profile in profiles]
+        
+        result = rebuild_recommendations()
+        assert result['clients'] >= 1 and result['rows_written'] > 0
+        picks = [card.id for card in recommended_chefs(f'client:{client_id}')]
+        assert profile_ids[1] in picks and profile_ids[2] not in picks  # Rated 1 star, so never recommended again
+        assert picks.index(profile_ids[0]) < picks.index(profile_ids[1])  # Also served the client's persian dinner
+        persian = [card.id for card in recommended_chefs('cuisine:persian')]
+        assert set(profile_ids[:2]) <= set(persian) and profile_ids[2] not in persian
+        print("Similar chefs recommended; disliked chefs excluded")
+    
+    rng = np.random.default_rng(0)
+    clients, chefs = rng.random((50, 8), dtype=np.float32), rng.random((30, 8), dtype=np.float32)
+    quality = rng.random(30)
+    whole = [(row, list(indices)) for row, indices, _ in recommend_for_clients(clients, chefs, quality, 5)]
+    blocked = [(row, list(indices)) for row, indices, _ in recommend_for_clients(clients, chefs, quality, 5, max_block_bytes=4 * 30 * 7)]
+    assert whole == blocked
+    print("Scoring in bounded blocks matches scoring all at once")
+    
+    with app.test_client() as http:
+        with http.session_transaction() as sess:
+            sess['_user_id'] = str(client_id)
+        assert 'Recommended for You' in http.get('/').get_data(as_text=True)
+        assert 'Chefs You Might Like' in http.get('/client/dashboard').get_data(as_text=True)
+        assert 'Top Persian Picks' in http.get('/chefs?cuisine=persian').get_data(as_text=True)
+    print("Home, dashboard and browse pages read the stored lists")
+    
+    with app.app_context():
+        ChefRecommendation.query.delete()
+        users = User.query.filter(User.email.in_(emails)).all()
+        user_ids = [user.id for user in users]
+        Review.query.filter(Review.client_id.in_(user_ids)).delete()
+        Booking.query.filter(Booking.client_id.in_(user_ids)).delete()
+        db.session.commit()
+        for user in users:
+            db.session.delete(user)
+        db.session.commit()
+
+def test_json_list_columns():
+    """Test list columns round-trip as JSON arrays, filter by element and migrate from comma-separated text"""
+    print("\nTesting JSON list columns...")
+    
+    import json
+    from app import ChefCard, Menu, migrate_json_list_columns
+    
+    with app.app_context():
+        User.query.filter_by(email='list_chef@example.com').delete()
+        chef_user = User(email='list_chef@example.com', first_name='List', last_name='Chef', role='chef')
+        db.session.add(chef_user)
+        db.session.commit()
+        chef_user_id = chef_user.id
+    
+    app.config['WTF_CSRF_ENABLED'] = False
+    try:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(chef_user_id)
+            response = client.post('/chef/profile', data={
+                'bio': 'Family recipes from Shiraz and Tehran, cooked slowly over a whole afternoon.',
+                'specialties': 'Stews, Rice, Stews', 'cuisine_types': ['persian', 'mediterranean'],
+                'experience_years': 12, 'certifications': 'ServSafe', 'service_areas': 'Metrotown, Deer Lake',
+                'base_price_per_person': '45.00', 'min_guests': 2, 'max_guests': 12
+            })
+            assert response.status_code == 302
+            assert 'Stews, Rice' in client.get('/chef/profile').get_data(as_text=True)
+            
+            persian = client.get('/chefs?cuisine=persian&location=Deer Lake').get_data(as_text=True)
+            assert 'List Chef' in persian
+            assert 'List Chef' not in client.get('/chefs?cuisine=italian').get_data(as_text=True)
+            assert 'List Chef' not in client.get('/chefs?location=Deer').get_data(as_text=True)  # Whole elements only
+            assert 'List Chef' in client.get('/chefs?location=metrotown').get_data(as_text=True)  # Any case
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = True
+    
+    with app.app_context():
+        profile = ChefProfile.query.filter_by(user_id=chef_user_id).one()
+        assert profile.specialties == ['Stews', 'Rice'] and profile.cuisine_types == ['persian', 'mediterranean']
+        assert db.session.get(ChefCard, profile.id).service_areas == ['metrotown', 'deer lake']
+        print("Profile form saves typed lists, including cuisine types; browse filters match elements")
+        
+        # Rows written before the change hold comma-separated text
+        menu = Menu(chef_id=profile.id, name='Legacy menu')
+        db.session.add(menu)
+        db.session.commit()
+        db.session.execute(db.text("UPDATE chef_profile SET specialties = 'Persian, BBQ', cuisine_types = NULL, "
+                                   "certifications = '', service_areas = 'Metrotown, BC' WHERE id = :id"), {'id': profile.id})
+        db.session.execute(db.text("UPDATE menu SET dietary_tags = 'vegetarian, halal' WHERE id = :id"), {'id': menu.id})
+        db.session.commit()
+        assert migrate_json_list_columns() >= 2
+        assert migrate_json_list_columns() == 0  # Idempotent
+        raw = db.session.execute(db.text("SELECT specialties, cuisine_types, certifications, service_areas FROM chef_profile "
+                                         "WHERE id = :id"), {'id': profile.id}).one()
+        assert [json.loads(value) for value in raw] == [['Persian', 'BBQ'], ['persian'], [], ['metrotown', 'bc']]
+        db.session.expire_all()
+        assert db.session.get(Menu, menu.id).dietary_tags == ['vegetarian', 'halal']
+        print("Migration rewrites comma-separated text as JSON arrays and backfills cuisines")
+        
+        db.session.delete(db.session.get(User, chef_user_id))
+        db.session.commit()
+
+def test_dietary_filters():
+    """Test menu dietary masks roll up to chef cards and browse filters by diet and excluded allergens"""
+    print("\nTesting dietary and allergen filters...")
+    
+    from app import ChefCard, Menu, MenuIngredient, DIETARY_BITS, dietary_criteria, rebuild_dietary_index
+    
+    with app.app_context():
+        User.query.filter(User.email.in_(['diet_chef_a@example.com', 'diet_chef_b@example.com'])).delete()
+        profile_ids = []
+        for email, first_name in [('diet_chef_a@example.com', 'Vega'), ('diet_chef_b@example.com', 'Nutty')]:
+            chef_user = User(email=email, first_name=first_name, last_name='Diet', role='chef')
+            db.session.add(chef_user)
+            db.session.flush()
+            profile = ChefProfile(user_id=chef_user.id, base_price_per_person=40, service_areas=['Deer Lake'])
+            db.session.add(profile)
+            db.session.flush()
+            profile_ids.append(profile.id)
+        vega_id, nutty_id = profile_ids
+        db.session.add_all([
+            Menu(chef_id=vega_id, name='Garden', dietary_tags='Vegan, gluten_free', ingredients=['Eggplant', 'Chickpeas']),
+            Menu(chef_id=vega_id, name='Feast', dietary_tags=['halal'], ingredients=['Lamb', 'Pistachios']),
+            Menu(chef_id=nutty_id, name='Baklava night', dietary_tags=['vegetarian', 'vegan'], ingredients=['Walnuts', 'Honey']),
+            Menu(chef_id=nutty_id, name='Secret', dietary_tags=['gluten-free'])  # No ingredients listed
+        ])
+        db.session.commit()
+        
+        garden = Menu.query.filter_by(chef_id=vega_id, name='Garden').one()
+        assert garden.dietary_tags == ['vegan', 'gluten-free']
+        assert garden.dietary_mask == DIETARY_BITS['vegan'] | DIETARY_BITS['gluten-free']
+        vega_card = db.session.get(ChefCard, vega_id)
+        assert vega_card.dietary_mask == DIETARY_BITS['vegan'] | DIETARY_BITS['gluten-free'] | DIETARY_BITS['halal']
+        terms = {term for term, in db.session.query(MenuIngredient.term).filter_by(menu_id=garden.id)}
+        assert terms == {'eggplant', 'chickpea'}
+        print("Tags are normalized into a bitmask and rolled up onto the chef card")
+        
+        def matching(tags=(), excluded=()):
+            cards = ChefCard.query.filter(ChefCard.id.in_(profile_ids), *dietary_criteria(tags, excluded))
+            return {card.id for card in cards}
+        
+        assert matching(['vegan', 'gluten-free']) == {vega_id, nutty_id}  # Nutty covers them across two menus
+        assert matching(['vegan', 'halal']) == {vega_id}
+        assert matching(excluded=['nuts']) == {vega_id}  # Nutty's only listed menu has walnuts
+        assert matching(excluded=['sesame']) == {vega_id, nutty_id}
+        assert matching(['halal'], ['nuts', 'dairy']) == {vega_id}
+        print("Diets filter with one bitwise test; allergens go through the ingredient index")
+        
+        # Editing ingredients re-indexes the menu; deleting it drops its terms
+        garden.ingredients = ['Eggplant', 'Almond butter']
+        db.session.commit()
+        assert matching(excluded=['nuts']) == set()
+        db.session.delete(garden)
+        db.session.commit()
+        assert MenuIngredient.query.filter_by(menu_id=garden.id).count() == 0
+        assert not db.session.get(ChefCard, vega_id).dietary_mask & DIETARY_BITS['vegan']
+        
+        # Rows written around the ORM are repaired by the rebuild
+        db.session.execute(db.text("UPDATE menu SET dietary_mask = 0 WHERE chef_id = :id"), {'id': nutty_id})
+        db.session.execute(db.delete(MenuIngredient))
+        db.session.commit()
+        counts = rebuild_dietary_index()
+        assert counts['menus'] >= 3 and counts['terms'] >= 4
+        assert Menu.query.filter_by(chef_id=nutty_id, name='Secret').one().dietary_mask == DIETARY_BITS['gluten-free']
+        
+        with app.test_client() as client:
+            vegan = client.get('/chefs?diet=vegan&location=Deer Lake').get_data(as_text=True)
+            assert 'Nutty Diet' in vegan and 'Vega Diet' not in vegan
+            assert 'Nutty Diet' not in client.get('/chefs?exclude=nuts&location=Deer Lake').get_data(as_text=True)
+        print("Rebuild restores masks and the index; /chefs filters by diet and allergen")
+        
+        for chef_user in User.query.filter(User.email.in_(['diet_chef_a@example.com', 'diet_chef_b@example.com'])):
+            db.session.delete(chef_user)
+        db.session.commit()
+
+def test_idempotent_submissions():
+    """Test resubmitted booking and review forms return the original result instead of writing again"""
+    print("\nTesting idempotent booking and review submissions...")
+    
+    import re
+    import app as app_module
+    from datetime import date, timedelta
+    from sqlalchemy.exc import IntegrityError
+    from app import EmailOutbox, rate_limit_store, remove_duplicate_reviews
+    
+    emails = ['retry_chef@example.com', 'retry_client@example.com']
+    with app.app_context():
+        User.query.filter(User.email.in_(emails)).delete()
+        chef_user = User(email=emails[0], first_name='Retry', last_name='Chef', role='chef')
+        client_user = User(email=emails[1], first_name='Retry', last_name='Client', role='client')
+        db.session.add_all([chef_user, client_user])
+        db.session.flush()
+        profile = ChefProfile(user_id=chef_user.id, base_price_per_person=50, travel_fee=0, min_guests=1, max_guests=20)
+        db.session.add(profile)
+        db.session.commit()
+        chef_user_id, client_id, profile_id = chef_user.id, client_user.id, profile.id
+    
+    rate_limit_store.reset()
+    booking_data = {
+        'event_date': (date.today() + timedelta(days=21)).isoformat(), 'event_time': '19:00', 'guest_count': 4,
+        'location_address': '456 Retry Avenue, Burnaby', 'service_type': 'cooking_only', 'occasion_type': 'birthday'
+    }
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(client_id)
+        keys = re.findall(r'name="idempotency_key" type="hidden" value="([^"]+)"',
+                          client.get(f'/chef/{profile_id}/book').get_data(as_text=True))
+        assert len(keys) == 1
+        
+        app.config['WTF_CSRF_ENABLED'] = False
+        real_find = app_module.find_booking_by_key
+        try:
+            first = client.post(f'/chef/{profile_id}/book', data={**booking_data, 'idempotency_key': keys[0]})
+            retry = client.post(f'/chef/{profile_id}/book', data={**booking_data, 'idempotency_key': keys[0]})
+            assert first.status_code == retry.status_code == 302
+            assert retry.headers['Location'] == first.headers['Location']
+            
+            # A copy racing past the lookup collides on the unique index and returns the winner
+            lookups = []
+            app_module.find_booking_by_key = lambda *args: real_find(*args) if lookups.append(args) or len(lookups) > 1 else None
+            raced = client.post(f'/chef/{profile_id}/book', data={**booking_data, 'idempotency_key': keys[0]})
+            assert raced.headers['Location'] == first.headers['Location'] and len(lookups) == 2
+            app_module.find_booking_by_key = real_find
+            
+            other = client.post(f'/chef/{profile_id}/book', data={**booking_data, 'idempotency_key': 'another-form'})
+            assert other.headers['Location'] != first.headers['Location']
+        finally:
+            app_module.find_booking_by_key = real_find
+            app.config['WTF_CSRF_ENABLED'] = True
+    
+    with app.app_context():
+        bookings = Booking.query.filter_by(client_id=client_id).order_by(Booking.id).all()
+        assert len(bookings) == 2 and bookings[0].idempotency_key == keys[0]
+        chef_emails = EmailOutbox.query.filter_by(to_address=emails[0], template='booking_requested').count()
+        assert chef_emails == 2
+        booking_id = bookings[0].id
+        bookings[0].status = 'completed'
+        db.session.commit()
+    print("Resubmitted booking forms redirect to the booking they made, with one email")
+    
+    review_data = {'rating': 5, 'food_quality': 5, 'professionalism': 4, 'cleanliness': 5, 'communication': 5,
+                   'value_for_money': 4, 'comment': 'Wonderful evening'}
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(client_id)
+        app.config['WTF_CSRF_ENABLED'] = False
+        try:
+            for _ in range(2):
+                response = client.post(f'/booking/{booking_id}/review', data=review_data)
+                assert response.status_code == 302 and response.headers['Location'].endswith(f'/booking/{booking_id}')
+        finally:
+            app.config['WTF_CSRF_ENABLED'] = True
+    
+    with app.app_context():
+        assert Review.query.filter_by(booking_id=booking_id).count() == 1
+        assert db.session.get(ChefProfile, profile_id).total_reviews == 1
+        db.session.add(Review(client_id=client_id, chef_id=chef_user_id, booking_id=booking_id, rating=1, food_quality=1,
+                              professionalism=1, cleanliness=1, communication=1, value_for_money=1))
+        try:
+            db.session.commit()
+            assert False, 'second review for a booking was stored'
+        except IntegrityError:
+            db.session.rollback()
+        
+        # Databases from before the unique index may hold duplicates; the migration keeps the first
+        db.session.execute(db.text('DROP INDEX uq_review_booking_id'))
+        db.session.execute(db.insert(Review).values(client_id=client_id, chef_id=chef_user_id, booking_id=booking_id,
+                                                    rating=1, food_quality=1, professionalism=1, cleanliness=1,
+                                                    communication=1, value_for_money=1))
+        db.session.commit()
+        assert remove_duplicate_reviews() == 1
+        db.session.execute(db.text('CREATE UNIQUE INDEX uq_review_booking_id ON review (booking_id)'))
+        db.session.commit()
+        profile = db.session.get(ChefProfile, profile_id)
+        assert Review.query.filter_by(booking_id=booking_id).one().rating == 5
+        assert (profile.total_reviews, profile.rating) == (1, 5)
+        print("One review per booking, enforced by a unique index and repaired by the migration")
+        
+        Review.query.filter_by(booking_id=booking_id).delete()
+        EmailOutbox.query.filter(EmailOutbox.to_address.in_(emails)).delete()
+        Booking.query.filter_by(client_id=client_id).delete()
+        db.session.delete(db.session.get(ChefProfile, profile_id))
+        User.query.filter(User.email.in_(emails)).delete()
+        db.session.commit()
+
+def test_health_endpoints():
+    """Test /healthz, the cached /readyz database check and the admin-only diagnostics"""
+    print("\nTesting health and readiness endpoints...")
+    
+    import app as app_module
+    from app import SCHEMA_VERSION, SchemaMigration, warm_up
+    
+    warm_up()
+    app_module._readiness_cache.update(checked_at=None, result=None)
+    probes = []
+    real_probe = app_module._probe_database
+    app_module._probe_database = lambda timeout: probes.append(timeout) or real_probe(timeout)
+    try:
+        with app.test_client() as client:
+            assert client.get('/healthz').get_json() == {'status': 'ok'}
+            
+            ready = client.get('/readyz')
+            assert ready.status_code == 200, ready.get_json()
+            assert ready.get_json()['schema_version'] == SCHEMA_VERSION
+            client.get('/readyz')
+            assert len(probes) == 1  # Second probe within READINESS_CACHE_SECONDS reuses the result
+            print("Readiness checks the database once per cache window")
+            
+            with app.app_context():
+                db.session.delete(db.session.get(SchemaMigration, SCHEMA_VERSION))
+                db.session.commit()
+            app_module._readiness_cache.update(checked_at=None)
+            pending = client.get('/readyz')
+            assert pending.status_code == 503 and pending.get_json()['status'] == 'migration_pending'
+            print("Unmigrated database reported as not ready")
+    finally:
+        app_module._probe_database = real_probe
+        app_module._readiness_cache.update(checked_at=None, result=None)
+        with app.app_context():
+            app_module.stamp_schema_version()
+    
+    with app.app_context():
+        User.query.filter_by(email='debug_admin@example.com').delete()
+        admin = User(email='debug_admin@example.com', first_name='Debug', last_name='Admin', role='admin')
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+    try:
+        with app.test_client() as client:
+            assert client.get('/migrate-db').status_code == 403
+            assert client.get('/admin/debug-db').status_code == 302
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(admin_id)
+            report = client.get('/admin/debug-db').get_data(as_text=True)
+            assert 'chef_profile' in report and f'Schema version: {SCHEMA_VERSION}' in report
+            assert client.get('/admin/debug-db').get_data(as_text=True).startswith(report.rsplit('Report built', 1)[0])
+            print("Diagnostics need an admin and are served from cache")
+    finally:
+        with app.app_context():
+            User.query.filter_by(email='debug_admin@example.com').delete()
+            db.session.commit()
+
 def main():
     """Run all tests"""
     print("Starting Chef Marketplace Application Tests\n")
@@ -162,6 +1880,32 @@ def main():
         test_database_creation()
         test_routes()
         test_forms()
+        test_booking_lifecycle()
+        test_messaging()
+        test_event_stream()
+        test_email_outbox()
+        test_stripe_payments()
+        test_pricing()
+        test_booking_rollups()
+        test_data_export()
+        test_seed_data()
+        test_benchmark_comparison()
+        test_rate_limiting()
+        test_password_hashing()
+        test_dashboard_pagination()
+        test_menu_catalog()
+        test_chef_cards()
+        test_read_replicas()
+        test_upload_storage()
+        test_server_sessions()
+        test_gunicorn_config()
+        test_warm_up()
+        test_health_endpoints()
+        test_ranking_scores()
+        test_recommendations()
+        test_json_list_columns()
+        test_dietary_filters()
+        test_idempotent_submissions()
         
         print("\nAll tests passed successfully!")
         print("\nThe Chef Marketplace application is ready to use!")